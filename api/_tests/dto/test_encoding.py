@@ -0,0 +1,92 @@
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import JSONResponse
+
+from api.dto.encoding import encode_movie, encode_movies, encode_movies_by_ids
+from api.dto.movie import MovieResponse, MoviesByIdsResponse
+from api.entities.movie import Movie
+
+
+def test_encode_movies_matches_json_response():
+    movies = [
+        Movie(
+            movie_id="my-id",
+            title="Amélie",
+            description="My Description",
+            release_year=2001,
+            watched=True,
+        ),
+        Movie(
+            movie_id="my-id-2",
+            title="My Movie",
+            description='Quotes " and \\ slashes',
+            release_year=1990,
+        ),
+    ]
+    expected = JSONResponse(
+        jsonable_encoder(
+            [
+                MovieResponse(
+                    id=movie.id,
+                    title=movie.title,
+                    description=movie.description,
+                    release_year=movie.release_year,
+                    watched=movie.watched,
+                )
+                for movie in movies
+            ]
+        )
+    ).body
+    assert encode_movies(movies) == expected
+    assert (
+        encode_movie(movies[0])
+        == JSONResponse(
+            {
+                "id": "my-id",
+                "title": "Amélie",
+                "description": "My Description",
+                "release_year": 2001,
+                "watched": True,
+            }
+        ).body
+    )
+
+
+def test_encode_movie_fields():
+    movie = Movie(
+        movie_id="my-id",
+        title="My Movie",
+        description="My Description",
+        release_year=1990,
+    )
+    assert encode_movie(movie, fields={"watched", "title"}) == (
+        b'{"id":"my-id","title":"My Movie","watched":false}'
+    )
+    assert encode_movies([movie], fields=set()) == b'[{"id":"my-id"}]'
+
+
+def test_encode_movies_by_ids():
+    movie = Movie(
+        movie_id="my-id",
+        title="My Movie",
+        description="My Description",
+        release_year=1990,
+    )
+    assert (
+        encode_movies_by_ids([movie], ["missing"])
+        == JSONResponse(
+            jsonable_encoder(
+                MoviesByIdsResponse(
+                    movies=[
+                        MovieResponse(
+                            id=movie.id,
+                            title=movie.title,
+                            description=movie.description,
+                            release_year=movie.release_year,
+                            watched=movie.watched,
+                        )
+                    ],
+                    missing=["missing"],
+                )
+            )
+        ).body
+    )
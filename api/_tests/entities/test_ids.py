@@ -0,0 +1,40 @@
+import uuid
+
+from api.entities.ids import Uuid7Generator, uuid7_bounds
+
+
+class FakeClock:
+    def __init__(self):
+        self.now_ns = 1_700_000_000_000 * 1_000_000
+
+    def __call__(self):
+        return self.now_ns
+
+
+def test_uuid7_is_monotonic():
+    clock = FakeClock()
+    generator = Uuid7Generator(clock=clock)
+    ids = [generator() for _ in range(5000)]
+    # Clock going backwards must not break the ordering
+    clock.now_ns -= 10_000_000
+    ids.extend(generator() for _ in range(10))
+    assert ids == sorted(ids)
+    assert len(set(ids)) == len(ids)
+    assert all(uuid.UUID(movie_id).version == 7 for movie_id in ids)
+
+
+def test_uuid7_bounds():
+    clock = FakeClock()
+    generator = Uuid7Generator(clock=clock)
+    movie_id = generator()
+    low, high = uuid7_bounds(1_700_000_000_000, 1_700_000_000_000)
+    assert low <= movie_id <= high
+    low, high = uuid7_bounds(1_700_000_000_001, None)
+    assert movie_id < low and high is None
+
+
+def test_uuid7_bounds_clamped():
+    low, high = uuid7_bounds(-1, 1 << 48)
+    assert (low, high) == uuid7_bounds(0, (1 << 48) - 1)
+    assert low == "00000000-0000-7000-8000-000000000000"
+    assert high == "ffffffff-ffff-7fff-bfff-ffffffffffff"
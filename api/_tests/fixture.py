@@ -5,11 +5,28 @@ import pytest
 from starlette.testclient import TestClient
 
 from api.api import create_app
+from api.entities.movie import Movie
 from api.repository.movie.memory import MemoryMovieRepository
 from api.repository.movie.mongo import MongoMovieRepository
+from api.repository.movie.sqlite import SqliteMovieRepository
 from api.settings import Settings, settings_instance
 
 
+def make_movie(movie_id: str, **fields) -> Movie:
+    """
+    Movie with default fields, overridden by the given ones
+    """
+    return Movie(
+        movie_id=movie_id,
+        **{
+            "title": "My Movie",
+            "description": "My Description",
+            "release_year": 1990,
+            **fields,
+        },
+    )
+
+
 @pytest.fixture()
 def test_client():
     settings: Settings = settings_instance()
@@ -32,3 +49,18 @@ def mongo_movie_repo_fixture():
     loop = asyncio.get_event_loop()
     # noinspection PyProtectedMember
     loop.run_until_complete(repo._client.drop_database(random_database_name))
+
+
+@pytest.fixture()
+def sqlite_movie_repo_fixture(tmp_path):
+    repo = SqliteMovieRepository(str(tmp_path / "movies.db"))
+    yield repo
+    asyncio.run(repo.close())
+
+
+@pytest.fixture(params=["mongo", "sqlite"])
+def movie_repo_fixture(request):
+    """
+    Every backend which has to behave the same, in turn
+    """
+    return request.getfixturevalue(f"{request.param}_movie_repo_fixture")
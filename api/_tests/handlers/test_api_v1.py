@@ -1,11 +1,15 @@
 import functools
+import json
 
 import pytest
 
 # noinspection PyUnresolvedReferences
 from api._tests.fixture import test_client
+from api.entities.ids import Uuid7Generator
 from api.entities.movie import Movie
-from api.handlers.movie_v1 import movie_repository
+from api.handlers.movie_v1 import (encode_cursor, movie_id_generator,
+                                   movie_repository)
+from api.repository.movie.abstractions import MovieFilter
 from api.repository.movie.memory import MemoryMovieRepository
 
 
@@ -527,3 +531,487 @@ async def test_delete_movie(test_client):
     result = test_client.delete(f"/api/v1/movies/{movie_id}")
     assert result.status_code == 204
     assert await repo.get_by_id(movie_id=movie_id) is None
+
+
+@pytest.mark.asyncio
+async def test_filter_movies(test_client):
+    repo = MemoryMovieRepository()
+    patched_dependency = functools.partial(memory_repository_dependency, repo)
+    test_client.app.dependency_overrides[movie_repository] = patched_dependency
+    for movie_id, release_year, watched in [
+        ("test-id-1", 1985, False),
+        ("test-id-2", 1992, False),
+        ("test-id-3", 1995, True),
+        ("test-id-4", 1999, False),
+    ]:
+        await repo.create(
+            Movie(
+                movie_id=movie_id,
+                title="My Movie",
+                description="My Description",
+                release_year=release_year,
+                watched=watched,
+            )
+        )
+    result = test_client.get(
+        "/api/v1/movies/filter?min_release_year=1990&max_release_year=2000"
+        "&watched=false&sort=-release_year",
+        auth=("Bruce", "basic"),
+    )
+    assert result.status_code == 200
+    assert [movie["id"] for movie in result.json()] == ["test-id-4", "test-id-2"]
+
+
+@pytest.mark.parametrize(
+    "fields",
+    [
+        pytest.param("", id="all-fields"),
+        pytest.param("&fields=release_year", id="without-title"),
+    ],
+)
+@pytest.mark.asyncio
+async def test_get_movies_by_title_cursor(test_client, fields):
+    repo = MemoryMovieRepository()
+    patched_dependency = functools.partial(memory_repository_dependency, repo)
+    test_client.app.dependency_overrides[movie_repository] = patched_dependency
+    for index in range(5):
+        await repo.create(
+            Movie(
+                movie_id=f"my-id-{index}",
+                title="My Movie",
+                description="My Description",
+                release_year=1990,
+            )
+        )
+    seen = []
+    url = f"/api/v1/movies/?title=My Movie&limit=2{fields}"
+    cursor = None
+    while True:
+        result = test_client.get(
+            url if cursor is None else f"{url}&cursor={cursor}",
+            auth=("Bruce", "basic"),
+        )
+        assert result.status_code == 200
+        seen.extend(movie["id"] for movie in result.json())
+        cursor = result.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    assert seen == [f"my-id-{index}" for index in range(5)]
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        pytest.param("not-a-cursor", id="malformed"),
+        pytest.param(encode_cursor("-id", ("m1", "m1")), id="other-sort"),
+        pytest.param(encode_cursor("release_year", ("x", "m1")), id="year-type"),
+        pytest.param(encode_cursor("release_year", (True, "m1")), id="year-bool"),
+        pytest.param(
+            encode_cursor("release_year", ({"$ne": None}, "m1")), id="operator"
+        ),
+        pytest.param(encode_cursor("release_year", (1990, 1)), id="id-type"),
+    ],
+)
+@pytest.mark.asyncio
+async def test_filter_movies_invalid_cursor(test_client, cursor):
+    repo = MemoryMovieRepository()
+    patched_dependency = functools.partial(memory_repository_dependency, repo)
+    test_client.app.dependency_overrides[movie_repository] = patched_dependency
+    await repo.create(
+        Movie(
+            movie_id="m1",
+            title="My Movie",
+            description="My Description",
+            release_year=1990,
+        )
+    )
+    result = test_client.get(
+        f"/api/v1/movies/filter?cursor={cursor}", auth=("Bruce", "basic")
+    )
+    assert result.status_code == 400
+    assert result.json() == {"detail": "invalid_cursor"}
+
+
+@pytest.mark.asyncio
+async def test_get_movies_by_title_invalid_cursor(test_client):
+    repo = MemoryMovieRepository()
+    patched_dependency = functools.partial(memory_repository_dependency, repo)
+    test_client.app.dependency_overrides[movie_repository] = patched_dependency
+    cursor = encode_cursor("title", (1990, "m1"))
+    result = test_client.get(
+        f"/api/v1/movies/?title=My%20Movie&cursor={cursor}", auth=("Bruce", "basic")
+    )
+    assert result.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_get_movies_by_title_ndjson(test_client):
+    repo = MemoryMovieRepository()
+    patched_dependency = functools.partial(memory_repository_dependency, repo)
+    test_client.app.dependency_overrides[movie_repository] = patched_dependency
+    for index in range(3):
+        await repo.create(
+            Movie(
+                movie_id=f"my-id-{index}",
+                title="My Movie",
+                description="My Description",
+                release_year=1990,
+            )
+        )
+    result = test_client.get(
+        "/api/v1/movies/?title=My Movie",
+        headers={"Accept": "application/x-ndjson"},
+        auth=("Bruce", "basic"),
+    )
+    assert result.status_code == 200
+    assert result.headers["content-type"] == "application/x-ndjson"
+    lines = result.text.splitlines()
+    assert [json.loads(line)["id"] for line in lines] == [
+        "my-id-0",
+        "my-id-1",
+        "my-id-2",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_bulk_movies(test_client):
+    repo = MemoryMovieRepository()
+    patched_dependency = functools.partial(memory_repository_dependency, repo)
+    test_client.app.dependency_overrides[movie_repository] = patched_dependency
+    await repo.create(
+        Movie(
+            movie_id="test-id",
+            title="My Movie",
+            description="My Description",
+            release_year=1990,
+        )
+    )
+    result = test_client.post(
+        "/api/v1/movies/bulk",
+        json={
+            "create": [
+                {
+                    "title": "Other Movie",
+                    "description": "Test",
+                    "release_year": 2000,
+                }
+            ],
+            "update": [
+                {"id": "test-id", "watched": True},
+                {"id": "missing", "watched": True},
+            ],
+            "delete": ["test-id"],
+        },
+        auth=("Bruce", "basic"),
+    )
+    assert result.status_code == 200
+    body = result.json()
+    created_id = body["create"][0]["id"]
+    assert body["create"] == [{"id": created_id, "success": True, "message": None}]
+    assert body["update"] == [
+        {"id": "test-id", "success": True, "message": None},
+        {"id": "missing", "success": False, "message": "Movie: missing not found"},
+    ]
+    assert body["delete"] == [{"id": "test-id", "success": True, "message": None}]
+    assert await repo.get_by_id(created_id) is not None
+    assert await repo.get_by_id("test-id") is None
+
+
+@pytest.mark.asyncio
+async def test_get_movie_by_id_not_modified(test_client):
+    repo = MemoryMovieRepository()
+    patched_dependency = functools.partial(memory_repository_dependency, repo)
+    test_client.app.dependency_overrides[movie_repository] = patched_dependency
+    await repo.create(
+        Movie(
+            movie_id="test-id",
+            title="My Movie",
+            description="My Description",
+            release_year=1990,
+        )
+    )
+    result = test_client.get("/api/v1/movies/test-id", auth=("Bruce", "basic"))
+    etag = result.headers["ETag"]
+    result = test_client.get(
+        "/api/v1/movies/test-id",
+        headers={"If-None-Match": etag},
+        auth=("Bruce", "basic"),
+    )
+    assert result.status_code == 304
+    assert result.content == b""
+    await repo.update("test-id", {"watched": True})
+    result = test_client.get(
+        "/api/v1/movies/test-id",
+        headers={"If-None-Match": etag},
+        auth=("Bruce", "basic"),
+    )
+    assert result.status_code == 200
+    assert result.headers["ETag"] != etag
+
+
+@pytest.mark.asyncio
+async def test_get_movies_by_title_not_modified(test_client):
+    repo = MemoryMovieRepository()
+    patched_dependency = functools.partial(memory_repository_dependency, repo)
+    test_client.app.dependency_overrides[movie_repository] = patched_dependency
+    await repo.create(
+        Movie(
+            movie_id="test-id",
+            title="My Movie",
+            description="My Description",
+            release_year=1990,
+        )
+    )
+    result = test_client.get("/api/v1/movies/?title=My Movie", auth=("Bruce", "basic"))
+    result = test_client.get(
+        "/api/v1/movies/?title=My Movie",
+        headers={"If-None-Match": result.headers["ETag"]},
+        auth=("Bruce", "basic"),
+    )
+    assert result.status_code == 304
+
+
+@pytest.mark.parametrize(
+    "if_match,expected_status_code",
+    [
+        pytest.param('"1"', 200, id="current-version"),
+        pytest.param("*", 200, id="any-version"),
+        pytest.param('"2"', 412, id="stale-version"),
+        pytest.param("1", 412, id="malformed"),
+    ],
+)
+@pytest.mark.asyncio
+async def test_patch_update_movie_if_match(test_client, if_match, expected_status_code):
+    repo = MemoryMovieRepository()
+    patched_dependency = functools.partial(memory_repository_dependency, repo)
+    test_client.app.dependency_overrides[movie_repository] = patched_dependency
+    await repo.create(
+        Movie(
+            movie_id="test-id",
+            title="My Movie",
+            description="My Description",
+            release_year=1990,
+        )
+    )
+    result = test_client.patch(
+        "/api/v1/movies/test-id",
+        json={"watched": True},
+        headers={"If-Match": if_match},
+        auth=("Bruce", "basic"),
+    )
+    assert result.status_code == expected_status_code
+    assert (await repo.get_by_id("test-id")).watched is (expected_status_code == 200)
+
+
+@pytest.mark.parametrize(
+    "path,expected_result",
+    [
+        pytest.param(
+            "/api/v1/movies/test-id?fields=title,release_year",
+            {"id": "test-id", "title": "My Movie", "release_year": 1990},
+            id="by-id",
+        ),
+        pytest.param(
+            "/api/v1/movies/?title=My Movie&fields=id,watched",
+            [{"id": "test-id", "watched": False}],
+            id="by-title",
+        ),
+        pytest.param(
+            "/api/v1/movies/filter?sort=-release_year&fields=description",
+            [{"id": "test-id", "description": "My Description"}],
+            id="filter",
+        ),
+    ],
+)
+@pytest.mark.asyncio
+async def test_sparse_fields(test_client, path, expected_result):
+    repo = MemoryMovieRepository()
+    patched_dependency = functools.partial(memory_repository_dependency, repo)
+    test_client.app.dependency_overrides[movie_repository] = patched_dependency
+    await repo.create(
+        Movie(
+            movie_id="test-id",
+            title="My Movie",
+            description="My Description",
+            release_year=1990,
+        )
+    )
+    result = test_client.get(path, auth=("Bruce", "basic"))
+    assert result.status_code == 200
+    assert result.json() == expected_result
+
+
+def test_sparse_fields_unknown_field(test_client):
+    result = test_client.get(
+        "/api/v1/movies/test-id?fields=title,rating", auth=("Bruce", "basic")
+    )
+    assert result.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_get_movies_by_ids(test_client):
+    repo = MemoryMovieRepository()
+    patched_dependency = functools.partial(memory_repository_dependency, repo)
+    test_client.app.dependency_overrides[movie_repository] = patched_dependency
+    for movie_id in ("a", "b"):
+        await repo.create(
+            Movie(
+                movie_id=movie_id,
+                title="My Movie",
+                description="My Description",
+                release_year=1990,
+            )
+        )
+    result = test_client.post(
+        "/api/v1/movies/lookup",
+        json={"ids": ["b", "missing", "a", "b"]},
+        auth=("Bruce", "basic"),
+    )
+    assert result.status_code == 200
+    assert [movie["id"] for movie in result.json()["movies"]] == ["b", "a"]
+    assert result.json()["missing"] == ["missing"]
+
+
+def test_get_movies_by_ids_too_many(test_client):
+    result = test_client.post(
+        "/api/v1/movies/lookup",
+        json={"ids": [str(index) for index in range(1001)]},
+        auth=("Bruce", "basic"),
+    )
+    assert result.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_recently_added(test_client):
+    repo = MemoryMovieRepository()
+    patched_dependency = functools.partial(memory_repository_dependency, repo)
+    test_client.app.dependency_overrides[movie_repository] = patched_dependency
+    generator = Uuid7Generator()
+    test_client.app.dependency_overrides[movie_id_generator] = lambda: generator
+    created = [
+        test_client.post(
+            "/api/v1/movies/",
+            json={"title": title, "description": "Test", "release_year": 2000},
+            auth=("Bruce", "basic"),
+        ).json()["id"]
+        for title in ("First", "Second", "Third")
+    ]
+    result = test_client.get(
+        "/api/v1/movies/filter?sort=-id&limit=2", auth=("Bruce", "basic")
+    )
+    assert [movie["title"] for movie in result.json()] == ["Third", "Second"]
+    result = test_client.get(
+        "/api/v1/movies/filter?sort=-id",
+        params={"cursor": result.headers["X-Next-Cursor"]},
+        auth=("Bruce", "basic"),
+    )
+    assert [movie["id"] for movie in result.json()] == created[:1]
+    result = test_client.get(
+        "/api/v1/movies/filter?added_before=2000-01-01T00:00:00Z",
+        auth=("Bruce", "basic"),
+    )
+    assert result.json() == []
+    result = test_client.get(
+        "/api/v1/movies/filter?added_after=1960-01-01T00:00:00Z&sort=-id",
+        auth=("Bruce", "basic"),
+    )
+    assert result.status_code == 200
+    assert len(result.json()) == len(created)
+
+
+@pytest.mark.asyncio
+async def test_search_movies(test_client):
+    repo = MemoryMovieRepository()
+    patched_dependency = functools.partial(memory_repository_dependency, repo)
+    test_client.app.dependency_overrides[movie_repository] = patched_dependency
+    await repo.create(
+        Movie(
+            movie_id="test-id",
+            title="The Godfather Part II",
+            description="My Description",
+            release_year=1974,
+        )
+    )
+    result = test_client.get(
+        "/api/v1/movies/search?q=godfather", auth=("Bruce", "basic")
+    )
+    assert result.status_code == 200
+    assert [movie["id"] for movie in result.json()] == ["test-id"]
+    result = test_client.get(
+        "/api/v1/movies/search?q=casablanca", auth=("Bruce", "basic")
+    )
+    assert result.json() == []
+
+
+@pytest.mark.asyncio
+async def test_autocomplete_titles(test_client):
+    repo = MemoryMovieRepository()
+    patched_dependency = functools.partial(memory_repository_dependency, repo)
+    test_client.app.dependency_overrides[movie_repository] = patched_dependency
+    await repo.create(
+        Movie(
+            movie_id="test-id",
+            title="Amélie",
+            description="My Description",
+            release_year=2001,
+        )
+    )
+    result = test_client.get(
+        "/api/v1/movies/autocomplete?prefix=AME", auth=("Bruce", "basic")
+    )
+    assert result.status_code == 200
+    assert result.json() == ["Amélie"]
+
+
+@pytest.mark.asyncio
+async def test_get_movies_by_title_normalized(test_client):
+    repo = MemoryMovieRepository()
+    patched_dependency = functools.partial(memory_repository_dependency, repo)
+    test_client.app.dependency_overrides[movie_repository] = patched_dependency
+    await repo.create(
+        Movie(
+            movie_id="test-id",
+            title="Amélie",
+            description="My Description",
+            release_year=2001,
+        )
+    )
+    result = test_client.get(
+        "/api/v1/movies/?title=amelie&match=normalized", auth=("Bruce", "basic")
+    )
+    assert [movie["id"] for movie in result.json()] == ["test-id"]
+    result = test_client.get("/api/v1/movies/?title=amelie", auth=("Bruce", "basic"))
+    assert result.json() == []
+
+
+@pytest.mark.asyncio
+async def test_patch_update_movies(test_client):
+    repo = MemoryMovieRepository()
+    patched_dependency = functools.partial(memory_repository_dependency, repo)
+    test_client.app.dependency_overrides[movie_repository] = patched_dependency
+    for movie_id, title in [
+        ("test-id-1", "My Movie"),
+        ("test-id-2", "My Movie"),
+        ("test-id-3", "Other Movie"),
+    ]:
+        await repo.create(
+            Movie(
+                movie_id=movie_id,
+                title=title,
+                description="My Description",
+                release_year=1990,
+            )
+        )
+    result = test_client.patch(
+        "/api/v1/movies/filter?title=My%20Movie",
+        json={"watched": True},
+        auth=("Bruce", "basic"),
+    )
+    assert result.status_code == 200
+    assert result.json() == {"matched": 2, "modified": 2}
+    movies = await repo.find(MovieFilter(watched=True))
+    assert [movie.id for movie in movies] == ["test-id-1", "test-id-2"]
+    result = test_client.patch(
+        "/api/v1/movies/filter", json={"watched": True}, auth=("Bruce", "basic")
+    )
+    assert result.status_code == 400
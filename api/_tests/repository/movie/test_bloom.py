@@ -0,0 +1,64 @@
+import pytest
+
+from api._tests.fixture import make_movie
+from api.repository.movie.bloom import (BloomFilterMovieRepository,
+                                        CountingBloomFilter)
+from api.repository.movie.memory import MemoryMovieRepository
+
+
+class CountingMovieRepository(MemoryMovieRepository):
+    def __init__(self):
+        super().__init__()
+        self.lookups = []
+
+    async def get_by_id(self, movie_id, fields=None):
+        self.lookups.append(movie_id)
+        return await super().get_by_id(movie_id, fields=fields)
+
+    async def get_many(self, movie_ids):
+        self.lookups.extend(movie_ids)
+        return await super().get_many(movie_ids)
+
+
+def test_counting_bloom_filter():
+    bloom_filter = CountingBloomFilter(capacity=1000, error_rate=0.01)
+    for index in range(1000):
+        bloom_filter.add(f"id-{index}")
+    assert all(f"id-{index}" in bloom_filter for index in range(1000))
+    false_positives = sum(f"other-{index}" in bloom_filter for index in range(10000))
+    assert false_positives < 300
+    assert 0.005 < bloom_filter.estimated_false_positive_rate < 0.02
+    for index in range(1000):
+        bloom_filter.remove(f"id-{index}")
+    assert len(bloom_filter) == 0
+    assert "id-0" not in bloom_filter
+
+
+@pytest.mark.asyncio
+async def test_unknown_ids_skip_repository():
+    backend = CountingMovieRepository()
+    await backend.create(make_movie("existing"))
+    repo = BloomFilterMovieRepository(backend, capacity=100)
+    # Not built yet, so everything is looked up
+    assert await repo.get_by_id("missing") is None
+    assert backend.lookups == ["missing"]
+    await repo.initialize()
+    backend.lookups.clear()
+    assert await repo.get_by_id("missing") is None
+    assert (await repo.get_by_id("existing")).id == "existing"
+    assert list(await repo.get_many(["missing", "existing"])) == ["existing"]
+    assert backend.lookups == ["existing", "existing"]
+
+
+@pytest.mark.asyncio
+async def test_writes_maintain_filter():
+    backend = CountingMovieRepository()
+    repo = BloomFilterMovieRepository(backend, capacity=100)
+    await repo.initialize()
+    await repo.create(make_movie("new"))
+    assert (await repo.get_by_id("new")).id == "new"
+    assert await repo.delete("new") is True
+    assert await repo.delete("new") is False
+    backend.lookups.clear()
+    assert await repo.get_by_id("new") is None
+    assert backend.lookups == []
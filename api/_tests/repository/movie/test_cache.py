@@ -0,0 +1,133 @@
+import pytest
+
+from api.entities.movie import Movie
+from api.repository.movie.abstractions import MovieFilter, TitleMatch
+from api.repository.movie.cache import CachingMovieRepository, LruTtlCache
+from api.repository.movie.memory import MemoryMovieRepository
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+async def _seeded_repository(**kwargs):
+    backend = MemoryMovieRepository()
+    await backend.create(
+        Movie(
+            movie_id="my-id",
+            title="My Movie",
+            description="My Description",
+            release_year=1990,
+        )
+    )
+    return backend, CachingMovieRepository(backend, **kwargs)
+
+
+def test_lru_ttl_cache_eviction_and_expiry():
+    clock = FakeClock()
+    evicted = []
+    cache = LruTtlCache(max_size=2, clock=clock, on_evict=evicted.append)
+    cache.set("a", 1, ttl=10)
+    cache.set("b", 2, ttl=10)
+    assert cache.get("a") == 1
+    cache.set("c", 3, ttl=10)
+    assert evicted == ["b"]
+    assert cache.get("b") is None
+    clock.now = 11
+    assert cache.get("a") is None
+    assert len(cache) == 1
+
+
+@pytest.mark.asyncio
+async def test_get_by_id_hit_and_miss():
+    backend, repo = await _seeded_repository()
+    assert (await repo.get_by_id("my-id")).id == "my-id"
+    await backend.delete("my-id")
+    # Served from the cache even though the backend changed behind its back
+    assert (await repo.get_by_id("my-id")).id == "my-id"
+    assert repo.stats == {"hits": 1, "misses": 1}
+
+
+@pytest.mark.asyncio
+async def test_negative_caching_expires():
+    clock = FakeClock()
+    backend, repo = await _seeded_repository(negative_ttl=5, clock=clock)
+    assert await repo.get_by_id("missing") is None
+    await backend.create(
+        Movie(
+            movie_id="missing",
+            title="My Movie",
+            description="My Description",
+            release_year=1990,
+        )
+    )
+    assert await repo.get_by_id("missing") is None
+    clock.now = 6
+    assert (await repo.get_by_id("missing")).id == "missing"
+
+
+@pytest.mark.asyncio
+async def test_writes_invalidate():
+    _, repo = await _seeded_repository()
+    assert len(await repo.get_by_title("My Movie")) == 1
+    assert await repo.get_by_id("other-id") is None
+    await repo.create(
+        Movie(
+            movie_id="other-id",
+            title="My Movie",
+            description="My Description",
+            release_year=1990,
+        )
+    )
+    assert len(await repo.get_by_title("My Movie")) == 2
+    assert (await repo.get_by_id("other-id")).id == "other-id"
+    await repo.update("my-id", {"title": "New Title"})
+    assert [movie.id for movie in await repo.get_by_title("My Movie")] == ["other-id"]
+    assert len(await repo.get_by_title("New Title")) == 1
+    await repo.delete("other-id")
+    assert await repo.get_by_title("My Movie") == []
+    assert await repo.get_by_id("other-id") is None
+
+
+@pytest.mark.asyncio
+async def test_warm_up_and_hottest():
+    backend, repo = await _seeded_repository()
+    await repo.warm_up(["my-id", "missing"])
+    assert repo.hottest(10) == ["my-id"]
+    await backend.delete("my-id")
+    assert (await repo.get_by_id("my-id")).id == "my-id"
+    assert repo.stats["hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_get_by_id_fields_projects_cached_movie():
+    backend, repo = await _seeded_repository()
+    # Partial movies are not cached
+    assert (await repo.get_by_id("my-id", fields=["title"])).description is None
+    assert (await repo.get_by_id("my-id")).description == "My Description"
+    await backend.delete("my-id")
+    movie = await repo.get_by_id("my-id", fields=["title"])
+    assert (movie.title, movie.description) == ("My Movie", None)
+    assert repo.stats == {"hits": 1, "misses": 2}
+
+
+@pytest.mark.asyncio
+async def test_normalized_title_query_invalidated():
+    _, repo = await _seeded_repository()
+    assert len(await repo.get_by_title("MY  movie", match=TitleMatch.NORMALIZED)) == 1
+    await repo.update("my-id", {"title": "Other"})
+    assert await repo.get_by_title("my movie", match=TitleMatch.NORMALIZED) == []
+
+
+@pytest.mark.asyncio
+async def test_update_many_invalidates_everything():
+    _, repo = await _seeded_repository()
+    assert len(await repo.get_by_title("My Movie")) == 1
+    assert not (await repo.get_by_id("my-id")).watched
+    await repo.update_many(MovieFilter(title="My Movie"), {"watched": True})
+    assert (await repo.get_by_id("my-id")).watched
+    assert (await repo.get_by_title("My Movie"))[0].watched
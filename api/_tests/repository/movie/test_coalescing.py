@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+
+from api.entities.movie import Movie
+from api.repository.movie.coalescing import CoalescingMovieRepository
+from api.repository.movie.memory import MemoryMovieRepository
+
+
+class CountingMovieRepository(MemoryMovieRepository):
+    def __init__(self):
+        super().__init__()
+        self.get_many_calls = []
+        self.get_by_title_calls = 0
+
+    async def get_many(self, movie_ids):
+        self.get_many_calls.append(sorted(movie_ids))
+        await asyncio.sleep(0)
+        return await super().get_many(movie_ids)
+
+    async def get_by_title(self, title, skip=0, limit=1000, after=None, **kwargs):
+        self.get_by_title_calls += 1
+        await asyncio.sleep(0)
+        return await super().get_by_title(
+            title, skip=skip, limit=limit, after=after, **kwargs
+        )
+
+
+async def _seeded_repository():
+    backend = CountingMovieRepository()
+    for index in range(3):
+        await backend.create(
+            Movie(
+                movie_id=f"my-id-{index}",
+                title="My Movie",
+                description="My Description",
+                release_year=1990,
+            )
+        )
+    return backend
+
+
+@pytest.mark.asyncio
+async def test_get_by_id_batches_concurrent_calls():
+    backend = await _seeded_repository()
+    repo = CoalescingMovieRepository(backend)
+    results = await asyncio.gather(
+        repo.get_by_id("my-id-0"),
+        repo.get_by_id("my-id-1"),
+        repo.get_by_id("my-id-0"),
+        repo.get_by_id("missing"),
+    )
+    assert [movie.id if movie else None for movie in results] == [
+        "my-id-0",
+        "my-id-1",
+        "my-id-0",
+        None,
+    ]
+    assert backend.get_many_calls == [["missing", "my-id-0", "my-id-1"]]
+
+
+@pytest.mark.asyncio
+async def test_get_by_id_max_batch_size():
+    backend = await _seeded_repository()
+    repo = CoalescingMovieRepository(backend, max_batch_size=2)
+    await asyncio.gather(*(repo.get_by_id(f"my-id-{index}") for index in range(3)))
+    assert len(backend.get_many_calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_get_by_title_shares_in_flight_query():
+    backend = await _seeded_repository()
+    repo = CoalescingMovieRepository(backend)
+    first, second = await asyncio.gather(
+        repo.get_by_title("My Movie"), repo.get_by_title("My Movie")
+    )
+    assert first == second
+    assert first is not second
+    assert backend.get_by_title_calls == 1
+    await repo.get_by_title("My Movie")
+    assert backend.get_by_title_calls == 2
+
+
+@pytest.mark.asyncio
+async def test_running_loads_are_referenced():
+    backend = await _seeded_repository()
+    repo = CoalescingMovieRepository(backend)
+    lookup = asyncio.ensure_future(repo.get_by_id("my-id-0"))
+    # The lookup runs, then the dispatch it scheduled
+    for _ in range(2):
+        await asyncio.sleep(0)
+    assert len(repo._loads) == 1
+    assert (await lookup).id == "my-id-0"
+    await asyncio.sleep(0)
+    assert not repo._loads
@@ -0,0 +1,66 @@
+import pytest
+
+from api._tests.fixture import make_movie
+from api.repository.movie.abstractions import MovieFilter
+from api.repository.movie.columnar import ColumnarMovieStore
+from api.repository.movie.memory import MemoryMovieRepository
+
+
+def test_store_round_trip():
+    movies = [
+        make_movie("a", title="Amélie", watched=True, version=3),
+        make_movie("b", title=None, description=None, release_year=None),
+        *[make_movie(f"id-{index}", watched=index % 3 == 0) for index in range(20)],
+    ]
+    store = ColumnarMovieStore(movies)
+    assert len(store) == len(movies)
+    assert list(store) == [movie.id for movie in movies]
+    assert list(store.values()) == movies
+    assert [movie.watched for movie in store.values()] == [
+        movie.watched for movie in movies
+    ]
+    assert store["a"].version == 3
+    assert store["b"].description is None and store["b"].release_year is None
+    assert "a" in store and "missing" not in store
+    assert store.get("missing") is None
+
+
+def test_store_deduplicates_titles_and_reuses_slots():
+    store = ColumnarMovieStore(make_movie(f"id-{index}") for index in range(10))
+    assert [title for title in store._titles if title is not None] == ["My Movie"]
+    del store["id-3"]
+    store["new"] = make_movie("new", title="Other", watched=True)
+    assert len(store._versions) == 10
+    assert store["new"] == make_movie("new", title="Other", watched=True)
+    for index in range(10):
+        store.pop(f"id-{index}", None)
+    assert store._codes == {"Other": store._title_codes[store._slots["new"]]}
+
+
+def test_store_compacts_descriptions():
+    store = ColumnarMovieStore(make_movie(f"id-{index}") for index in range(4))
+    for _ in range(10):
+        store["id-0"] = make_movie("id-0", description="Changed")
+    del store["id-1"]
+    assert len(store._arena) <= 2 * len("My Description") * 3
+    assert store["id-0"].description == "Changed"
+    assert [movie.description for movie in store.values()] == [
+        "Changed",
+        "My Description",
+        "My Description",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_memory_repository_with_columnar_store():
+    repo = MemoryMovieRepository(ColumnarMovieStore)
+    await repo.create(make_movie("a"))
+    await repo.create(make_movie("b", release_year=2001))
+    await repo.update("a", {"title": "New Title", "watched": True})
+    movie = await repo.get_by_id("a")
+    assert movie == make_movie("a", title="New Title", watched=True)
+    assert movie.version == 2
+    assert await repo.get_by_title("New Title") == [movie]
+    assert await repo.find(MovieFilter(watched=True)) == [movie]
+    assert await repo.delete("b")
+    assert await repo.get_many(["a", "b"]) == {"a": movie}
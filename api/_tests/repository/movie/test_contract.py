@@ -0,0 +1,626 @@
+import pytest
+
+# noinspection PyUnresolvedReferences
+from api._tests.fixture import (mongo_movie_repo_fixture, movie_repo_fixture,
+                                sqlite_movie_repo_fixture)
+from api.entities.movie import Movie
+from api.repository.movie.abstractions import (MovieFilter, MovieSort,
+                                               RepositoryException, TitleMatch,
+                                               VersionConflictException)
+
+
+@pytest.mark.asyncio
+async def test_create(movie_repo_fixture):
+    await movie_repo_fixture.create(
+        Movie(
+            movie_id="test",
+            title="My Movie",
+            description="My Description",
+            release_year=1990,
+            watched=True,
+        )
+    )
+    movie: Movie = await movie_repo_fixture.get_by_id("test")
+    assert movie == Movie(
+        movie_id="test",
+        title="My Movie",
+        description="My Description",
+        release_year=1990,
+        watched=True,
+    )
+    await movie_repo_fixture.delete("test")
+
+
+@pytest.mark.parametrize(
+    "initial_movies,movie_id,expected_result",
+    [
+        pytest.param([], "test-id", None, id="empty"),
+        pytest.param(
+            [
+                Movie(
+                    movie_id="my-id",
+                    title="My Movie",
+                    description="My Description",
+                    release_year=1990,
+                )
+            ],
+            "my-id",
+            Movie(
+                movie_id="my-id",
+                title="My Movie",
+                description="My Description",
+                release_year=1990,
+            ),
+            id="found",
+        ),
+    ],
+)
+@pytest.mark.asyncio
+async def test_get_by_id(movie_repo_fixture, initial_movies, movie_id, expected_result):
+    for movie in initial_movies:
+        await movie_repo_fixture.create(movie)
+    movie: Movie = await movie_repo_fixture.get_by_id(movie_id)
+    assert movie == expected_result
+
+
+@pytest.mark.parametrize(
+    "initial_movies,title,expected_result",
+    [
+        pytest.param([], "test-id", [], id="empty"),
+        pytest.param(
+            [
+                Movie(
+                    movie_id="test-id",
+                    title="My Movie",
+                    description="My Description",
+                    release_year=1990,
+                ),
+                Movie(
+                    movie_id="test-id-0",
+                    title="Other Movie",
+                    description="My Description",
+                    release_year=1990,
+                ),
+            ],
+            "My Movie",
+            [
+                Movie(
+                    movie_id="test-id",
+                    title="My Movie",
+                    description="My Description",
+                    release_year=1990,
+                )
+            ],
+            id="found-one",
+        ),
+        pytest.param(
+            [
+                Movie(
+                    movie_id="test-id-1",
+                    title="My Movie",
+                    description="My Description",
+                    release_year=1990,
+                ),
+                Movie(
+                    movie_id="test-id-2",
+                    title="My Movie",
+                    description="My Description",
+                    release_year=1990,
+                ),
+                Movie(
+                    movie_id="test-id-3",
+                    title="My Movie",
+                    description="My Description",
+                    release_year=1990,
+                ),
+                Movie(
+                    movie_id="test-id-0",
+                    title="Other Movie",
+                    description="My Description",
+                    release_year=1990,
+                ),
+            ],
+            "My Movie",
+            [
+                Movie(
+                    movie_id="test-id-1",
+                    title="My Movie",
+                    description="My Description",
+                    release_year=1990,
+                ),
+                Movie(
+                    movie_id="test-id-2",
+                    title="My Movie",
+                    description="My Description",
+                    release_year=1990,
+                ),
+                Movie(
+                    movie_id="test-id-3",
+                    title="My Movie",
+                    description="My Description",
+                    release_year=1990,
+                ),
+            ],
+            id="found-many",
+        ),
+    ],
+)
+@pytest.mark.asyncio
+async def test_get_by_title(movie_repo_fixture, initial_movies, title, expected_result):
+    for movie in initial_movies:
+        await movie_repo_fixture.create(movie)
+    movie: Movie = await movie_repo_fixture.get_by_title(title)
+    assert movie == expected_result
+
+
+@pytest.mark.parametrize(
+    "title,skip,limit,expected_result",
+    [
+        pytest.param(
+            "My Movie",
+            2,
+            1000,
+            [
+                Movie(
+                    movie_id="my-id-3",
+                    title="My Movie",
+                    description="My Description",
+                    release_year=1990,
+                ),
+                Movie(
+                    movie_id="my-id-4",
+                    title="My Movie",
+                    description="My Description",
+                    release_year=1990,
+                ),
+                Movie(
+                    movie_id="my-id-5",
+                    title="My Movie",
+                    description="My Description",
+                    release_year=1990,
+                ),
+            ],
+            id="skip",
+        ),
+        pytest.param(
+            "My Movie",
+            0,
+            3,
+            [
+                Movie(
+                    movie_id="my-id-1",
+                    title="My Movie",
+                    description="My Description",
+                    release_year=1990,
+                ),
+                Movie(
+                    movie_id="my-id-2",
+                    title="My Movie",
+                    description="My Description",
+                    release_year=1990,
+                ),
+                Movie(
+                    movie_id="my-id-3",
+                    title="My Movie",
+                    description="My Description",
+                    release_year=1990,
+                ),
+            ],
+            id="limit",
+        ),
+        pytest.param(
+            "My Movie",
+            2,
+            2,
+            [
+                Movie(
+                    movie_id="my-id-3",
+                    title="My Movie",
+                    description="My Description",
+                    release_year=1990,
+                ),
+                Movie(
+                    movie_id="my-id-4",
+                    title="My Movie",
+                    description="My Description",
+                    release_year=1990,
+                ),
+            ],
+            id="skip-and-limit",
+        ),
+    ],
+)
+@pytest.mark.asyncio
+async def test_get_by_title_pagination(
+    movie_repo_fixture, title, skip, limit, expected_result
+):
+    initial_movies = [
+        Movie(
+            movie_id="my-id-1",
+            title="My Movie",
+            description="My Description",
+            release_year=1990,
+        ),
+        Movie(
+            movie_id="my-id-2",
+            title="My Movie",
+            description="My Description",
+            release_year=1990,
+        ),
+        Movie(
+            movie_id="my-id-3",
+            title="My Movie",
+            description="My Description",
+            release_year=1990,
+        ),
+        Movie(
+            movie_id="my-id-4",
+            title="My Movie",
+            description="My Description",
+            release_year=1990,
+        ),
+        Movie(
+            movie_id="my-id-5",
+            title="My Movie",
+            description="My Description",
+            release_year=1990,
+        ),
+    ]
+    for movie in initial_movies:
+        await movie_repo_fixture.create(movie)
+    movie: Movie = await movie_repo_fixture.get_by_title(
+        title=title, skip=skip, limit=limit
+    )
+    assert movie == expected_result
+
+
+@pytest.mark.asyncio
+async def test_delete(movie_repo_fixture):
+    initial_movie = Movie(
+        movie_id="test",
+        title="My Movie",
+        description="My Description",
+        release_year=1990,
+    )
+    await movie_repo_fixture.create(initial_movie)
+    await movie_repo_fixture.delete(movie_id="test")
+    assert await movie_repo_fixture.get_by_id(movie_id="test") is None
+
+
+@pytest.mark.asyncio
+async def test_update(movie_repo_fixture):
+    initial_movie = Movie(
+        movie_id="test",
+        title="My Movie",
+        description="My Description",
+        release_year=1990,
+    )
+    await movie_repo_fixture.create(initial_movie)
+    await movie_repo_fixture.update(
+        movie_id="test",
+        params={
+            "title": "Test Title",
+            "description": "Test Description",
+            "release_year": 2000,
+            "watched": True,
+        },
+    )
+    movie: Movie = await movie_repo_fixture.get_by_id("test")
+    assert movie == Movie(
+        movie_id="test",
+        title="Test Title",
+        description="Test Description",
+        release_year=2000,
+        watched=True,
+    )
+
+
+@pytest.mark.asyncio
+async def test_update_fail(movie_repo_fixture):
+    initial_movie = Movie(
+        movie_id="test",
+        title="My Movie",
+        description="My Description",
+        release_year=1990,
+    )
+    await movie_repo_fixture.create(initial_movie)
+    with pytest.raises(RepositoryException):
+        await movie_repo_fixture.update(movie_id="my-id", params={"id": "fail"})
+
+
+@pytest.mark.asyncio
+async def test_find(movie_repo_fixture):
+    initial_movies = [
+        Movie(
+            movie_id="a",
+            title="Alpha",
+            description="My Description",
+            release_year=1985,
+        ),
+        Movie(
+            movie_id="b",
+            title="Bravo",
+            description="My Description",
+            release_year=1992,
+        ),
+        Movie(
+            movie_id="c",
+            title="Charlie",
+            description="My Description",
+            release_year=1995,
+            watched=True,
+        ),
+        Movie(
+            movie_id="d",
+            title="Delta",
+            description="My Description",
+            release_year=1999,
+        ),
+    ]
+    for movie in initial_movies:
+        await movie_repo_fixture.create(movie)
+    result = await movie_repo_fixture.find(
+        movie_filter=MovieFilter(
+            min_release_year=1990, max_release_year=2000, watched=False
+        ),
+        sort=MovieSort.RELEASE_YEAR_DESC,
+    )
+    assert [movie.id for movie in result] == ["d", "b"]
+
+
+@pytest.mark.asyncio
+async def test_get_by_title_after(movie_repo_fixture):
+    for movie_id in ["my-id-3", "my-id-1", "my-id-2"]:
+        await movie_repo_fixture.create(
+            Movie(
+                movie_id=movie_id,
+                title="My Movie",
+                description="My Description",
+                release_year=1990,
+            )
+        )
+    result = await movie_repo_fixture.get_by_title(
+        title="My Movie", limit=1, after="my-id-1"
+    )
+    assert [movie.id for movie in result] == ["my-id-2"]
+
+
+@pytest.mark.asyncio
+async def test_find_after(movie_repo_fixture):
+    for movie_id, release_year in [("a", 1990), ("b", 1990), ("c", 1980)]:
+        await movie_repo_fixture.create(
+            Movie(
+                movie_id=movie_id,
+                title="My Movie",
+                description="My Description",
+                release_year=release_year,
+            )
+        )
+    result = await movie_repo_fixture.find(
+        movie_filter=MovieFilter(),
+        sort=MovieSort.RELEASE_YEAR_DESC,
+        after=(1990, "b"),
+    )
+    assert [movie.id for movie in result] == ["a", "c"]
+
+
+@pytest.mark.asyncio
+async def test_iter_by_title(movie_repo_fixture):
+    for index in range(5):
+        await movie_repo_fixture.create(
+            Movie(
+                movie_id=f"my-id-{index}",
+                title="My Movie",
+                description="My Description",
+                release_year=1990,
+            )
+        )
+    result = [
+        movie.id
+        async for movie in movie_repo_fixture.iter_by_title(
+            title="My Movie", skip=1, limit=3, batch_size=2
+        )
+    ]
+    assert result == ["my-id-1", "my-id-2", "my-id-3"]
+
+
+@pytest.mark.asyncio
+async def test_bulk_operations(movie_repo_fixture):
+    movies = [
+        Movie(
+            movie_id=f"my-id-{index}",
+            title="My Movie",
+            description="My Description",
+            release_year=1990,
+        )
+        for index in range(3)
+    ]
+    assert await movie_repo_fixture.bulk_create(movies) == [None] * 3
+    results = await movie_repo_fixture.bulk_update(
+        [("my-id-0", {"watched": True}), ("missing", {"watched": True})]
+    )
+    assert results == [None, "Movie: missing not found"]
+    assert (await movie_repo_fixture.get_by_id("my-id-0")).watched is True
+    assert await movie_repo_fixture.bulk_delete(["my-id-1", "my-id-2"]) == [
+        None,
+        None,
+    ]
+    assert len(await movie_repo_fixture.get_by_title("My Movie")) == 1
+
+
+@pytest.mark.asyncio
+async def test_update_increments_version(movie_repo_fixture):
+    await movie_repo_fixture.create(
+        Movie(
+            movie_id="my-id",
+            title="My Movie",
+            description="My Description",
+            release_year=1990,
+        )
+    )
+    assert (await movie_repo_fixture.get_by_id("my-id")).version == 1
+    await movie_repo_fixture.update(
+        movie_id="my-id", params={"watched": True}, expected_version=1
+    )
+    assert (await movie_repo_fixture.get_by_id("my-id")).version == 2
+    with pytest.raises(VersionConflictException):
+        await movie_repo_fixture.update(
+            movie_id="my-id", params={"watched": False}, expected_version=1
+        )
+
+
+@pytest.mark.asyncio
+async def test_get_by_id_fields(movie_repo_fixture):
+    await movie_repo_fixture.create(
+        Movie(
+            movie_id="test",
+            title="My Movie",
+            description="My Description",
+            release_year=1990,
+        )
+    )
+    movie = await movie_repo_fixture.get_by_id("test", fields=["title"])
+    assert (movie.id, movie.title, movie.description, movie.version) == (
+        "test",
+        "My Movie",
+        None,
+        1,
+    )
+    await movie_repo_fixture.delete("test")
+
+
+@pytest.mark.asyncio
+async def test_iter_ids_and_delete_result(movie_repo_fixture):
+    for movie_id in ("b", "a"):
+        await movie_repo_fixture.create(
+            Movie(
+                movie_id=movie_id,
+                title="My Movie",
+                description="My Description",
+                release_year=1990,
+            )
+        )
+    assert [
+        movie_id async for movie_id in movie_repo_fixture.iter_ids(batch_size=1)
+    ] == ["a", "b"]
+    assert await movie_repo_fixture.delete("a") is True
+    assert await movie_repo_fixture.delete("a") is False
+    await movie_repo_fixture.delete("b")
+
+
+@pytest.mark.asyncio
+async def test_find_by_id_range(movie_repo_fixture):
+    for movie_id in ("a", "b", "c"):
+        await movie_repo_fixture.create(
+            Movie(
+                movie_id=movie_id,
+                title="My Movie",
+                description="My Description",
+                release_year=1990,
+            )
+        )
+    result = await movie_repo_fixture.find(
+        MovieFilter(max_id="b"), sort=MovieSort.ID_DESC
+    )
+    assert [movie.id for movie in result] == ["b", "a"]
+    result = await movie_repo_fixture.find(
+        MovieFilter(), sort=MovieSort.ID_ASC, after=("a", "a")
+    )
+    assert [movie.id for movie in result] == ["b", "c"]
+    for movie_id in ("a", "b", "c"):
+        await movie_repo_fixture.delete(movie_id)
+
+
+@pytest.mark.asyncio
+async def test_search(movie_repo_fixture):
+    await movie_repo_fixture.initialize()
+    for movie_id, title in (("a", "The Godfather"), ("b", "Casablanca")):
+        await movie_repo_fixture.create(
+            Movie(
+                movie_id=movie_id,
+                title=title,
+                description="My Description",
+                release_year=1990,
+            )
+        )
+    result = await movie_repo_fixture.search("godfather")
+    assert [movie.id for movie in result] == ["a"]
+    for movie_id in ("a", "b"):
+        await movie_repo_fixture.delete(movie_id)
+
+
+@pytest.mark.asyncio
+async def test_autocomplete(movie_repo_fixture):
+    for movie_id, title in (("a", "Amélie"), ("b", "Amélie"), ("c", "Amadeus")):
+        await movie_repo_fixture.create(
+            Movie(
+                movie_id=movie_id,
+                title=title,
+                description="My Description",
+                release_year=1990,
+            )
+        )
+    assert await movie_repo_fixture.autocomplete("AM") == ["Amadeus", "Amélie"]
+    await movie_repo_fixture.update("c", {"title": "Mozart"})
+    assert await movie_repo_fixture.autocomplete("am") == ["Amélie"]
+    for movie_id in ("a", "b", "c"):
+        await movie_repo_fixture.delete(movie_id)
+
+
+@pytest.mark.asyncio
+async def test_get_by_title_normalized(movie_repo_fixture):
+    await movie_repo_fixture.create(
+        Movie(
+            movie_id="test",
+            title="Amélie",
+            description="My Description",
+            release_year=2001,
+        )
+    )
+    result = await movie_repo_fixture.get_by_title(
+        "AMELIE", match=TitleMatch.NORMALIZED
+    )
+    assert [movie.id for movie in result] == ["test"]
+    await movie_repo_fixture.update("test", {"title": "Other"})
+    assert (
+        await movie_repo_fixture.get_by_title("amelie", match=TitleMatch.NORMALIZED)
+        == []
+    )
+    await movie_repo_fixture.delete("test")
+
+
+@pytest.mark.asyncio
+async def test_update_many(movie_repo_fixture):
+    for movie_id, title, watched in (
+        ("a", "My Movie", False),
+        ("b", "My Movie", True),
+        ("c", "Other", False),
+    ):
+        await movie_repo_fixture.create(
+            Movie(
+                movie_id=movie_id,
+                title=title,
+                description="My Description",
+                release_year=1990,
+                watched=watched,
+            )
+        )
+    result = await movie_repo_fixture.update_many(
+        MovieFilter(title="My Movie"), {"watched": True}
+    )
+    assert (result.matched, result.modified) == (2, 1)
+    movies = await movie_repo_fixture.get_many(["a", "b", "c"])
+    assert {
+        movie_id: (movie.watched, movie.version) for movie_id, movie in movies.items()
+    } == {"a": (True, 2), "b": (True, 1), "c": (False, 1)}
+    await movie_repo_fixture.update_many(
+        MovieFilter(max_release_year=2000), {"title": "Amélie"}
+    )
+    result = await movie_repo_fixture.get_by_title(
+        "amelie", match=TitleMatch.NORMALIZED
+    )
+    assert [movie.id for movie in result] == ["a", "b", "c"]
+    with pytest.raises(RepositoryException):
+        await movie_repo_fixture.update_many(MovieFilter(), {"id": "other"})
+    for movie_id in ("a", "b", "c"):
+        await movie_repo_fixture.delete(movie_id)
@@ -0,0 +1,77 @@
+import random
+
+from api.entities.movie import Movie
+from api.repository.movie.columnar import ColumnarMovieStore
+from api.repository.movie.copy_on_write import (CopyOnWriteMapping,
+                                                CopyOnWriteSortedList)
+
+
+def test_mapping_copies_are_independent():
+    mapping = CopyOnWriteMapping(items=((key, key * 2) for key in range(1000)))
+    copied = mapping.copy()
+    copied[1] = "changed"
+    del copied[2]
+    copied[1000] = "added"
+    assert (mapping[1], mapping[2], 1000 in mapping) == (2, 4, False)
+    assert (copied[1], 2 in copied, copied[1000]) == ("changed", False, "added")
+    assert (len(mapping), len(copied)) == (1000, 1000)
+    assert dict(mapping.items()) == {key: key * 2 for key in range(1000)}
+    mapping[3] = "also changed"
+    assert copied[3] == 6
+
+
+def test_mapping_with_bucket_factory():
+    mapping = CopyOnWriteMapping(ColumnarMovieStore)
+    mapping["a"] = Movie(
+        movie_id="a", title="My Movie", description=None, release_year=1990
+    )
+    copied = mapping.copy()
+    copied["a"] = Movie(
+        movie_id="a", title="Other", description=None, release_year=1990
+    )
+    assert mapping["a"].title == "My Movie"
+    assert [movie.title for movie in copied.values()] == ["Other"]
+    assert mapping.pop("missing", None) is None
+
+
+def test_sorted_list_matches_a_plain_list():
+    rng = random.Random(0)
+    expected = sorted(rng.sample(range(100_000), 5000))
+    values = CopyOnWriteSortedList(expected)
+    copies = []
+    for step in range(5000):
+        value = rng.randrange(100_000)
+        if value in expected:
+            expected.remove(value)
+            values.remove(value)
+        else:
+            expected.append(value)
+            expected.sort()
+            values.insort(value)
+        if step % 500 == 0:
+            copies.append((list(expected), values.copy()))
+    assert list(values) == expected and len(values) == len(expected)
+    assert list(reversed(values)) == expected[::-1]
+    for value in (-1, 0, 500, 50_000, 100_000):
+        assert values.bisect_left(value) == len(
+            [other for other in expected if other < value]
+        )
+        assert values.bisect_right(value) == len(
+            [other for other in expected if other <= value]
+        )
+    assert list(values.islice(10, 2000)) == expected[10:2000]
+    assert list(values.islice(10, 2000, reverse=True)) == expected[10:2000][::-1]
+    for copied_expected, copied in copies:
+        assert list(copied) == copied_expected
+
+
+def test_sorted_list_remove_missing_value():
+    values = CopyOnWriteSortedList([1, 3])
+    values.remove(2)
+    values.remove(4)
+    assert list(values) == [1, 3]
+    values.remove(1)
+    values.remove(3)
+    assert (list(values), values.bisect_left(1)) == ([], 0)
+    values.insort(2)
+    assert list(values) == [2]
@@ -0,0 +1,62 @@
+import os
+
+import pytest
+
+from api._tests.fixture import make_movie
+from api.repository.movie.abstractions import MovieFilter
+from api.repository.movie.durable import (SNAPSHOT_FILE,
+                                          DurableMemoryMovieRepository)
+
+
+async def _reopen(directory: str, **kwargs) -> DurableMemoryMovieRepository:
+    repo = DurableMemoryMovieRepository(directory, fsync_interval=0, **kwargs)
+    await repo.initialize()
+    return repo
+
+
+@pytest.mark.asyncio
+async def test_writes_survive_restart(tmp_path):
+    repo = await _reopen(str(tmp_path))
+    await repo.create(make_movie("a"))
+    await repo.bulk_create([make_movie("b"), make_movie("c")])
+    await repo.update("a", {"title": "New Title"})
+    await repo.delete("b")
+    await repo.close()
+    repo = await _reopen(str(tmp_path))
+    assert sorted((await repo.get_many(["a", "b", "c"])).keys()) == ["a", "c"]
+    movie = await repo.get_by_id("a")
+    assert (movie.title, movie.version) == ("New Title", 2)
+    assert [movie.id for movie in await repo.get_by_title("New Title")] == ["a"]
+    await repo.close()
+
+
+@pytest.mark.asyncio
+async def test_recovers_from_snapshot_and_log_tail(tmp_path):
+    repo = await _reopen(str(tmp_path), snapshot_every=2)
+    await repo.create(make_movie("a"))
+    await repo.create(make_movie("b"))
+    await repo.close()
+    assert os.path.exists(tmp_path / SNAPSHOT_FILE)
+    repo = await _reopen(str(tmp_path), snapshot_every=100)
+    await repo.delete("a")
+    await repo.create(make_movie("c"))
+    await repo.close()
+    repo = await _reopen(str(tmp_path))
+    assert sorted((await repo.get_many(["a", "b", "c"])).keys()) == ["b", "c"]
+    assert await repo.autocomplete("my") == ["My Movie"]
+    await repo.close()
+
+
+@pytest.mark.asyncio
+async def test_update_many_survives_restart(tmp_path):
+    repo = await _reopen(str(tmp_path))
+    await repo.bulk_create(
+        [make_movie("a"), make_movie("b"), make_movie("c", title="Other")]
+    )
+    result = await repo.update_many(MovieFilter(title="My Movie"), {"watched": True})
+    assert result.modified == 2
+    await repo.close()
+    repo = await _reopen(str(tmp_path))
+    movies = await repo.get_many(["a", "b", "c"])
+    assert [movie.watched for movie in movies.values()] == [True, True, False]
+    await repo.close()
@@ -1,7 +1,11 @@
 import pytest
 
+from api._tests.fixture import make_movie
 from api.entities.movie import Movie
-from api.repository.movie.abstractions import RepositoryException
+from api.repository.movie.abstractions import (NOT_EXECUTED, MovieFilter,
+                                               MovieSort, RepositoryException,
+                                               TitleMatch,
+                                               VersionConflictException)
 from api.repository.movie.memory import MemoryMovieRepository
 
 
@@ -307,3 +311,542 @@ async def test_update_fail():
     )
     with pytest.raises(RepositoryException):
         await repo.update(movie_id="my-id", params={"id": "fail"})
+
+
+@pytest.mark.asyncio
+async def test_update_title_reindexes():
+    repo = MemoryMovieRepository()
+    await repo.create(
+        Movie(
+            movie_id="my-id",
+            title="My Movie",
+            description="My Description",
+            release_year=1990,
+        )
+    )
+    await repo.update(movie_id="my-id", params={"title": "Test Title"})
+    assert await repo.get_by_title("My Movie") == []
+    assert await repo.get_by_title("Test Title") == [await repo.get_by_id("my-id")]
+
+
+@pytest.mark.asyncio
+async def test_delete_removes_from_title_index():
+    repo = MemoryMovieRepository()
+    await repo.create(
+        Movie(
+            movie_id="my-id",
+            title="My Movie",
+            description="My Description",
+            release_year=1990,
+        )
+    )
+    await repo.delete("my-id")
+    assert await repo.get_by_title("My Movie") == []
+
+
+@pytest.mark.asyncio
+async def test_create_existing_id_reindexes():
+    repo = MemoryMovieRepository()
+    await repo.create(
+        Movie(
+            movie_id="my-id",
+            title="My Movie",
+            description="My Description",
+            release_year=1990,
+        )
+    )
+    await repo.create(
+        Movie(
+            movie_id="my-id",
+            title="Other Movie",
+            description="My Description",
+            release_year=1990,
+        )
+    )
+    assert await repo.get_by_title("My Movie") == []
+    assert len(await repo.get_by_title("Other Movie")) == 1
+
+
+def _catalog():
+    return [
+        Movie(
+            movie_id="a",
+            title="Alpha",
+            description="My Description",
+            release_year=1985,
+        ),
+        Movie(
+            movie_id="b",
+            title="Bravo",
+            description="My Description",
+            release_year=1992,
+        ),
+        Movie(
+            movie_id="c",
+            title="Charlie",
+            description="My Description",
+            release_year=1995,
+            watched=True,
+        ),
+        Movie(
+            movie_id="d",
+            title="Delta",
+            description="My Description",
+            release_year=1999,
+        ),
+        Movie(
+            movie_id="e",
+            title="Bravo",
+            description="My Description",
+            release_year=2004,
+        ),
+    ]
+
+
+@pytest.mark.parametrize(
+    "movie_filter,sort,skip,limit,expected_ids",
+    [
+        pytest.param(
+            MovieFilter(), MovieSort.RELEASE_YEAR_ASC, 0, 0, list("abcde"), id="all"
+        ),
+        pytest.param(
+            MovieFilter(min_release_year=1990, max_release_year=2000, watched=False),
+            MovieSort.RELEASE_YEAR_DESC,
+            0,
+            1000,
+            ["d", "b"],
+            id="unwatched-range-newest-first",
+        ),
+        pytest.param(
+            MovieFilter(title="Bravo"),
+            MovieSort.RELEASE_YEAR_DESC,
+            0,
+            1000,
+            ["e", "b"],
+            id="title",
+        ),
+        pytest.param(
+            MovieFilter(watched=True),
+            MovieSort.TITLE_ASC,
+            0,
+            1000,
+            ["c"],
+            id="watched",
+        ),
+        pytest.param(
+            MovieFilter(),
+            MovieSort.TITLE_DESC,
+            1,
+            2,
+            ["c", "e"],
+            id="title-desc-paginated",
+        ),
+        pytest.param(
+            MovieFilter(min_release_year=2010),
+            MovieSort.RELEASE_YEAR_ASC,
+            0,
+            1000,
+            [],
+            id="empty-range",
+        ),
+    ],
+)
+@pytest.mark.asyncio
+async def test_find(movie_filter, sort, skip, limit, expected_ids):
+    repo = MemoryMovieRepository()
+    for movie in _catalog():
+        await repo.create(movie)
+    result = await repo.find(
+        movie_filter=movie_filter, sort=sort, skip=skip, limit=limit
+    )
+    assert [movie.id for movie in result] == expected_ids
+
+
+@pytest.mark.asyncio
+async def test_find_after_update():
+    repo = MemoryMovieRepository()
+    for movie in _catalog():
+        await repo.create(movie)
+    await repo.update(movie_id="a", params={"release_year": 1996, "watched": True})
+    result = await repo.find(
+        movie_filter=MovieFilter(min_release_year=1990, watched=True)
+    )
+    assert [movie.id for movie in result] == ["c", "a"]
+
+
+@pytest.mark.parametrize(
+    "sort",
+    [
+        pytest.param(MovieSort.RELEASE_YEAR_ASC, id="year-asc"),
+        pytest.param(MovieSort.RELEASE_YEAR_DESC, id="year-desc"),
+        pytest.param(MovieSort.TITLE_ASC, id="title-asc"),
+        pytest.param(MovieSort.TITLE_DESC, id="title-desc"),
+    ],
+)
+@pytest.mark.asyncio
+async def test_find_keyset_pagination(sort):
+    repo = MemoryMovieRepository()
+    for movie in _catalog():
+        await repo.create(movie)
+    expected = await repo.find(movie_filter=MovieFilter(), sort=sort, limit=0)
+    pages = []
+    after = None
+    while True:
+        page = await repo.find(
+            movie_filter=MovieFilter(), sort=sort, limit=2, after=after
+        )
+        if not page:
+            break
+        pages.extend(page)
+        after = (getattr(page[-1], sort.field), page[-1].id)
+    assert pages == expected
+
+
+@pytest.mark.asyncio
+async def test_get_by_title_after():
+    repo = MemoryMovieRepository()
+    for movie_id in ["my-id-3", "my-id-1", "my-id-2"]:
+        await repo.create(
+            Movie(
+                movie_id=movie_id,
+                title="My Movie",
+                description="My Description",
+                release_year=1990,
+            )
+        )
+    result = await repo.get_by_title(title="My Movie", limit=1, after="my-id-1")
+    assert [movie.id for movie in result] == ["my-id-2"]
+
+
+@pytest.mark.parametrize(
+    "skip,limit,expected_ids",
+    [
+        pytest.param(0, 0, list("abcde"), id="all"),
+        pytest.param(1, 0, list("bcde"), id="skip"),
+        pytest.param(0, 3, list("abc"), id="limit"),
+        pytest.param(1, 3, list("bcd"), id="skip-and-limit"),
+    ],
+)
+@pytest.mark.asyncio
+async def test_iter_find(skip, limit, expected_ids):
+    repo = MemoryMovieRepository()
+    for movie in _catalog():
+        await repo.create(movie)
+    result = [
+        movie.id
+        async for movie in repo.iter_find(
+            movie_filter=MovieFilter(), skip=skip, limit=limit, batch_size=2
+        )
+    ]
+    assert result == expected_ids
+
+
+@pytest.mark.asyncio
+async def test_iter_by_title():
+    repo = MemoryMovieRepository()
+    for index in range(5):
+        await repo.create(
+            Movie(
+                movie_id=f"my-id-{index}",
+                title="My Movie",
+                description="My Description",
+                release_year=1990,
+            )
+        )
+    result = [
+        movie.id
+        async for movie in repo.iter_by_title(title="My Movie", skip=1, batch_size=2)
+    ]
+    assert result == ["my-id-1", "my-id-2", "my-id-3", "my-id-4"]
+
+
+@pytest.mark.asyncio
+async def test_bulk_create_and_delete():
+    repo = MemoryMovieRepository()
+    results = await repo.bulk_create(_catalog())
+    assert results == [None] * 5
+    assert len(await repo.get_by_title("Bravo")) == 2
+    results = await repo.bulk_delete(["a", "b", "missing"])
+    assert results == [None] * 3
+    assert await repo.get_by_id("a") is None
+    assert len(await repo.get_by_title("Bravo")) == 1
+
+
+@pytest.mark.parametrize(
+    "ordered,expected_results,expected_year",
+    [
+        pytest.param(
+            False,
+            [None, "Movie: missing not found", None],
+            2001,
+            id="unordered",
+        ),
+        pytest.param(
+            True,
+            [None, "Movie: missing not found", NOT_EXECUTED],
+            2000,
+            id="ordered",
+        ),
+    ],
+)
+@pytest.mark.asyncio
+async def test_bulk_update(ordered, expected_results, expected_year):
+    repo = MemoryMovieRepository()
+    await repo.bulk_create(_catalog())
+    results = await repo.bulk_update(
+        [
+            ("a", {"release_year": 2000}),
+            ("missing", {"release_year": 2000}),
+            ("a", {"release_year": 2001}),
+        ],
+        ordered=ordered,
+    )
+    assert results == expected_results
+    assert (await repo.get_by_id("a")).release_year == expected_year
+
+
+@pytest.mark.asyncio
+async def test_update_increments_version():
+    repo = MemoryMovieRepository()
+    await repo.create(
+        Movie(
+            movie_id="my-id",
+            title="My Movie",
+            description="My Description",
+            release_year=1990,
+        )
+    )
+    assert (await repo.get_by_id("my-id")).version == 1
+    await repo.update(movie_id="my-id", params={"watched": True}, expected_version=1)
+    assert (await repo.get_by_id("my-id")).version == 2
+    with pytest.raises(VersionConflictException):
+        await repo.update(
+            movie_id="my-id", params={"watched": False}, expected_version=1
+        )
+    assert (await repo.get_by_id("my-id")).watched is True
+
+
+@pytest.mark.asyncio
+async def test_fields_projection():
+    repo = MemoryMovieRepository()
+    await repo.bulk_create(_catalog())
+    movie = await repo.get_by_id("c", fields=["title"])
+    assert (movie.id, movie.title, movie.description, movie.version) == (
+        "c",
+        "Charlie",
+        None,
+        1,
+    )
+    # The stored movie is left untouched
+    assert (await repo.get_by_id("c")).description == "My Description"
+    [movie, _] = await repo.get_by_title("Bravo", fields=["watched"])
+    assert (movie.title, movie.watched) == (None, False)
+    [movie, *_] = await repo.find(
+        MovieFilter(), sort=MovieSort.RELEASE_YEAR_DESC, fields=["title"]
+    )
+    # The sort field is always loaded
+    assert (movie.title, movie.release_year, movie.watched) == ("Bravo", 2004, None)
+
+
+@pytest.mark.parametrize(
+    "movie_filter,sort,after,expected_ids",
+    [
+        pytest.param(MovieFilter(), MovieSort.ID_DESC, None, ["e", "d", "c", "b", "a"]),
+        pytest.param(MovieFilter(), MovieSort.ID_ASC, ("b", "b"), ["c", "d", "e"]),
+        pytest.param(
+            MovieFilter(min_id="b", max_id="d"),
+            MovieSort.RELEASE_YEAR_DESC,
+            None,
+            ["d", "c", "b"],
+        ),
+        pytest.param(
+            MovieFilter(title="Bravo", max_id="d"),
+            MovieSort.ID_DESC,
+            None,
+            ["b"],
+        ),
+    ],
+)
+@pytest.mark.asyncio
+async def test_find_by_id(movie_filter, sort, after, expected_ids):
+    repo = MemoryMovieRepository()
+    await repo.bulk_create(_catalog())
+    result = await repo.find(movie_filter=movie_filter, sort=sort, after=after)
+    assert [movie.id for movie in result] == expected_ids
+
+
+@pytest.mark.asyncio
+async def test_search():
+    repo = MemoryMovieRepository()
+    await repo.bulk_create(
+        [
+            Movie(
+                movie_id="a",
+                title="The Godfather",
+                description="A crime family saga",
+                release_year=1972,
+            ),
+            Movie(
+                movie_id="b",
+                title="The Godfather Part II",
+                description="The saga continues",
+                release_year=1974,
+            ),
+            Movie(
+                movie_id="c",
+                title="Goodfellas",
+                description="A mob story",
+                release_year=1990,
+            ),
+        ]
+    )
+    assert [movie.id for movie in await repo.search("Godfather")] == ["a", "b"]
+    assert [movie.id for movie in await repo.search("godfather", limit=1)] == ["a"]
+    await repo.update("a", {"title": "Renamed"})
+    assert [movie.id for movie in await repo.search("godfather")] == ["b"]
+    await repo.delete("b")
+    assert [movie.id for movie in await repo.search("saga")] == ["a"]
+
+
+@pytest.mark.asyncio
+async def test_autocomplete():
+    repo = MemoryMovieRepository()
+    for movie_id, title in (
+        ("a", "The Godfather"),
+        ("b", "The Godfather"),
+        ("c", "Thé Great Escape"),
+        ("d", "Theater"),
+        ("e", "Amélie"),
+    ):
+        await repo.create(
+            Movie(
+                movie_id=movie_id,
+                title=title,
+                description="My Description",
+                release_year=1990,
+            )
+        )
+    assert await repo.autocomplete("THE ") == ["The Godfather", "Thé Great Escape"]
+    assert await repo.autocomplete("the", limit=2) == [
+        "The Godfather",
+        "Thé Great Escape",
+    ]
+    assert await repo.autocomplete("ame") == ["Amélie"]
+    await repo.delete("a")
+    assert await repo.autocomplete("the g") == ["The Godfather", "Thé Great Escape"]
+    await repo.update("b", {"title": "Godfather"})
+    assert await repo.autocomplete("the g") == ["Thé Great Escape"]
+    assert await repo.autocomplete(" ") == []
+
+
+@pytest.mark.asyncio
+async def test_get_by_title_normalized():
+    repo = MemoryMovieRepository()
+    for movie_id, title in (("b", "Amélie"), ("a", "AMELIE"), ("c", "Amelia")):
+        await repo.create(
+            Movie(
+                movie_id=movie_id,
+                title=title,
+                description="My Description",
+                release_year=2001,
+            )
+        )
+    assert await repo.get_by_title("amelie") == []
+    result = await repo.get_by_title("  amelie ", match=TitleMatch.NORMALIZED)
+    assert [movie.id for movie in result] == ["a", "b"]
+    await repo.update("a", {"title": "Other"})
+    result = await repo.get_by_title("amélie", match=TitleMatch.NORMALIZED)
+    assert [movie.id for movie in result] == ["b"]
+
+
+@pytest.mark.asyncio
+async def test_update_replaces_movie():
+    repo = MemoryMovieRepository()
+    await repo.create(make_movie("a"))
+    before = await repo.get_by_id("a")
+    await repo.update("a", {"title": "New Title", "unknown": 1})
+    after = await repo.get_by_id("a")
+    assert before.title == "My Movie" and before.version == 1
+    assert after.title == "New Title" and after.version == 2
+
+
+@pytest.mark.asyncio
+async def test_frozen_view_is_isolated_from_writes():
+    repo = MemoryMovieRepository()
+    await repo.bulk_create([make_movie("a"), make_movie("b")])
+    view = repo.frozen_view()
+    await repo.create(make_movie("c"))
+    await repo.update("a", {"title": "New Title"})
+    await repo.delete("b")
+    assert [movie.id for movie in await view.get_by_title("My Movie")] == ["a", "b"]
+    assert await view.get_by_title("New Title") == []
+    assert [movie.id for movie in await view.find(MovieFilter())] == ["a", "b"]
+    assert await view.autocomplete("new") == []
+    assert [movie.id for movie in await repo.find(MovieFilter())] == ["a", "c"]
+    with pytest.raises(RepositoryException):
+        await view.create(make_movie("d"))
+    with pytest.raises(RepositoryException):
+        await view.search("movie")
+
+
+@pytest.mark.asyncio
+async def test_frozen_view_is_reused_until_a_write():
+    repo = MemoryMovieRepository()
+    await repo.create(make_movie("a"))
+    view = repo.frozen_view()
+    assert repo.frozen_view() is view
+    await repo.create(make_movie("b"))
+    later = repo.frozen_view()
+    assert later is not view
+    assert [movie.id for movie in await later.find(MovieFilter())] == ["a", "b"]
+    repo._load([make_movie("c")])
+    assert [movie.id for movie in await repo.frozen_view().find(MovieFilter())] == ["c"]
+
+
+@pytest.mark.asyncio
+async def test_iteration_reads_a_stable_view():
+    repo = MemoryMovieRepository()
+    await repo.bulk_create([make_movie(movie_id) for movie_id in "abcde"])
+    seen = []
+    async for movie in repo.iter_find(
+        MovieFilter(), sort=MovieSort.ID_ASC, batch_size=2
+    ):
+        seen.append(movie.id)
+        if movie.id == "a":
+            await repo.delete("b")
+            await repo.create(make_movie("aa"))
+    assert seen == list("abcde")
+    assert [movie.id async for movie in repo.iter_by_title("My Movie")] == [
+        "a",
+        "aa",
+        "c",
+        "d",
+        "e",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_update_many():
+    repo = MemoryMovieRepository()
+    await repo.bulk_create(
+        [make_movie("a"), make_movie("b"), make_movie("c", title="Other")]
+    )
+    await repo.update("b", {"watched": True})
+    result = await repo.update_many(MovieFilter(title="My Movie"), {"watched": True})
+    assert (result.matched, result.modified) == (2, 1)
+    movies = await repo.get_many(["a", "b", "c"])
+    assert [(movie.watched, movie.version) for movie in movies.values()] == [
+        (True, 2),
+        (True, 2),
+        (False, 1),
+    ]
+    assert [movie.id for movie in await repo.find(MovieFilter(watched=True))] == [
+        "a",
+        "b",
+    ]
+    result = await repo.update_many(MovieFilter(min_release_year=2000), {"title": "X"})
+    assert (result.matched, result.modified) == (0, 0)
+    with pytest.raises(RepositoryException):
+        await repo.update_many(MovieFilter(), {"id": "other"})
+    with pytest.raises(RepositoryException):
+        await repo.frozen_view().update_many(MovieFilter(), {"watched": False})
@@ -4,326 +4,72 @@ import pytest
 from api._tests.fixture import mongo_movie_repo_fixture
 from api.entities.movie import Movie
 from api.repository.movie.abstractions import RepositoryException
-
-
-@pytest.mark.asyncio
-async def test_create(mongo_movie_repo_fixture):
-    await mongo_movie_repo_fixture.create(
-        Movie(
-            movie_id="test",
-            title="My Movie",
-            description="My Description",
-            release_year=1990,
-            watched=True,
-        )
-    )
-    movie: Movie = await mongo_movie_repo_fixture.get_by_id("test")
-    assert movie == Movie(
-        movie_id="test",
-        title="My Movie",
-        description="My Description",
-        release_year=1990,
-        watched=True,
-    )
-    await mongo_movie_repo_fixture.delete("test")
-
-
-@pytest.mark.parametrize(
-    "initial_movies,movie_id,expected_result",
-    [
-        pytest.param([], "test-id", None, id="empty"),
-        pytest.param(
-            [
-                Movie(
-                    movie_id="my-id",
-                    title="My Movie",
-                    description="My Description",
-                    release_year=1990,
-                )
-            ],
-            "my-id",
-            Movie(
-                movie_id="my-id",
-                title="My Movie",
-                description="My Description",
-                release_year=1990,
-            ),
-            id="found",
-        ),
-    ],
-)
-@pytest.mark.asyncio
-async def test_get_by_id(
-    mongo_movie_repo_fixture, initial_movies, movie_id, expected_result
-):
-    for movie in initial_movies:
-        await mongo_movie_repo_fixture.create(movie)
-    movie: Movie = await mongo_movie_repo_fixture.get_by_id(movie_id)
-    assert movie == expected_result
+from api.repository.movie.mongo import MongoMovieRepository
 
 
 @pytest.mark.parametrize(
-    "initial_movies,title,expected_result",
+    "plan,expected_result",
     [
-        pytest.param([], "test-id", [], id="empty"),
+        pytest.param({"stage": "COLLSCAN"}, True, id="collscan"),
         pytest.param(
-            [
-                Movie(
-                    movie_id="test-id",
-                    title="My Movie",
-                    description="My Description",
-                    release_year=1990,
-                ),
-                Movie(
-                    movie_id="test-id-0",
-                    title="Other Movie",
-                    description="My Description",
-                    release_year=1990,
-                ),
-            ],
-            "My Movie",
-            [
-                Movie(
-                    movie_id="test-id",
-                    title="My Movie",
-                    description="My Description",
-                    release_year=1990,
-                )
-            ],
-            id="found-one",
+            {"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}}, False, id="ixscan"
         ),
         pytest.param(
-            [
-                Movie(
-                    movie_id="test-id-1",
-                    title="My Movie",
-                    description="My Description",
-                    release_year=1990,
-                ),
-                Movie(
-                    movie_id="test-id-2",
-                    title="My Movie",
-                    description="My Description",
-                    release_year=1990,
-                ),
-                Movie(
-                    movie_id="test-id-3",
-                    title="My Movie",
-                    description="My Description",
-                    release_year=1990,
-                ),
-                Movie(
-                    movie_id="test-id-0",
-                    title="Other Movie",
-                    description="My Description",
-                    release_year=1990,
-                ),
-            ],
-            "My Movie",
-            [
-                Movie(
-                    movie_id="test-id-1",
-                    title="My Movie",
-                    description="My Description",
-                    release_year=1990,
-                ),
-                Movie(
-                    movie_id="test-id-2",
-                    title="My Movie",
-                    description="My Description",
-                    release_year=1990,
-                ),
-                Movie(
-                    movie_id="test-id-3",
-                    title="My Movie",
-                    description="My Description",
-                    release_year=1990,
-                ),
-            ],
-            id="found-many",
+            {
+                "stage": "SORT_MERGE",
+                "inputStages": [{"stage": "IXSCAN"}, {"stage": "COLLSCAN"}],
+            },
+            True,
+            id="nested",
         ),
     ],
 )
-@pytest.mark.asyncio
-async def test_get_by_title(
-    mongo_movie_repo_fixture, initial_movies, title, expected_result
-):
-    for movie in initial_movies:
-        await mongo_movie_repo_fixture.create(movie)
-    movie: Movie = await mongo_movie_repo_fixture.get_by_title(title)
-    assert movie == expected_result
+def test_collection_scans(plan, expected_result):
+    # noinspection PyProtectedMember
+    assert MongoMovieRepository._collection_scans(plan) is expected_result
 
 
-@pytest.mark.parametrize(
-    "title,skip,limit,expected_result",
-    [
-        pytest.param(
-            "My Movie",
-            2,
-            1000,
-            [
-                Movie(
-                    movie_id="my-id-3",
-                    title="My Movie",
-                    description="My Description",
-                    release_year=1990,
-                ),
-                Movie(
-                    movie_id="my-id-4",
-                    title="My Movie",
-                    description="My Description",
-                    release_year=1990,
-                ),
-                Movie(
-                    movie_id="my-id-5",
-                    title="My Movie",
-                    description="My Description",
-                    release_year=1990,
-                ),
-            ],
-            id="skip",
-        ),
-        pytest.param(
-            "My Movie",
-            0,
-            3,
-            [
-                Movie(
-                    movie_id="my-id-1",
-                    title="My Movie",
-                    description="My Description",
-                    release_year=1990,
-                ),
-                Movie(
-                    movie_id="my-id-2",
-                    title="My Movie",
-                    description="My Description",
-                    release_year=1990,
-                ),
-                Movie(
-                    movie_id="my-id-3",
-                    title="My Movie",
-                    description="My Description",
-                    release_year=1990,
-                ),
-            ],
-            id="limit",
-        ),
-        pytest.param(
-            "My Movie",
-            2,
-            2,
-            [
-                Movie(
-                    movie_id="my-id-3",
-                    title="My Movie",
-                    description="My Description",
-                    release_year=1990,
-                ),
-                Movie(
-                    movie_id="my-id-4",
-                    title="My Movie",
-                    description="My Description",
-                    release_year=1990,
-                ),
-            ],
-            id="skip-and-limit",
-        ),
-    ],
-)
 @pytest.mark.asyncio
-async def test_get_by_title_pagination(
-    mongo_movie_repo_fixture, title, skip, limit, expected_result
-):
-    initial_movies = [
-        Movie(
-            movie_id="my-id-1",
-            title="My Movie",
-            description="My Description",
-            release_year=1990,
-        ),
-        Movie(
-            movie_id="my-id-2",
-            title="My Movie",
-            description="My Description",
-            release_year=1990,
-        ),
-        Movie(
-            movie_id="my-id-3",
-            title="My Movie",
-            description="My Description",
-            release_year=1990,
-        ),
-        Movie(
-            movie_id="my-id-4",
-            title="My Movie",
-            description="My Description",
-            release_year=1990,
-        ),
-        Movie(
-            movie_id="my-id-5",
-            title="My Movie",
-            description="My Description",
-            release_year=1990,
-        ),
-    ]
-    for movie in initial_movies:
-        await mongo_movie_repo_fixture.create(movie)
-    movie: Movie = await mongo_movie_repo_fixture.get_by_title(
-        title=title, skip=skip, limit=limit
-    )
-    assert movie == expected_result
+async def test_initialize_creates_indexes(mongo_movie_repo_fixture):
+    with pytest.raises(RepositoryException):
+        await mongo_movie_repo_fixture.create(
+            Movie(
+                movie_id="my-id",
+                title="My Movie",
+                description="My Description",
+                release_year=1990,
+            )
+        )
+        await mongo_movie_repo_fixture.verify_query_plans()
+    await mongo_movie_repo_fixture.initialize()
+    # Idempotent
+    await mongo_movie_repo_fixture.ensure_indexes()
+    await mongo_movie_repo_fixture.verify_query_plans()
 
 
-@pytest.mark.asyncio
-async def test_delete(mongo_movie_repo_fixture):
-    initial_movie = Movie(
-        movie_id="test",
-        title="My Movie",
-        description="My Description",
-        release_year=1990,
-    )
-    await mongo_movie_repo_fixture.create(initial_movie)
-    await mongo_movie_repo_fixture.delete(movie_id="test")
-    assert await mongo_movie_repo_fixture.get_by_id(movie_id="test") is None
+def test_projection():
+    assert MongoMovieRepository._projection(None) == {"_id": 0}
+    assert MongoMovieRepository._projection(["title"], "release_year") == {
+        "_id": 0,
+        "id": 1,
+        "version": 1,
+        "title": 1,
+        "release_year": 1,
+    }
 
 
-@pytest.mark.asyncio
-async def test_update(mongo_movie_repo_fixture):
-    initial_movie = Movie(
-        movie_id="test",
-        title="My Movie",
-        description="My Description",
-        release_year=1990,
-    )
-    await mongo_movie_repo_fixture.create(initial_movie)
-    await mongo_movie_repo_fixture.update(
-        movie_id="test",
-        params={
-            "title": "Test Title",
-            "description": "Test Description",
-            "release_year": 2000,
-            "watched": True,
-        },
-    )
-    movie: Movie = await mongo_movie_repo_fixture.get_by_id("test")
-    assert movie == Movie(
-        movie_id="test",
-        title="Test Title",
-        description="Test Description",
-        release_year=2000,
-        watched=True,
-    )
+def test_to_movie_defaults_missing_version_to_1():
+    movie = MongoMovieRepository._to_movie({"id": "a", "title": "My Movie"})
+    assert movie.version == 1
 
 
 @pytest.mark.asyncio
-async def test_update_fail(mongo_movie_repo_fixture):
-    initial_movie = Movie(
-        movie_id="test",
-        title="My Movie",
-        description="My Description",
-        release_year=1990,
+async def test_initialize_backfills_versions(mongo_movie_repo_fixture):
+    # noinspection PyProtectedMember
+    await mongo_movie_repo_fixture._movies.insert_one(
+        {"id": "a", "title": "My Movie", "title_normalized": "my movie"}
     )
-    await mongo_movie_repo_fixture.create(initial_movie)
-    with pytest.raises(RepositoryException):
-        await mongo_movie_repo_fixture.update(movie_id="my-id", params={"id": "fail"})
+    await mongo_movie_repo_fixture.initialize()
+    await mongo_movie_repo_fixture.update("a", {"watched": True}, expected_version=1)
+    assert (await mongo_movie_repo_fixture.get_by_id("a")).version == 2
+    await mongo_movie_repo_fixture.delete("a")
@@ -0,0 +1,73 @@
+import pytest
+
+from api.repository.movie.search import (InvertedIndex, normalize_prefix,
+                                         normalize_title, prefix_upper_bound,
+                                         tokenize)
+
+
+def test_tokenize():
+    assert tokenize("The Godfather: Part II") == ["the", "godfather", "part", "ii"]
+    assert tokenize(None) == []
+
+
+@pytest.mark.parametrize(
+    "terms,expected_ids",
+    [
+        pytest.param(["godfather"], ["short", "long"], id="shorter-document-first"),
+        pytest.param(["godfather", "part"], ["long", "short"], id="more-terms-first"),
+        pytest.param(["unknown"], [], id="no-match"),
+    ],
+)
+def test_inverted_index_scores(terms, expected_ids):
+    index = InvertedIndex()
+    index.add("short", "The Godfather")
+    index.add("long", "The Godfather Part II")
+    index.add("other", "Casablanca")
+    scores = index.scores(terms)
+    assert sorted(scores, key=scores.get, reverse=True) == expected_ids
+
+
+def test_inverted_index_remove():
+    index = InvertedIndex()
+    index.add("a", "The Godfather")
+    index.add("b", "The Godfather Part II")
+    index.remove("a", "The Godfather")
+    assert list(index.scores(["godfather", "the"])) == ["b"]
+    index.remove("b", "The Godfather Part II")
+    assert index.scores(["godfather"]) == {}
+
+
+@pytest.mark.parametrize(
+    "title,expected_result",
+    [
+        pytest.param("Amélie", "amelie", id="diacritics"),
+        pytest.param(
+            "  The   GODFATHER\tPart II ", "the godfather part ii", id="spaces"
+        ),
+        pytest.param("Ｓｔａｒ", "star", id="compatibility"),
+        pytest.param(None, "", id="none"),
+    ],
+)
+def test_normalize_title(title, expected_result):
+    assert normalize_title(title) == expected_result
+
+
+def test_normalize_prefix():
+    assert normalize_prefix("The  ") == "the "
+    assert normalize_prefix("  ") == ""
+    assert prefix_upper_bound("the") == "thf"
+
+
+def test_inverted_index_compacts_removed_documents():
+    index = InvertedIndex()
+    for number in range(3000):
+        index.add(f"doc-{number}", f"common word{number}")
+    for number in range(2500):
+        index.remove(f"doc-{number}", f"common word{number}")
+    index.add("doc-2999", "replaced")
+    assert len(index._doc_ids) < 3000
+    assert set(index.scores(["common"])) == {
+        f"doc-{number}" for number in range(2500, 2999)
+    }
+    assert list(index.scores(["replaced", "word2999"])) == ["doc-2999"]
+    assert index.scores(["word0"]) == {}
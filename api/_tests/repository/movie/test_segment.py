@@ -0,0 +1,60 @@
+import pytest
+
+from api.entities.movie import Movie
+from api.repository.movie.abstractions import MovieFilter
+from api.repository.movie.segment import (MovieSegment, SegmentException,
+                                          encode_segment)
+
+
+def _movies():
+    return [
+        Movie(
+            movie_id="c",
+            title="Amélie",
+            description="My Description",
+            release_year=2001,
+            watched=True,
+            version=3,
+        ),
+        Movie(movie_id="a", title="Up", description="Balloons", release_year=2009),
+        Movie(movie_id="b", title="AMELIE", description=None, release_year=None),
+        Movie(movie_id="d", title="Up", description="", release_year=1990),
+    ]
+
+
+def test_segment_round_trip():
+    segment = MovieSegment(encode_segment(_movies(), generation=7))
+    assert segment.generation == 7
+    assert len(segment) == 4
+    movies = [segment.movie(position) for position in range(len(segment))]
+    assert movies == sorted(_movies(), key=lambda movie: movie.id)
+    assert segment.movie(segment.position("c")).version == 3
+    assert segment.movie(segment.position("b")).description is None
+    assert segment.movie(segment.position("b")).release_year is None
+    assert segment.movie(segment.position("d")).description == ""
+    assert segment.position("missing") is None
+
+
+def test_segment_lookups():
+    segment = MovieSegment(encode_segment(_movies(), generation=1))
+    ids = lambda positions: [segment.id(position) for position in positions]
+    assert ids(segment.by_title("Up")) == ["a", "d"]
+    assert ids(segment.by_title("Missing")) == []
+    assert ids(segment.by_normalized_title("amelie")) == ["b", "c"]
+    assert ids(segment.from_normalized_title("u")) == ["a", "d"]
+    assert ids(segment.by_release_year(1995, None)) == ["c", "a"]
+    assert ids(segment.id_range("b", "c")) == ["b", "c"]
+    assert ids(segment.by_watched(False)) == ["a", "b", "d"]
+    assert ids(segment.by_watched(True)) == ["c"]
+    assert [
+        segment.id(position)
+        for position in range(len(segment))
+        if segment.matches(position, MovieFilter(max_release_year=2005))
+    ] == ["c", "d"]
+
+
+def test_segment_rejects_other_data():
+    with pytest.raises(SegmentException):
+        MovieSegment(b"MOVIESNP" + bytes(100))
+    with pytest.raises(SegmentException):
+        MovieSegment(encode_segment(_movies(), generation=1)[:100])
@@ -0,0 +1,174 @@
+import asyncio
+import contextlib
+import logging
+import os
+
+import pytest
+
+from api._tests.fixture import make_movie
+from api.repository.movie import shared
+from api.repository.movie.abstractions import (MovieFilter, MovieSort,
+                                               RepositoryException, TitleMatch,
+                                               VersionConflictException)
+from api.repository.movie.segment import MovieSegment
+from api.repository.movie.shared import (SEGMENT_FILE, SOCKET_FILE,
+                                         SharedMemoryMovieRepository)
+
+
+@contextlib.asynccontextmanager
+async def _repos(directory: str):
+    writer = SharedMemoryMovieRepository(directory, publish_interval=0)
+    await writer.initialize()
+    reader = SharedMemoryMovieRepository(directory)
+    await reader.initialize()
+    try:
+        yield writer, reader
+    finally:
+        await reader.close()
+        await writer.close()
+
+
+@pytest.mark.asyncio
+async def test_first_process_becomes_writer(tmp_path):
+    async with _repos(str(tmp_path)) as (writer, reader):
+        assert writer.is_writer
+        assert not reader.is_writer
+
+
+@pytest.mark.asyncio
+async def test_reader_sees_published_writes(tmp_path):
+    async with _repos(str(tmp_path)) as (writer, reader):
+        await writer.create(make_movie("a"))
+        assert await reader.get_by_id("a") == make_movie("a")
+        await writer.update("a", {"watched": True})
+        movie = await reader.get_by_id("a")
+        assert movie.watched and movie.version == 2
+        assert await writer.delete("a")
+        assert await reader.get_by_id("a") is None
+
+
+@pytest.mark.asyncio
+async def test_reader_forwards_writes_to_writer(tmp_path):
+    async with _repos(str(tmp_path)) as (writer, reader):
+        await reader.create(make_movie("a"))
+        assert await reader.bulk_create([make_movie("b"), make_movie("c")]) == [
+            None,
+            None,
+        ]
+        await reader.update("a", {"title": "New Title"}, expected_version=1)
+        with pytest.raises(VersionConflictException):
+            await reader.update("a", {"title": "Other"}, expected_version=1)
+        with pytest.raises(RepositoryException):
+            await reader.update("missing", {"title": "Other"})
+        assert await reader.delete("b")
+        assert not await reader.delete("b")
+        assert (await reader.get_by_id("a")).title == "New Title"
+        assert await reader.get_many(["a", "b", "c"]) == await writer.get_many(
+            ["a", "b", "c"]
+        )
+        assert [movie.id for movie in await reader.search("new")] == ["a"]
+        result = await reader.update_many(
+            MovieFilter(title="My Movie"), {"watched": True}
+        )
+        assert (result.matched, result.modified) == (1, 1)
+        assert (await reader.get_by_id("c")).watched
+
+
+def _generation(directory: str) -> int:
+    with open(os.path.join(directory, SEGMENT_FILE), "rb") as f:
+        return MovieSegment(f.read()).generation
+
+
+@pytest.mark.asyncio
+async def test_writes_are_appended_until_the_delta_log_is_full(tmp_path, monkeypatch):
+    monkeypatch.setattr(shared, "_MIN_DELTA", 2)
+    monkeypatch.setattr(shared, "_SEGMENT_BACKOFF", 0)
+    async with _repos(str(tmp_path)) as (writer, reader):
+        await writer.create(make_movie("a"))
+        await writer.create(make_movie("b"))
+        assert _generation(tmp_path) == 1
+        assert set(await reader.get_many(["a", "b"])) == {"a", "b"}
+        await writer.delete("a")
+        assert _generation(tmp_path) == 2
+        assert await reader.get_many(["a", "b"]) == {"b": make_movie("b")}
+        await writer.update_many(MovieFilter(), {"watched": True})
+        assert _generation(tmp_path) == 3
+        assert (await reader.get_by_id("b")).watched
+
+
+@pytest.mark.asyncio
+async def test_small_writes_are_appended_until_the_segment_is_due(
+    tmp_path, monkeypatch
+):
+    monkeypatch.setattr(shared, "_MIN_DELTA", 1)
+    async with _repos(str(tmp_path)) as (writer, reader):
+        writer._segment_due = float("inf")
+        for movie_id in "abc":
+            await writer.create(make_movie(movie_id))
+        assert _generation(tmp_path) == 1
+        assert set(await reader.get_many(["a", "b", "c"])) == {"a", "b", "c"}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("in_segment", [False, True])
+async def test_reader_queries_match_writer(tmp_path, monkeypatch, in_segment):
+    async with _repos(str(tmp_path)) as (writer, reader):
+        if in_segment:
+            # Written to the segment, then partly replaced by the delta log
+            monkeypatch.setattr(shared, "_MIN_DELTA", 0)
+        await writer.bulk_create(
+            [
+                make_movie("a", title="Up", release_year=2009),
+                make_movie("b", title="Amélie", release_year=2001),
+                make_movie("c", title="AMELIE", release_year=2001),
+                make_movie("d", title="Up", release_year=1990),
+                make_movie("e", title="Alien", release_year=1979),
+            ]
+        )
+        monkeypatch.undo()
+        await writer.update("b", {"watched": False})
+        await writer.delete("c")
+        await writer.create(make_movie("c", title="AMELIE", release_year=2001))
+        assert (await reader.get_by_id("b")).version == 2
+        for repo in (writer, reader):
+            movies = await repo.get_by_title("Up", after="a")
+            assert [movie.id for movie in movies] == ["d"]
+            assert [
+                movie.id
+                for movie in await repo.get_by_title(
+                    "amelie", match=TitleMatch.NORMALIZED
+                )
+            ] == ["b", "c"]
+            assert await repo.autocomplete("a", limit=2) == ["Alien", "AMELIE"]
+            assert sorted([movie_id async for movie_id in repo.iter_ids()]) == list(
+                "abcde"
+            )
+        for movie_filter, sort, after in [
+            (MovieFilter(), MovieSort.RELEASE_YEAR_ASC, None),
+            (MovieFilter(), MovieSort.TITLE_DESC, ("Up", "d")),
+            (MovieFilter(min_release_year=2000), MovieSort.RELEASE_YEAR_DESC, None),
+            (MovieFilter(title="Up"), MovieSort.RELEASE_YEAR_ASC, (1990, "d")),
+            (MovieFilter(min_id="b", max_id="d"), MovieSort.ID_DESC, ("c", "c")),
+            (MovieFilter(watched=False), MovieSort.ID_ASC, None),
+            (MovieFilter(watched=False), MovieSort.ID_DESC, ("d", "d")),
+            (MovieFilter(watched=True), MovieSort.TITLE_ASC, None),
+        ]:
+            expected = await writer.find(movie_filter, sort=sort, after=after, limit=3)
+            movies = await reader.find(movie_filter, sort=sort, after=after, limit=3)
+            assert [movie.id for movie in movies] == [movie.id for movie in expected]
+
+
+@pytest.mark.asyncio
+async def test_close_with_open_connection_logs_nothing(tmp_path, caplog):
+    writer = SharedMemoryMovieRepository(str(tmp_path), publish_interval=0)
+    await writer.initialize()
+    _, connection = await asyncio.open_unix_connection(
+        os.path.join(tmp_path, SOCKET_FILE)
+    )
+    # Lets the writer start serving the connection
+    await asyncio.sleep(0.01)
+    with caplog.at_level(logging.ERROR, logger="asyncio"):
+        await writer.close()
+        connection.close()
+        await asyncio.sleep(0)
+    assert not caplog.records
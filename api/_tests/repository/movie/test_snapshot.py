@@ -0,0 +1,49 @@
+import pytest
+
+from api.entities.movie import Movie
+from api.repository.movie.snapshot import (SnapshotException, decode_snapshot,
+                                           encode_snapshot, read_snapshot,
+                                           write_snapshot)
+
+
+def _movies():
+    return [
+        Movie(
+            movie_id="my-id",
+            title="Amélie",
+            description="My Description",
+            release_year=2001,
+            watched=True,
+            version=3,
+        ),
+        Movie(
+            movie_id="other-id",
+            title="",
+            description=None,
+            release_year=None,
+        ),
+    ]
+
+
+def test_snapshot_round_trip(tmp_path):
+    path = str(tmp_path / "movies.snapshot")
+    write_snapshot(path, encode_snapshot(_movies(), lsn=42))
+    lsn, movies = read_snapshot(path)
+    assert lsn == 42
+    assert movies == _movies()
+    assert [movie.version for movie in movies] == [3, 1]
+    assert movies[1].description is None and movies[1].release_year is None
+
+
+@pytest.mark.parametrize(
+    "corrupt",
+    [
+        pytest.param(lambda data: data[:-1], id="truncated"),
+        pytest.param(lambda data: b"X" + data[1:], id="magic"),
+        pytest.param(lambda data: data[:40] + b"X" + data[41:], id="checksum"),
+    ],
+)
+def test_decode_snapshot_rejects_corruption(corrupt):
+    data = encode_snapshot(_movies(), lsn=1)
+    with pytest.raises(SnapshotException):
+        decode_snapshot(corrupt(data))
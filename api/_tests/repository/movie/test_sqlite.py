@@ -0,0 +1,110 @@
+import asyncio
+import time
+
+import pytest
+
+# noinspection PyUnresolvedReferences
+from api._tests.fixture import sqlite_movie_repo_fixture
+from api.entities.movie import Movie
+from api.repository.movie.abstractions import MovieFilter, MovieSort
+from api.repository.movie.sqlite import SqliteMovieRepository
+
+
+@pytest.mark.asyncio
+async def test_search_ranks_title_matches_first(sqlite_movie_repo_fixture):
+    for movie_id, title, description in (
+        ("a", "Casablanca", "A heist in Rome"),
+        ("b", "Rome", "My Description"),
+        ("c", "Amadeus", "My Description"),
+    ):
+        await sqlite_movie_repo_fixture.create(
+            Movie(
+                movie_id=movie_id,
+                title=title,
+                description=description,
+                release_year=1990,
+            )
+        )
+    result = await sqlite_movie_repo_fixture.search("rome")
+    assert [movie.id for movie in result] == ["b", "a"]
+    await sqlite_movie_repo_fixture.update("b", {"title": "Paris"})
+    await sqlite_movie_repo_fixture.delete("a")
+    assert await sqlite_movie_repo_fixture.search("rome") == []
+
+
+@pytest.mark.asyncio
+async def test_search_without_full_text_search(tmp_path):
+    path = str(tmp_path / "movies.db")
+    repo = SqliteMovieRepository(path, full_text_search=False)
+    await repo.create(
+        Movie(
+            movie_id="a",
+            title="The Godfather",
+            description="My Description",
+            release_year=1972,
+        )
+    )
+    assert [movie.id for movie in await repo.search("godfather")] == ["a"]
+    await repo.close()
+    # Movies written meanwhile are indexed once it is enabled
+    repo = SqliteMovieRepository(path)
+    assert [movie.id for movie in await repo.search("godfather")] == ["a"]
+    await repo.close()
+
+
+@pytest.mark.asyncio
+async def test_wal_mode(sqlite_movie_repo_fixture):
+    await sqlite_movie_repo_fixture.initialize()
+    # noinspection PyProtectedMember
+    rows = await sqlite_movie_repo_fixture._read("PRAGMA journal_mode", ())
+    assert rows[0][0] == "wal"
+
+
+@pytest.mark.parametrize(
+    "movie_filter,sort,after",
+    [
+        pytest.param(MovieFilter(), MovieSort.RELEASE_YEAR_ASC, None, id="all"),
+        pytest.param(
+            MovieFilter(title="My Movie"), MovieSort.ID_DESC, (None, "a"), id="title"
+        ),
+        pytest.param(
+            MovieFilter(watched=True, min_release_year=1990),
+            MovieSort.RELEASE_YEAR_DESC,
+            (1995, "a"),
+            id="watched",
+        ),
+        pytest.param(
+            MovieFilter(title="My Movie", max_release_year=2000),
+            MovieSort.RELEASE_YEAR_ASC,
+            None,
+            id="title_release_year",
+        ),
+    ],
+)
+@pytest.mark.asyncio
+async def test_find_uses_indexes(sqlite_movie_repo_fixture, movie_filter, sort, after):
+    await sqlite_movie_repo_fixture.initialize()
+    # noinspection PyProtectedMember
+    sql, params = sqlite_movie_repo_fixture._find_query(
+        movie_filter, sort, 0, 10, after, None
+    )
+    # noinspection PyProtectedMember
+    plan = await sqlite_movie_repo_fixture._read(f"EXPLAIN QUERY PLAN {sql}", params)
+    details = [row["detail"] for row in plan]
+    assert all("INDEX" in detail for detail in details if detail.startswith("SCAN"))
+    assert not any("TEMP B-TREE" in detail for detail in details)
+
+
+@pytest.mark.asyncio
+async def test_close_does_not_block_the_loop(tmp_path):
+    repo = SqliteMovieRepository(str(tmp_path / "movies.db"))
+    await repo.initialize()
+    running = asyncio.ensure_future(repo._write(lambda connection: time.sleep(0.2)))
+    await asyncio.sleep(0.01)
+    closing = asyncio.ensure_future(repo.close())
+    ticks = 0
+    while not closing.done():
+        ticks += 1
+        await asyncio.sleep(0.01)
+    await running
+    assert ticks > 5
@@ -0,0 +1,91 @@
+import asyncio
+import os
+
+import pytest
+
+from api.repository.movie.wal import WriteAheadLog
+
+
+@pytest.mark.asyncio
+async def test_records_survive_reopen(tmp_path):
+    wal = WriteAheadLog(str(tmp_path), fsync_interval=0)
+    assert wal.open() == []
+    wal.append({"op": "delete", "id": "a"})
+    wal.append({"op": "delete", "id": "b"})
+    await wal.sync()
+    await wal.close()
+    wal = WriteAheadLog(str(tmp_path))
+    assert wal.open(after_lsn=1) == [(2, {"op": "delete", "id": "b"})]
+    assert wal.lsn == 2
+    await wal.close()
+
+
+@pytest.mark.asyncio
+async def test_torn_record_is_truncated(tmp_path):
+    wal = WriteAheadLog(str(tmp_path))
+    wal.open()
+    wal.append({"op": "delete", "id": "a"})
+    wal.append({"op": "delete", "id": "b"})
+    await wal.close()
+    [segment] = os.listdir(tmp_path)
+    path = os.path.join(tmp_path, segment)
+    size = os.path.getsize(path)
+    with open(path, "r+b") as f:
+        f.truncate(size - 3)
+    wal = WriteAheadLog(str(tmp_path))
+    assert [lsn for lsn, _ in wal.open()] == [1]
+    wal.append({"op": "delete", "id": "c"})
+    await wal.close()
+    wal = WriteAheadLog(str(tmp_path))
+    assert wal.open() == [
+        (1, {"op": "delete", "id": "a"}),
+        (2, {"op": "delete", "id": "c"}),
+    ]
+    await wal.close()
+
+
+@pytest.mark.asyncio
+async def test_rotate_and_remove(tmp_path):
+    wal = WriteAheadLog(str(tmp_path))
+    wal.open()
+    wal.append({"op": "delete", "id": "a"})
+    assert await wal.rotate() == 1
+    wal.append({"op": "delete", "id": "b"})
+    wal.remove_through(1)
+    await wal.close()
+    assert len(os.listdir(tmp_path)) == 1
+    wal = WriteAheadLog(str(tmp_path))
+    assert wal.open(after_lsn=1) == [(2, {"op": "delete", "id": "b"})]
+    await wal.close()
+
+
+@pytest.mark.asyncio
+async def test_append_during_rotate(tmp_path):
+    wal = WriteAheadLog(str(tmp_path))
+    wal.open()
+    wal.append({"op": "delete", "id": "a"})
+    synced = asyncio.ensure_future(wal.sync())
+    rotation = asyncio.ensure_future(wal.rotate())
+    await asyncio.sleep(0)
+    wal.append({"op": "delete", "id": "b"})
+    assert await rotation == 1
+    await synced
+    await wal.sync()
+    await wal.close()
+    assert len(os.listdir(tmp_path)) == 2
+    wal = WriteAheadLog(str(tmp_path))
+    assert wal.open(after_lsn=1) == [(2, {"op": "delete", "id": "b"})]
+    await wal.close()
+
+
+@pytest.mark.asyncio
+async def test_close_waits_for_running_flush(tmp_path):
+    wal = WriteAheadLog(str(tmp_path), fsync_interval=0)
+    wal.open()
+    wal.append({"op": "delete", "id": "a"})
+    synced = asyncio.ensure_future(wal.sync())
+    while not wal._flushes:
+        await asyncio.sleep(0)
+    await wal.close()
+    assert not wal._flushes
+    await synced
@@ -0,0 +1,276 @@
+import asyncio
+
+import pytest
+from prometheus_client import REGISTRY
+
+from api._tests.fixture import make_movie
+from api.repository.movie.abstractions import (MovieFilter,
+                                               RepositoryException,
+                                               VersionConflictException)
+from api.repository.movie.memory import MemoryMovieRepository
+from api.repository.movie.write_behind import WriteBehindMovieRepository
+
+
+class CountingMovieRepository(MemoryMovieRepository):
+    def __init__(self):
+        super().__init__()
+        self.bulk_creates = []
+        self.bulk_updates = []
+        self.fail = False
+        self.fail_updates = False
+        # IDs whose creates are rejected one by one
+        self.rejected = set()
+        # Cleared to hold bulk writes until set
+        self.gate = asyncio.Event()
+        self.gate.set()
+        self.reads = 0
+
+    async def get_by_id(self, movie_id, fields=None):
+        self.reads += 1
+        return await super().get_by_id(movie_id, fields=fields)
+
+    async def bulk_create(self, movies, ordered=False):
+        await self.gate.wait()
+        if self.fail:
+            raise RepositoryException("unavailable")
+        self.bulk_creates.append([movie.id for movie in movies])
+        results = await super().bulk_create(
+            [movie for movie in movies if movie.id not in self.rejected],
+            ordered=ordered,
+        )
+        results = iter(results)
+        return [
+            "rejected" if movie.id in self.rejected else next(results)
+            for movie in movies
+        ]
+
+    async def bulk_update(self, updates, ordered=False):
+        await self.gate.wait()
+        if self.fail or self.fail_updates:
+            raise RepositoryException("unavailable")
+        self.bulk_updates.append(list(updates))
+        return await super().bulk_update(updates, ordered=ordered)
+
+
+@pytest.mark.asyncio
+async def test_updates_are_merged_into_one_bulk_write():
+    backend = CountingMovieRepository()
+    await backend.create(make_movie("a"))
+    repo = WriteBehindMovieRepository(backend, window=60)
+    await repo.create(make_movie("b"))
+    for watched in (True, False, True):
+        await repo.update("a", {"watched": watched})
+    await repo.update("b", {"title": "Other"})
+    assert backend.bulk_creates == [] and backend.bulk_updates == []
+    await repo.flush()
+    assert backend.bulk_creates == [["b"]]
+    assert backend.bulk_updates == [[("a", {"watched": True})]]
+    assert (await backend.get_by_id("a")).version == 2
+    assert (await backend.get_by_id("b")).title == "Other"
+
+
+@pytest.mark.asyncio
+async def test_reads_own_writes():
+    backend = CountingMovieRepository()
+    await backend.create(make_movie("a"))
+    repo = WriteBehindMovieRepository(backend, window=60)
+    await repo.update("a", {"watched": True})
+    await repo.create(make_movie("b"))
+    movie = await repo.get_by_id("a")
+    assert movie.watched is True
+    assert movie.version == 2
+    assert (await repo.get_by_id("a", fields=["title"])).watched is None
+    assert set(await repo.get_many(["a", "b", "missing"])) == {"a", "b"}
+    assert (await backend.get_by_id("a")).watched is False
+    # Queries flush first
+    assert len(await repo.find(MovieFilter(watched=True))) == 1
+    assert (await backend.get_by_id("a")).watched is True
+
+
+@pytest.mark.asyncio
+async def test_read_state_keeps_its_version():
+    backend = CountingMovieRepository()
+    await backend.create(make_movie("a"))
+    repo = WriteBehindMovieRepository(backend, window=60)
+    await repo.update("a", {"watched": True})
+    assert (await repo.get_by_id("a")).version == 2
+    await repo.update("a", {"watched": False})
+    movie = await repo.get_by_id("a")
+    assert (movie.watched, movie.version) == (False, 3)
+    await repo.flush()
+    assert (await backend.get_by_id("a")).version == 3
+
+
+@pytest.mark.asyncio
+async def test_known_movies_are_updated_without_reads():
+    backend = CountingMovieRepository()
+    await backend.create(make_movie("a"))
+    repo = WriteBehindMovieRepository(backend, window=60)
+    for watched in (True, False):
+        await repo.update("a", {"watched": watched})
+        await repo.flush()
+    await repo.create(make_movie("b"))
+    await repo.flush()
+    await repo.update("b", {"watched": True})
+    assert backend.reads == 1
+    await repo.delete("a")
+    with pytest.raises(RepositoryException):
+        await repo.update("a", {"watched": True})
+
+
+@pytest.mark.asyncio
+async def test_update_missing_movie():
+    repo = WriteBehindMovieRepository(CountingMovieRepository(), window=60)
+    with pytest.raises(RepositoryException):
+        await repo.update("missing", {"watched": True})
+    with pytest.raises(RepositoryException):
+        await repo.update("missing", {"id": "other"})
+
+
+@pytest.mark.asyncio
+async def test_expected_version_writes_through():
+    backend = CountingMovieRepository()
+    await backend.create(make_movie("a"))
+    repo = WriteBehindMovieRepository(backend, window=60)
+    await repo.update("a", {"watched": True})
+    with pytest.raises(VersionConflictException):
+        await repo.update("a", {"watched": False}, expected_version=1)
+    await repo.update("a", {"watched": False}, expected_version=2)
+    assert (await backend.get_by_id("a")).version == 3
+
+
+@pytest.mark.asyncio
+async def test_delete_drops_buffered_writes():
+    backend = CountingMovieRepository()
+    repo = WriteBehindMovieRepository(backend, window=60)
+    await repo.create(make_movie("a"))
+    assert await repo.delete("a") is True
+    assert await repo.get_by_id("a") is None
+    await repo.flush()
+    assert backend.bulk_creates == []
+
+
+@pytest.mark.asyncio
+async def test_flushes_after_window():
+    backend = CountingMovieRepository()
+    repo = WriteBehindMovieRepository(backend, window=0.01)
+    await repo.create(make_movie("a"))
+    await asyncio.sleep(0.05)
+    assert await backend.get_by_id("a") == make_movie("a")
+
+
+@pytest.mark.asyncio
+async def test_backpressure():
+    backend = CountingMovieRepository()
+    repo = WriteBehindMovieRepository(backend, window=60, max_pending=2)
+    for movie_id in ("a", "b", "c"):
+        await repo.create(make_movie(movie_id))
+    assert backend.bulk_creates == [["a", "b"]]
+    await repo.close()
+    assert backend.bulk_creates == [["a", "b"], ["c"]]
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_is_retried():
+    backend = CountingMovieRepository()
+    await backend.create(make_movie("a"))
+    repo = WriteBehindMovieRepository(backend, window=60)
+    await repo.update("a", {"watched": True})
+    backend.fail = True
+    with pytest.raises(RepositoryException):
+        await repo.flush()
+    await repo.update("a", {"title": "Other"})
+    backend.fail = False
+    await repo.close()
+    movie = await backend.get_by_id("a")
+    assert (movie.title, movie.watched) == ("Other", True)
+
+
+@pytest.mark.asyncio
+async def test_cancelled_flush_keeps_writes():
+    backend = CountingMovieRepository()
+    repo = WriteBehindMovieRepository(backend, window=60)
+    await repo.create(make_movie("a"))
+    backend.gate.clear()
+    query = asyncio.ensure_future(repo.get_by_title("My Movie"))
+    await asyncio.sleep(0)
+    query.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await query
+    backend.gate.set()
+    await repo.close()
+    assert backend.bulk_creates == [["a"]]
+    assert await backend.get_by_id("a") == make_movie("a")
+
+
+@pytest.mark.asyncio
+async def test_cancelled_failing_flush_is_retried():
+    backend = CountingMovieRepository()
+    repo = WriteBehindMovieRepository(backend, window=60)
+    await repo.create(make_movie("a"))
+    backend.gate.clear()
+    backend.fail = True
+    query = asyncio.ensure_future(repo.get_by_title("My Movie"))
+    await asyncio.sleep(0)
+    query.cancel()
+    backend.gate.set()
+    with pytest.raises(asyncio.CancelledError):
+        await query
+    await asyncio.sleep(0)
+    backend.fail = False
+    await repo.close()
+    assert await backend.get_by_id("a") == make_movie("a")
+
+
+@pytest.mark.asyncio
+async def test_failed_updates_keep_written_creates():
+    backend = CountingMovieRepository()
+    await backend.create(make_movie("a"))
+    repo = WriteBehindMovieRepository(backend, window=60)
+    await repo.create(make_movie("b"))
+    await repo.update("a", {"watched": True})
+    backend.fail_updates = True
+    with pytest.raises(RepositoryException):
+        await repo.flush()
+    backend.fail_updates = False
+    await repo.close()
+    assert backend.bulk_creates == [["b"]]
+    assert (await backend.get_by_id("b")).version == 1
+    assert (await backend.get_by_id("a")).watched
+
+
+def _failures(kind: str) -> float:
+    return (
+        REGISTRY.get_sample_value(
+            "movie_repository_write_behind_failures_total", {"kind": kind}
+        )
+        or 0
+    )
+
+
+@pytest.mark.asyncio
+async def test_failures_are_counted():
+    backend = CountingMovieRepository()
+    repo = WriteBehindMovieRepository(backend, window=60)
+    backend.rejected.add("a")
+    flushes, writes = _failures("flush"), _failures("write")
+    await repo.create(make_movie("a"))
+    await repo.create(make_movie("b"))
+    backend.fail = True
+    with pytest.raises(RepositoryException):
+        await repo.flush()
+    backend.fail = False
+    await repo.flush()
+    assert (_failures("flush"), _failures("write")) == (flushes + 1, writes + 1)
+    assert await backend.get_by_id("a") is None
+    assert await backend.get_by_id("b") is not None
+
+
+@pytest.mark.asyncio
+async def test_update_many_flushes_first():
+    backend = CountingMovieRepository()
+    repo = WriteBehindMovieRepository(backend, window=60)
+    await repo.create(make_movie("a"))
+    result = await repo.update_many(MovieFilter(title="My Movie"), {"watched": True})
+    assert (result.matched, result.modified) == (1, 1)
+    assert (await repo.get_by_id("a")).watched
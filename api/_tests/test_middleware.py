@@ -0,0 +1,153 @@
+import functools
+
+import pytest
+from starlette.testclient import TestClient
+
+from api.api import create_app
+from api.entities.movie import Movie
+from api.handlers.movie_v1 import movie_repository
+from api.middleware import ResponseCache, etag_matches, surrogate_keys
+from api.repository.movie.memory import MemoryMovieRepository
+from api.settings import Settings, settings_instance
+
+
+def memory_repository_dependency(dependency):
+    return dependency
+
+
+@pytest.fixture()
+def cached_test_client():
+    settings: Settings = settings_instance()
+    settings.enable_metrics = False
+    settings.enable_response_cache = True
+    client = TestClient(app=create_app())
+    client.auth = ("Bruce", "basic")
+    yield client
+    settings.enable_response_cache = False
+
+
+def test_surrogate_keys():
+    assert (
+        surrogate_keys(movie_ids=["my-id"], titles=["My Movie"], all_movies=True)
+        == "movie:my-id title:My%20Movie movies"
+    )
+
+
+@pytest.mark.parametrize(
+    "if_none_match,expected_result",
+    [
+        pytest.param(None, False, id="missing"),
+        pytest.param('"1"', True, id="same"),
+        pytest.param('W/"1"', True, id="weak"),
+        pytest.param('"2", "1"', True, id="list"),
+        pytest.param("*", True, id="any"),
+        pytest.param('"2"', False, id="different"),
+    ],
+)
+def test_etag_matches(if_none_match, expected_result):
+    assert etag_matches(if_none_match, '"1"') is expected_result
+
+
+def test_response_cache_purge():
+    cache = ResponseCache()
+    cache.set(("a",), (200, [], b"a"), ["movie:1", "title:x"])
+    cache.set(("b",), (200, [], b"b"), ["title:x"])
+    cache.purge(["movie:1"])
+    assert cache.get(("a",)) is None
+    assert cache.get(("b",)) == (200, [], b"b")
+    cache.purge(["title:x"])
+    assert cache.get(("b",)) is None
+
+
+def test_response_cache_purge_everything():
+    cache = ResponseCache()
+    cache.set(("a",), (200, [], b"a"), ["movie:1"])
+    cache.purge([surrogate_keys(everything=True)])
+    assert cache.get(("a",)) is None
+    cache.set(("a",), (200, [], b"a"), ["movie:1"])
+    assert cache.get(("a",)) == (200, [], b"a")
+
+
+@pytest.mark.asyncio
+async def test_get_movie_served_from_cache_until_purged(cached_test_client):
+    repo = MemoryMovieRepository()
+    patched_dependency = functools.partial(memory_repository_dependency, repo)
+    cached_test_client.app.dependency_overrides[movie_repository] = patched_dependency
+    await repo.create(
+        Movie(
+            movie_id="test-id",
+            title="My Movie",
+            description="My Description",
+            release_year=1990,
+        )
+    )
+    result = cached_test_client.get("/api/v1/movies/test-id")
+    assert result.status_code == 200
+    assert "surrogate-key" not in result.headers
+    # Changed behind the API, so the cached bytes are still served
+    await repo.update("test-id", {"release_year": 2000})
+    result = cached_test_client.get("/api/v1/movies/test-id")
+    assert result.json()["release_year"] == 1990
+    result = cached_test_client.patch(
+        "/api/v1/movies/test-id", json={"description": "Test Description"}
+    )
+    assert result.status_code == 200
+    result = cached_test_client.get("/api/v1/movies/test-id")
+    assert result.json()["release_year"] == 2000
+    assert result.json()["description"] == "Test Description"
+
+
+@pytest.mark.asyncio
+async def test_title_list_purged_on_create(cached_test_client):
+    repo = MemoryMovieRepository()
+    patched_dependency = functools.partial(memory_repository_dependency, repo)
+    cached_test_client.app.dependency_overrides[movie_repository] = patched_dependency
+    assert cached_test_client.get("/api/v1/movies/?title=My Movie").json() == []
+    result = cached_test_client.post(
+        "/api/v1/movies/",
+        json={"title": "My Movie", "description": "Test", "release_year": 2000},
+    )
+    assert result.status_code == 201
+    assert len(cached_test_client.get("/api/v1/movies/?title=My Movie").json()) == 1
+
+
+@pytest.mark.asyncio
+async def test_cached_response_not_modified(cached_test_client):
+    repo = MemoryMovieRepository()
+    patched_dependency = functools.partial(memory_repository_dependency, repo)
+    cached_test_client.app.dependency_overrides[movie_repository] = patched_dependency
+    await repo.create(
+        Movie(
+            movie_id="test-id",
+            title="My Movie",
+            description="My Description",
+            release_year=1990,
+        )
+    )
+    etag = cached_test_client.get("/api/v1/movies/test-id").headers["ETag"]
+    result = cached_test_client.get(
+        "/api/v1/movies/test-id", headers={"If-None-Match": etag}
+    )
+    assert result.status_code == 304
+    assert result.headers["ETag"] == etag
+
+
+@pytest.mark.asyncio
+async def test_get_movie_purged_on_update_by_filter(cached_test_client):
+    repo = MemoryMovieRepository()
+    patched_dependency = functools.partial(memory_repository_dependency, repo)
+    cached_test_client.app.dependency_overrides[movie_repository] = patched_dependency
+    await repo.create(
+        Movie(
+            movie_id="test-id",
+            title="My Movie",
+            description="My Description",
+            release_year=1990,
+        )
+    )
+    assert cached_test_client.get("/api/v1/movies/test-id").json()["watched"] is False
+    result = cached_test_client.patch(
+        "/api/v1/movies/filter?min_release_year=1980", json={"watched": True}
+    )
+    assert result.json() == {"matched": 1, "modified": 1}
+    assert cached_test_client.get("/api/v1/movies/test-id").json()["watched"] is True
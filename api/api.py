@@ -2,13 +2,26 @@ from fastapi import FastAPI
 from starlette.middleware.cors import CORSMiddleware
 
 from api.handlers import demo, movie_v1
-from api.middleware import CustomHeaderMiddleware, PrometheusMiddleware
+from api.middleware import (CustomHeaderMiddleware, PrometheusMiddleware,
+                            ResponseCache, ResponseCacheMiddleware)
+from api.settings import Settings, settings_instance
 
 
 def create_app():
     app = FastAPI(docs_url="/")
+    settings: Settings = settings_instance()
 
     # Middleware
+    if settings.enable_response_cache:
+        # Added first so it runs inside CORS, which depends on the request origin
+        app.add_middleware(
+            ResponseCacheMiddleware,
+            cache=ResponseCache(
+                max_size=settings.response_cache_max_size,
+                ttl=settings.response_cache_ttl_seconds,
+            ),
+            path_prefix=movie_v1.router.prefix,
+        )
     app.add_middleware(
         CORSMiddleware,
         allow_origins=["*"],
@@ -0,0 +1,68 @@
+import json
+import typing
+
+from starlette.responses import Response
+
+from api.entities.movie import Movie
+from api.repository.movie.abstractions import Fields
+
+# Same output as starlette's JSONResponse, built once instead of per call
+_encoder = json.JSONEncoder(
+    ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+)
+
+
+# Fields of MovieResponse in output order
+_RESPONSE_FIELDS = ("id", "title", "description", "release_year", "watched")
+
+
+def movie_dict(movie: Movie, fields: Fields = None) -> dict:
+    """
+    Plain dict with the fields of MovieResponse, or only ID and the given
+    fields if any
+    """
+    if fields is not None:
+        return {
+            field: getattr(movie, field)
+            for field in _RESPONSE_FIELDS
+            if field == "id" or field in fields
+        }
+    return {
+        "id": movie.id,
+        "title": movie.title,
+        "description": movie.description,
+        "release_year": movie.release_year,
+        "watched": movie.watched,
+    }
+
+
+def encode_movie(movie: Movie, fields: Fields = None) -> bytes:
+    return _encoder.encode(movie_dict(movie, fields)).encode("utf-8")
+
+
+def encode_movies(movies: typing.Iterable[Movie], fields: Fields = None) -> bytes:
+    return _encoder.encode([movie_dict(movie, fields) for movie in movies]).encode(
+        "utf-8"
+    )
+
+
+def encode_movies_by_ids(
+    movies: typing.Iterable[Movie], missing: typing.List[str]
+) -> bytes:
+    """
+    Encodes a MoviesByIdsResponse
+    """
+    return _encoder.encode(
+        {"movies": [movie_dict(movie) for movie in movies], "missing": missing}
+    ).encode("utf-8")
+
+
+class EncodedJSONResponse(Response):
+    """
+    Response for JSON already encoded to bytes.
+
+    Returning it from a handler skips response_model validation, so it is only
+    meant for trusted data such as movies read from the repository
+    """
+
+    media_type = "application/json"
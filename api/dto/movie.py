@@ -1,6 +1,9 @@
 import typing
 
-from pydantic import BaseModel, validator
+from pydantic import BaseModel, root_validator, validator
+
+MAX_BULK_OPERATIONS = 5000
+MAX_BATCH_IDS = 1000
 
 
 class CreateMovieBody(BaseModel):
@@ -48,3 +51,63 @@ class MovieUpdateBody(BaseModel):
     description: typing.Optional[str] = None
     release_year: typing.Optional[int] = None
     watched: typing.Optional[bool] = None
+
+
+class MoviesUpdatedResponse(BaseModel):
+    matched: int
+    modified: int
+
+
+class BulkMovieUpdate(MovieUpdateBody):
+    id: str
+
+
+class BulkMoviesBody(BaseModel):
+    """
+    Used as body for bulk_movies endpoint
+    """
+
+    ordered: bool = False
+    create: typing.List[CreateMovieBody] = []
+    update: typing.List[BulkMovieUpdate] = []
+    delete: typing.List[str] = []
+
+    @root_validator(skip_on_failure=True)
+    def operations_le_max(cls, values):
+        total = sum(len(values[key]) for key in ("create", "update", "delete"))
+        if total > MAX_BULK_OPERATIONS:
+            raise ValueError(
+                f"At most {MAX_BULK_OPERATIONS} operations are allowed per request."
+            )
+        return values
+
+
+class BulkItemResponse(BaseModel):
+    id: str
+    success: bool
+    message: typing.Optional[str] = None
+
+
+class BulkMoviesResponse(BaseModel):
+    create: typing.List[BulkItemResponse]
+    update: typing.List[BulkItemResponse]
+    delete: typing.List[BulkItemResponse]
+
+
+class MovieIdsBody(BaseModel):
+    """
+    Used as body for get_movies_by_ids endpoint
+    """
+
+    ids: typing.List[str]
+
+    @validator("ids")
+    def ids_le_max(cls, v):
+        if len(v) > MAX_BATCH_IDS:
+            raise ValueError(f"At most {MAX_BATCH_IDS} IDs are allowed per request.")
+        return v
+
+
+class MoviesByIdsResponse(BaseModel):
+    movies: typing.List[MovieResponse]
+    missing: typing.List[str]
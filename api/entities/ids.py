@@ -0,0 +1,88 @@
+import os
+import threading
+import time
+import typing
+import uuid
+
+_VERSION_7 = 0x7 << 76
+_VARIANT = 0b10 << 62
+_COUNTER_MAX = 0xFFF
+_RANDOM_MAX = (1 << 62) - 1
+# Largest millisecond timestamp of the 48 bit field
+_TIMESTAMP_MAX = (1 << 48) - 1
+
+
+def uuid4_id() -> str:
+    return str(uuid.uuid4())
+
+
+class Uuid7Generator:
+    """
+    Generates UUIDv7 strings, which sort by creation time.
+
+    The 12 bits after the millisecond timestamp are a counter, seeded randomly
+    each millisecond, so IDs are strictly increasing within a process even if
+    the clock goes backwards
+    """
+
+    def __init__(self, clock: typing.Callable[[], int] = time.time_ns):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._last_ms = -1
+        self._counter = 0
+
+    def __call__(self) -> str:
+        random_bits = int.from_bytes(os.urandom(10), "big")
+        with self._lock:
+            now_ms = self._clock() // 1_000_000
+            if now_ms > self._last_ms:
+                self._last_ms = now_ms
+                # Leaves room for at least 2048 more IDs in this millisecond
+                self._counter = random_bits >> 69
+            elif self._counter < _COUNTER_MAX:
+                self._counter += 1
+            else:
+                self._last_ms += 1
+                self._counter = 0
+            timestamp, counter = self._last_ms, self._counter
+        return str(
+            uuid.UUID(
+                int=timestamp << 80
+                | _VERSION_7
+                | counter << 64
+                | _VARIANT
+                | random_bits & _RANDOM_MAX
+            )
+        )
+
+
+def uuid7_bounds(
+    start_ms: typing.Optional[int], end_ms: typing.Optional[int]
+) -> typing.Tuple[typing.Optional[str], typing.Optional[str]]:
+    """
+    Lowest and highest UUIDv7 created within the given milliseconds, both
+    inclusive. Usable as an ID range to scan movies by creation time.
+    Milliseconds outside the UUIDv7 timestamp range are clamped to it
+    """
+    low = high = None
+    if start_ms is not None:
+        start_ms = min(max(start_ms, 0), _TIMESTAMP_MAX)
+        low = str(uuid.UUID(int=start_ms << 80 | _VERSION_7 | _VARIANT))
+    if end_ms is not None:
+        end_ms = min(max(end_ms, 0), _TIMESTAMP_MAX)
+        high = str(
+            uuid.UUID(
+                int=end_ms << 80
+                | _VERSION_7
+                | _COUNTER_MAX << 64
+                | _VARIANT
+                | _RANDOM_MAX
+            )
+        )
+    return low, high
+
+
+ID_GENERATORS: typing.Dict[str, typing.Callable[[], str]] = {
+    "uuid4": uuid4_id,
+    "uuid7": Uuid7Generator(),
+}
@@ -7,6 +7,7 @@ class Movie:
         description: str,
         release_year: int,
         watched: bool = False,
+        version: int = 1,
     ):
         if movie_id is None:
             raise ValueError("Movie ID is required")
@@ -15,6 +16,7 @@ class Movie:
         self._description = description
         self._release_year = release_year
         self._watched = watched
+        self._version = version
 
     @property
     def id(self) -> str:
@@ -36,6 +38,13 @@ class Movie:
     def watched(self) -> bool:
         return self._watched
 
+    @property
+    def version(self) -> int:
+        """
+        Incremented by the repository on every write. Not part of equality
+        """
+        return self._version
+
     def __str__(self):
         return f"{self.id}: {self.title} ({self.release_year}). {self.description}. Watched:{self.watched}"
 
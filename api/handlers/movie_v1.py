@@ -1,27 +1,52 @@
+import base64
+import binascii
 import dataclasses
+import datetime
+import hashlib
+import json
 import typing
-import uuid
 from collections import namedtuple
-from functools import lru_cache
+from functools import lru_cache, partial
 
 from fastapi import (APIRouter, Body, Depends, Header, HTTPException, Path,
                      Query)
 from fastapi.encoders import jsonable_encoder
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from jose import jwt, JWTError
-from starlette.responses import JSONResponse, Response
+from starlette.responses import JSONResponse, Response, StreamingResponse
 
 from api.dto.detail import DetailResponse
-from api.dto.movie import (CreateMovieBody, MovieCreatedResponse,
-                           MovieResponse, MovieUpdateBody)
+from api.dto.encoding import (EncodedJSONResponse, encode_movie, encode_movies,
+                              encode_movies_by_ids)
+from api.dto.movie import (BulkItemResponse, BulkMoviesBody,
+                           BulkMoviesResponse, CreateMovieBody,
+                           MovieCreatedResponse, MovieIdsBody, MovieResponse,
+                           MoviesByIdsResponse, MoviesUpdatedResponse,
+                           MovieUpdateBody)
+from api.entities.ids import ID_GENERATORS, uuid7_bounds
 from api.entities.movie import Movie
-from api.repository.movie.abstractions import (MovieRepository,
-                                               RepositoryException)
+from api.middleware import etag_matches, surrogate_keys
+from api.repository.movie.abstractions import (NOT_EXECUTED, BulkResult,
+                                               Keyset, MovieFilter,
+                                               MovieRepository, MovieSort,
+                                               RepositoryException, TitleMatch,
+                                               VersionConflictException)
+from api.repository.movie.bloom import BloomFilterMovieRepository
+from api.repository.movie.cache import CachingMovieRepository
+from api.repository.movie.coalescing import CoalescingMovieRepository
+from api.repository.movie.columnar import ColumnarMovieStore
+from api.repository.movie.durable import DurableMemoryMovieRepository
+from api.repository.movie.memory import MemoryMovieRepository
 from api.repository.movie.mongo import MongoMovieRepository
+from api.repository.movie.shared import SharedMemoryMovieRepository
+from api.repository.movie.sqlite import SqliteMovieRepository
+from api.repository.movie.write_behind import WriteBehindMovieRepository
 from api.settings import Settings, settings_instance
 
 http_basic = HTTPBasic()
 
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
 
 def basic_authentication(credentials: HTTPBasicCredentials = Depends(http_basic)):
     if credentials.username == "Bruce" and credentials.password == "basic":
@@ -54,15 +79,131 @@ router = APIRouter(
 )
 
 
+def memory_repository(settings: Settings) -> MemoryMovieRepository:
+    """
+    Memory backend configured by the settings
+    """
+    storage_factory = (
+        ColumnarMovieStore if settings.memory_storage == "columnar" else dict
+    )
+    if settings.memory_data_directory:
+        return DurableMemoryMovieRepository(
+            settings.memory_data_directory,
+            fsync_interval=settings.memory_fsync_interval_seconds,
+            snapshot_every=settings.memory_snapshot_every,
+            storage_factory=storage_factory,
+        )
+    return MemoryMovieRepository(storage_factory)
+
+
 @lru_cache()
 def movie_repository(settings: Settings = Depends(settings_instance)):
     """
     Movie repository to be used as a FastAPI dependency
     """
-    return MongoMovieRepository(
-        conn_string=settings.mongo_connection_string,
-        database=settings.mongo_database_name,
-    )
+    repository: MovieRepository
+    if settings.repository_backend == "memory":
+        repository = memory_repository(settings)
+    elif settings.repository_backend == "shared":
+        repository = SharedMemoryMovieRepository(
+            settings.shared_memory_directory,
+            repository_factory=partial(memory_repository, settings),
+            publish_interval=settings.shared_memory_publish_interval_seconds,
+        )
+    elif settings.repository_backend == "sqlite":
+        repository = SqliteMovieRepository(
+            settings.sqlite_path,
+            pool_size=settings.sqlite_pool_size,
+            full_text_search=settings.sqlite_full_text_search,
+        )
+    else:
+        repository = MongoMovieRepository(
+            conn_string=settings.mongo_connection_string,
+            database=settings.mongo_database_name,
+            ensure_indexes=settings.mongo_ensure_indexes,
+            verify_query_plans=settings.mongo_verify_query_plans,
+        )
+    if settings.enable_write_behind:
+        repository = WriteBehindMovieRepository(
+            repository,
+            window=settings.write_behind_window_seconds,
+            max_pending=settings.write_behind_max_pending,
+        )
+    if settings.enable_bloom_filter:
+        repository = BloomFilterMovieRepository(
+            repository,
+            capacity=settings.bloom_filter_capacity,
+            error_rate=settings.bloom_filter_error_rate,
+        )
+    if settings.enable_request_coalescing:
+        repository = CoalescingMovieRepository(
+            repository, max_batch_size=settings.coalescing_max_batch_size
+        )
+    if settings.enable_cache:
+        repository = CachingMovieRepository(
+            repository,
+            max_size=settings.cache_max_size,
+            ttl=settings.cache_ttl_seconds,
+            negative_ttl=settings.cache_negative_ttl_seconds,
+        )
+    return repository
+
+
+def movie_id_generator(
+    settings: Settings = Depends(settings_instance),
+) -> typing.Callable[[], str]:
+    """
+    Generator of new movie IDs to be used as a FastAPI dependency
+    """
+    return ID_GENERATORS[settings.movie_id_generator]
+
+
+@router.on_event("startup")
+async def initialize_repository():
+    """
+    Prepares the movie repository, e.g. creating database indexes
+    """
+    await movie_repository(settings_instance()).initialize()
+
+
+@router.on_event("startup")
+async def warm_up_cache():
+    """
+    Loads the movies which were hottest at the last shutdown into the cache
+    """
+    settings = settings_instance()
+    repo = movie_repository(settings)
+    if not isinstance(repo, CachingMovieRepository) or not settings.cache_warm_up_size:
+        return
+    try:
+        with open(settings.cache_warm_up_file) as f:
+            movie_ids = [line.strip() for line in f if line.strip()]
+    except FileNotFoundError:
+        return
+    await repo.warm_up(movie_ids[: settings.cache_warm_up_size])
+
+
+@router.on_event("shutdown")
+async def close_repository():
+    """
+    Releases the movie repository, e.g. flushing pending writes
+    """
+    await movie_repository(settings_instance()).close()
+
+
+@router.on_event("shutdown")
+async def save_hottest_movies():
+    """
+    Saves the hottest cached movie IDs for the next startup
+    """
+    settings = settings_instance()
+    repo = movie_repository(settings)
+    if not isinstance(repo, CachingMovieRepository) or not settings.cache_warm_up_size:
+        return
+    with open(settings.cache_warm_up_file, "w") as f:
+        f.writelines(
+            f"{movie_id}\n" for movie_id in repo.hottest(settings.cache_warm_up_size)
+        )
 
 
 def pagination_params(
@@ -70,20 +211,195 @@ def pagination_params(
     limit: int = Query(
         0, title="limit", description="Limit of items to to return", le=1000
     ),
+    cursor: typing.Optional[str] = Query(
+        None,
+        title="cursor",
+        description="Opaque cursor returned in the X-Next-Cursor header of the "
+        "previous page",
+    ),
+):
+    Pagination = namedtuple("Pagination", ["skip", "limit", "cursor"])
+    return Pagination(skip, limit, cursor)
+
+
+def encode_cursor(sort: str, keyset: Keyset) -> str:
+    """
+    Encodes the position after the last movie of a page as an opaque token
+    """
+    payload = json.dumps([sort, *keyset], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor: str, sort: str) -> Keyset:
+    """
+    Decodes a cursor produced by encode_cursor for the same sort order
+    """
+    try:
+        cursor_sort, value, movie_id = json.loads(
+            base64.urlsafe_b64decode(cursor.encode())
+        )
+    except (binascii.Error, TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail="invalid_cursor") from e
+    if cursor_sort != sort or not isinstance(movie_id, str):
+        raise HTTPException(status_code=400, detail="invalid_cursor")
+    # Anything else would fail to compare, or be taken as a query operator
+    value_type = int if MovieSort(sort).field == "release_year" else str
+    if not isinstance(value, value_type) or isinstance(value, bool):
+        raise HTTPException(status_code=400, detail="invalid_cursor")
+    return value, movie_id
+
+
+def set_next_cursor(
+    response: Response,
+    pagination,
+    sort: str,
+    movies: typing.List[Movie],
+    value: typing.Any = None,
+):
+    """
+    Sets the X-Next-Cursor header when the page is full.
+
+    The keyset holds value if given, else the sort field of the last movie
+    """
+    if pagination.limit == 0 or len(movies) < pagination.limit:
+        return
+    last = movies[-1]
+    if value is None:
+        value = getattr(last, MovieSort(sort).field)
+    response.headers["X-Next-Cursor"] = encode_cursor(sort, (value, last.id))
+
+
+def movie_filter_params(
+    title: typing.Optional[str] = Query(
+        None, title="Movie Title", description="Title of the movie.", min_length=3
+    ),
+    min_release_year: typing.Optional[int] = Query(
+        None, title="Minimum Release Year", description="Inclusive lower bound"
+    ),
+    max_release_year: typing.Optional[int] = Query(
+        None, title="Maximum Release Year", description="Inclusive upper bound"
+    ),
+    watched: typing.Optional[bool] = Query(
+        None, title="Watched", description="Watched status of the movie."
+    ),
+    added_after: typing.Optional[datetime.datetime] = Query(
+        None,
+        title="Added After",
+        description="Inclusive lower bound of the creation time. Only meaningful "
+        "for movies with time ordered (uuid7) IDs",
+    ),
+    added_before: typing.Optional[datetime.datetime] = Query(
+        None,
+        title="Added Before",
+        description="Inclusive upper bound of the creation time. Only meaningful "
+        "for movies with time ordered (uuid7) IDs",
+    ),
 ):
-    Pagination = namedtuple("Pagination", ["skip", "limit"])
-    return Pagination(skip, limit)
+    min_id, max_id = uuid7_bounds(
+        int(added_after.timestamp() * 1000) if added_after else None,
+        int(added_before.timestamp() * 1000) if added_before else None,
+    )
+    return MovieFilter(
+        title=title,
+        min_release_year=min_release_year,
+        max_release_year=max_release_year,
+        watched=watched,
+        min_id=min_id,
+        max_id=max_id,
+    )
+
+
+def fields_params(
+    fields: typing.Optional[str] = Query(
+        None,
+        title="Fields",
+        description="Comma separated movie fields to return. The ID is always "
+        "returned",
+    ),
+) -> typing.Optional[typing.FrozenSet[str]]:
+    """
+    Parses a sparse fieldset, None if every field was requested
+    """
+    if fields is None:
+        return None
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    if not requested or not requested <= MovieResponse.__fields__.keys():
+        raise HTTPException(status_code=400, detail="invalid_fields")
+    return frozenset(requested - {"id"})
+
+
+def ndjson_requested(accept: typing.Optional[str] = Header(None)) -> bool:
+    """
+    True if the client asked for a newline delimited JSON stream
+    """
+    return accept is not None and NDJSON_MEDIA_TYPE in accept
+
+
+def ndjson_response(
+    movies: typing.AsyncIterator[Movie],
+    fields: typing.Optional[typing.FrozenSet[str]] = None,
+) -> StreamingResponse:
+    """
+    Streams movies one JSON document per line as they are read
+    """
+
+    async def lines():
+        async for movie in movies:
+            yield encode_movie(movie, fields) + b"\n"
+
+    return StreamingResponse(lines(), media_type=NDJSON_MEDIA_TYPE)
+
+
+def movie_etag(movie: Movie) -> str:
+    return f'"{movie.version}"'
+
+
+def movies_etag(movies: typing.List[Movie]) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    for movie in movies:
+        digest.update(f"{movie.id}:{movie.version};".encode())
+    return f'"{digest.hexdigest()}"'
+
+
+def not_modified(etag: str, response: Response) -> Response:
+    """
+    Empty 304 response keeping the headers already set on response
+    """
+    headers = {"ETag": etag}
+    if "X-Next-Cursor" in response.headers:
+        headers["X-Next-Cursor"] = response.headers["X-Next-Cursor"]
+    return Response(status_code=304, headers=headers)
+
+
+def parse_if_match(if_match: typing.Optional[str]) -> typing.Optional[int]:
+    """
+    Returns the movie version required by an If-Match header, None if any
+    version is accepted
+    """
+    if if_match is None or if_match.strip() == "*":
+        return None
+    value = if_match.strip()
+    if (
+        len(value) < 3
+        or value[0] != '"'
+        or value[-1] != '"'
+        or not value[1:-1].isdigit()
+    ):
+        raise HTTPException(status_code=412, detail="invalid_if_match")
+    return int(value[1:-1])
 
 
 @router.post("/", status_code=201, response_model=MovieCreatedResponse)
 async def create_movie(
+    response: Response,
     movie: CreateMovieBody = Body(..., title="Movie", description="Movie Details"),
+    new_movie_id: typing.Callable[[], str] = Depends(movie_id_generator),
     repo: MovieRepository = Depends(movie_repository),
 ):
     """
     Creates a movie
     """
-    movie_id = str(uuid.uuid4())
+    movie_id = new_movie_id()
     await repo.create(
         movie=Movie(
             movie_id=movie_id,
@@ -93,20 +409,229 @@ async def create_movie(
             watched=movie.watched,
         )
     )
+    response.headers["Surrogate-Key"] = surrogate_keys(
+        titles=[movie.title], all_movies=True
+    )
     return MovieCreatedResponse(id=movie_id)
 
 
+def bulk_item_responses(
+    movie_ids: typing.List[str], results: BulkResult
+) -> typing.List[BulkItemResponse]:
+    return [
+        BulkItemResponse(id=movie_id, success=error is None, message=error)
+        for movie_id, error in zip(movie_ids, results)
+    ]
+
+
+@router.post("/bulk", response_model=BulkMoviesResponse)
+async def bulk_movies(
+    response: Response,
+    body: BulkMoviesBody = Body(
+        ..., title="Bulk Body", description="Movies to create, update and delete"
+    ),
+    new_movie_id: typing.Callable[[], str] = Depends(movie_id_generator),
+    repo: MovieRepository = Depends(movie_repository),
+):
+    """
+    Creates, updates and deletes many movies in one request, in that order
+
+    If ordered, processing stops at the first failure and the remaining
+    operations are reported as not executed
+    """
+    movies = [
+        Movie(
+            movie_id=new_movie_id(),
+            title=movie.title,
+            description=movie.description,
+            release_year=movie.release_year,
+            watched=movie.watched,
+        )
+        for movie in body.create
+    ]
+    update_ids = [update.id for update in body.update]
+    create_results = await repo.bulk_create(movies, ordered=body.ordered)
+    if body.ordered and any(create_results):
+        update_results = [NOT_EXECUTED] * len(update_ids)
+    else:
+        update_results = await repo.bulk_update(
+            [
+                (
+                    update.id,
+                    update.dict(exclude={"id"}, exclude_unset=True, exclude_none=True),
+                )
+                for update in body.update
+            ],
+            ordered=body.ordered,
+        )
+    if body.ordered and any(update_results):
+        delete_results = [NOT_EXECUTED] * len(body.delete)
+    else:
+        delete_results = await repo.bulk_delete(body.delete, ordered=body.ordered)
+    response.headers["Surrogate-Key"] = surrogate_keys(
+        movie_ids=[*update_ids, *body.delete],
+        titles={
+            *(movie.title for movie in movies),
+            *(update.title for update in body.update if update.title is not None),
+        },
+        all_movies=True,
+    )
+    return BulkMoviesResponse(
+        create=bulk_item_responses([movie.id for movie in movies], create_results),
+        update=bulk_item_responses(update_ids, update_results),
+        delete=bulk_item_responses(body.delete, delete_results),
+    )
+
+
+@router.post("/lookup", response_model=MoviesByIdsResponse)
+async def get_movies_by_ids(
+    body: MovieIdsBody = Body(..., title="IDs", description="IDs of the movies"),
+    repo: MovieRepository = Depends(movie_repository),
+):
+    """
+    Returns the movies with the given IDs in request order, and the IDs
+    which were not found
+    """
+    # Duplicates are answered once, at their first position
+    movie_ids = list(dict.fromkeys(body.ids))
+    found = await repo.get_many(movie_ids)
+    return EncodedJSONResponse(
+        encode_movies_by_ids(
+            [found[movie_id] for movie_id in movie_ids if movie_id in found],
+            [movie_id for movie_id in movie_ids if movie_id not in found],
+        )
+    )
+
+
+@router.get("/autocomplete", response_model=typing.List[str])
+async def autocomplete_titles(
+    prefix: str = Query(
+        ..., title="Prefix", description="Beginning of the title", min_length=1
+    ),
+    limit: int = Query(
+        10, title="limit", description="Limit of titles to return", ge=1, le=50
+    ),
+    repo: MovieRepository = Depends(movie_repository),
+):
+    """
+    Returns titles starting with the prefix, ignoring case and diacritics
+    """
+    titles = await repo.autocomplete(prefix, limit=limit)
+    return JSONResponse(
+        titles,
+        headers={"Surrogate-Key": surrogate_keys(all_movies=True)},
+    )
+
+
+@router.get("/search", response_model=typing.List[MovieResponse])
+async def search_movies(
+    response: Response,
+    q: str = Query(
+        ...,
+        title="Query",
+        description="Words to look for in the title and description",
+        min_length=1,
+    ),
+    limit: int = Query(
+        20, title="limit", description="Limit of items to return", ge=1, le=100
+    ),
+    if_none_match: typing.Optional[str] = Header(None),
+    repo: MovieRepository = Depends(movie_repository),
+):
+    """
+    Returns the movies best matching the query, best matches first
+    """
+    movies = await repo.search(q, limit=limit)
+    etag = movies_etag(movies)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag, response)
+    response.headers["ETag"] = etag
+    response.headers["Surrogate-Key"] = surrogate_keys(
+        movie_ids=[movie.id for movie in movies], all_movies=True
+    )
+    return EncodedJSONResponse(encode_movies(movies), headers=dict(response.headers))
+
+
+@router.get(
+    "/filter",
+    response_model=typing.List[MovieResponse],
+    responses={200: {"content": {NDJSON_MEDIA_TYPE: {}}}},
+)
+async def filter_movies(
+    response: Response,
+    movie_filter: MovieFilter = Depends(movie_filter_params),
+    sort: MovieSort = Query(
+        MovieSort.RELEASE_YEAR_ASC,
+        title="Sort",
+        description="Sort field, prefixed with - for descending order. -id lists "
+        "recently added movies first when IDs are time ordered",
+    ),
+    pagination=Depends(pagination_params),
+    fields: typing.Optional[typing.FrozenSet[str]] = Depends(fields_params),
+    stream: bool = Depends(ndjson_requested),
+    if_none_match: typing.Optional[str] = Header(None),
+    repo: MovieRepository = Depends(movie_repository),
+):
+    """
+    Returns a list of movies matching all given filters in the requested order
+
+    Streams the movies as application/x-ndjson if requested in the Accept header
+    """
+    after = None
+    if pagination.cursor is not None:
+        after = decode_cursor(pagination.cursor, sort.value)
+    if stream:
+        return ndjson_response(
+            repo.iter_find(
+                movie_filter=movie_filter,
+                sort=sort,
+                skip=pagination.skip,
+                limit=pagination.limit,
+                after=after,
+                fields=fields,
+            ),
+            fields,
+        )
+    movies = await repo.find(
+        movie_filter=movie_filter,
+        sort=sort,
+        skip=pagination.skip,
+        limit=pagination.limit,
+        after=after,
+        fields=fields,
+    )
+    set_next_cursor(response, pagination, sort.value, movies)
+    etag = movies_etag(movies)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag, response)
+    response.headers["ETag"] = etag
+    response.headers["Surrogate-Key"] = surrogate_keys(
+        movie_ids=[movie.id for movie in movies], all_movies=True
+    )
+    return EncodedJSONResponse(
+        encode_movies(movies, fields), headers=dict(response.headers)
+    )
+
+
 @router.get(
     "/{movie_id}",
-    responses={200: {"model": MovieResponse}, 404: {"model": DetailResponse}},
+    responses={
+        200: {"model": MovieResponse},
+        304: {"description": "Not Modified"},
+        404: {"model": DetailResponse},
+    },
 )
 async def get_movie_by_id(
-    movie_id: str, repo: MovieRepository = Depends(movie_repository)
+    response: Response,
+    movie_id: str,
+    fields: typing.Optional[typing.FrozenSet[str]] = Depends(fields_params),
+    if_none_match: typing.Optional[str] = Header(None),
+    repo: MovieRepository = Depends(movie_repository),
 ):
     """
     Returns a movie if found. None otherwise
     """
-    movie = await repo.get_by_id(movie_id=movie_id)
+    movie = await repo.get_by_id(movie_id=movie_id, fields=fields)
     if movie is None:
         return JSONResponse(
             status_code=404,
@@ -114,63 +639,166 @@ async def get_movie_by_id(
                 DetailResponse(message=f"Movie: {movie_id} not found")
             ),
         )
-    return MovieResponse(
-        id=movie_id,
-        title=movie.title,
-        description=movie.description,
-        release_year=movie.release_year,
-        watched=movie.watched,
+    etag = movie_etag(movie)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag, response)
+    response.headers["ETag"] = etag
+    response.headers["Surrogate-Key"] = surrogate_keys(
+        movie_ids=[movie_id], titles=[movie.title] if movie.title is not None else []
+    )
+    return EncodedJSONResponse(
+        encode_movie(movie, fields), headers=dict(response.headers)
     )
 
 
-@router.get("/", response_model=typing.List[MovieResponse])
+@router.get(
+    "/",
+    response_model=typing.List[MovieResponse],
+    responses={200: {"content": {NDJSON_MEDIA_TYPE: {}}}},
+)
 async def get_movies_by_title(
+    response: Response,
     title: str = Query(
         ..., title="Movie Title", description="Title of the movie.", min_length=3
     ),
+    match: TitleMatch = Query(
+        TitleMatch.EXACT,
+        title="Match",
+        description="normalized ignores case, accents and repeated whitespace",
+    ),
     pagination=Depends(pagination_params),
+    fields: typing.Optional[typing.FrozenSet[str]] = Depends(fields_params),
+    stream: bool = Depends(ndjson_requested),
+    if_none_match: typing.Optional[str] = Header(None),
     repo: MovieRepository = Depends(movie_repository),
 ):
     """
     Returns a list of movies with matching title if found. Empty list otherwise
+
+    Streams the movies as application/x-ndjson if requested in the Accept header
     """
+    # Movies sharing a title are ordered by ID, which is the title sort order
+    sort = MovieSort.TITLE_ASC.value
+    after = None
+    if pagination.cursor is not None:
+        _, after = decode_cursor(pagination.cursor, sort)
+    if stream:
+        return ndjson_response(
+            repo.iter_by_title(
+                title=title,
+                skip=pagination.skip,
+                limit=pagination.limit,
+                after=after,
+                fields=fields,
+                match=match,
+            ),
+            fields,
+        )
     movies = await repo.get_by_title(
-        title=title, skip=pagination.skip, limit=pagination.limit
+        title=title,
+        skip=pagination.skip,
+        limit=pagination.limit,
+        after=after,
+        fields=fields,
+        match=match,
     )
-    return_value = []
-    for movie in movies:
-        return_value.append(
-            MovieResponse(
-                id=movie.id,
-                title=movie.title,
-                description=movie.description,
-                release_year=movie.release_year,
-                watched=movie.watched,
-            )
+    # Only the ID is read back, the title may not even be loaded
+    set_next_cursor(response, pagination, sort, movies, value=title)
+    etag = movies_etag(movies)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag, response)
+    response.headers["ETag"] = etag
+    # Writes purge by exact title, so any write may change a normalized match
+    response.headers["Surrogate-Key"] = surrogate_keys(
+        movie_ids=[movie.id for movie in movies],
+        titles=[title],
+        all_movies=match == TitleMatch.NORMALIZED,
+    )
+    return EncodedJSONResponse(
+        encode_movies(movies, fields), headers=dict(response.headers)
+    )
+
+
+@router.patch(
+    "/filter",
+    response_model=MoviesUpdatedResponse,
+    responses={400: {"model": DetailResponse}},
+)
+async def patch_update_movies(
+    response: Response,
+    movie_filter: MovieFilter = Depends(movie_filter_params),
+    update_parameters: MovieUpdateBody = Body(
+        ..., title="Update Body", description="Parameters of the movies to be updated"
+    ),
+    repo: MovieRepository = Depends(movie_repository),
+):
+    """
+    Updates every movie matching all given filters in a single operation
+
+    Only movies which change are written. Returns how many movies matched and
+    how many changed
+    """
+    if movie_filter == MovieFilter():
+        # Updating every movie has to be asked for explicitly
+        return JSONResponse(
+            status_code=400,
+            content=jsonable_encoder(
+                DetailResponse(message="At least one filter is required")
+            ),
+        )
+    try:
+        result = await repo.update_many(
+            movie_filter,
+            update_parameters.dict(exclude_unset=True, exclude_none=True),
+        )
+    except RepositoryException as e:
+        return JSONResponse(
+            status_code=400, content=jsonable_encoder(DetailResponse(message=str(e)))
         )
-    return return_value
+    # The updated IDs are not known, so every cached response is purged
+    response.headers["Surrogate-Key"] = surrogate_keys(everything=True)
+    return MoviesUpdatedResponse(matched=result.matched, modified=result.modified)
 
 
 @router.patch(
     "/{movie_id}",
-    responses={200: {"model": DetailResponse}, 400: {"model": DetailResponse}},
+    responses={
+        200: {"model": DetailResponse},
+        400: {"model": DetailResponse},
+        412: {"model": DetailResponse},
+    },
 )
 async def patch_update_movie(
+    response: Response,
     movie_id: str = Path(..., title="Movie ID", description="The ID of the Movie"),
     update_parameters: MovieUpdateBody = Body(
         ..., title="Update Body", description="Parameters of the movie to be updated"
     ),
+    if_match: typing.Optional[str] = Header(None),
     repo: MovieRepository = Depends(movie_repository),
 ):
     """
     Updates a movie
+
+    With an If-Match header the update only applies to that version of the movie
     """
+    expected_version = parse_if_match(if_match)
     try:
         await repo.update(
             movie_id=movie_id,
             params=update_parameters.dict(exclude_unset=True, exclude_none=True),
+            expected_version=expected_version,
+        )
+        response.headers["Surrogate-Key"] = surrogate_keys(
+            movie_ids=[movie_id],
+            titles=[update_parameters.title] if update_parameters.title else [],
+            all_movies=True,
         )
         return DetailResponse(message=f"Movie: {movie_id} updated successfully")
+    except VersionConflictException as e:
+        return JSONResponse(
+            status_code=412, content=jsonable_encoder(DetailResponse(message=str(e)))
+        )
     except RepositoryException as e:
         return JSONResponse(
             status_code=400, content=jsonable_encoder(DetailResponse(message=str(e)))
@@ -183,4 +811,9 @@ async def delete_movie(
     repo: MovieRepository = Depends(movie_repository),
 ):
     await repo.delete(movie_id=movie_id)
-    return Response(status_code=204)
+    return Response(
+        status_code=204,
+        headers={
+            "Surrogate-Key": surrogate_keys(movie_ids=[movie_id], all_movies=True)
+        },
+    )
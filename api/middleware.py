@@ -1,9 +1,14 @@
+import functools
+import hashlib
+import typing
 from logging import getLogger
+from urllib.parse import quote
 
 from fastapi import FastAPI
 from prometheus_fastapi_instrumentator import Instrumentator
 from starlette.middleware.base import BaseHTTPMiddleware
 
+from api.repository.movie.cache import LruTtlCache
 from api.settings import Settings, settings_instance
 
 
@@ -31,3 +36,179 @@ class PrometheusMiddleware:
             Instrumentator().instrument(app).expose(app)
         else:
             logger.info("metrics disabled")
+
+
+SURROGATE_KEY_HEADER = b"surrogate-key"
+# Tagged on list responses whose membership may change on any write
+ALL_MOVIES_SURROGATE_KEY = "movies"
+# Purges every cached response, for writes whose affected movies are not known
+EVERYTHING_SURROGATE_KEY = "*"
+
+
+def surrogate_keys(
+    movie_ids: typing.Iterable[str] = (),
+    titles: typing.Iterable[str] = (),
+    all_movies: bool = False,
+    everything: bool = False,
+) -> str:
+    """
+    Formats the value of a Surrogate-Key header.
+
+    On GET responses the keys tag the cached response, on other responses
+    they name the keys to purge
+    """
+    keys = [f"movie:{quote(movie_id)}" for movie_id in movie_ids]
+    keys.extend(f"title:{quote(title)}" for title in titles)
+    if all_movies:
+        keys.append(ALL_MOVIES_SURROGATE_KEY)
+    if everything:
+        keys.append(EVERYTHING_SURROGATE_KEY)
+    return " ".join(keys)
+
+
+def etag_matches(if_none_match: typing.Optional[str], etag: str) -> bool:
+    """
+    Weak comparison of an If-None-Match header against an ETag
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag.removeprefix("W/") in candidates
+
+
+class ResponseCache:
+    """
+    Serialized responses tagged with surrogate keys
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 60.0):
+        self._ttl = ttl
+        self._responses = LruTtlCache(max_size, on_evict=self._untag)
+        self._tags: typing.Dict[str, typing.Set[tuple]] = {}
+        self._keys_tags: typing.Dict[tuple, typing.List[str]] = {}
+        # Bumped on every purge so responses racing a write are not cached
+        self.generation = 0
+
+    def _untag(self, key: tuple):
+        for tag in self._keys_tags.pop(key, ()):
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def get(self, key: tuple) -> typing.Optional[tuple]:
+        return self._responses.get(key)
+
+    def set(self, key: tuple, response: tuple, tags: typing.List[str]):
+        self._untag(key)
+        self._responses.set(key, response, self._ttl)
+        self._keys_tags[key] = tags
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(key)
+
+    def purge(self, tags: typing.Iterable[str]):
+        self.generation += 1
+        tags = list(tags)
+        if EVERYTHING_SURROGATE_KEY in tags:
+            self._responses.clear()
+            self._tags.clear()
+            self._keys_tags.clear()
+            return
+        for tag in tags:
+            for key in list(self._tags.get(tag, ())):
+                self._responses.pop(key)
+
+
+class ResponseCacheMiddleware:
+    """
+    Serves repeated GET requests under path_prefix from cached response bytes.
+
+    Only successful responses carrying a Surrogate-Key header are cached, keyed
+    by path, query string, Accept and Authorization headers. Successful
+    responses to other methods purge the keys listed in their Surrogate-Key
+    header. The header is never forwarded to clients
+    """
+
+    def __init__(self, app, cache: ResponseCache, path_prefix: str):
+        self._app = app
+        self._cache = cache
+        self._path_prefix = path_prefix
+
+    @staticmethod
+    def _cache_key(scope) -> tuple:
+        headers = dict(scope["headers"])
+        authorization = headers.get(b"authorization", b"")
+        return (
+            scope["path"],
+            scope["query_string"],
+            headers.get(b"accept", b""),
+            hashlib.sha256(authorization).digest(),
+        )
+
+    @staticmethod
+    def _pop_surrogate_keys(message) -> typing.List[str]:
+        headers, keys = [], []
+        for name, value in message.get("headers", []):
+            if name.lower() == SURROGATE_KEY_HEADER:
+                keys.extend(value.decode("latin-1").split())
+            else:
+                headers.append((name, value))
+        message["headers"] = headers
+        return keys
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self._path_prefix):
+            await self._app(scope, receive, send)
+            return
+        if scope["method"] != "GET":
+            await self._app(scope, receive, functools.partial(self._purging, send))
+            return
+        key = self._cache_key(scope)
+        cached = self._cache.get(key)
+        if cached is not None:
+            status, headers, body = cached
+            etag = dict(headers).get(b"etag")
+            if_none_match = dict(scope["headers"]).get(b"if-none-match")
+            if etag is not None and if_none_match is not None:
+                if etag_matches(
+                    if_none_match.decode("latin-1"), etag.decode("latin-1")
+                ):
+                    status, headers, body = 304, [(b"etag", etag)], b""
+            await send(
+                {"type": "http.response.start", "status": status, "headers": headers}
+            )
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        generation = self._cache.generation
+        start = {}
+        tags: typing.List[str] = []
+        chunks: typing.List[bytes] = []
+
+        async def capturing_send(message):
+            if message["type"] == "http.response.start":
+                tags.extend(self._pop_surrogate_keys(message))
+                start.update(message)
+            elif message["type"] == "http.response.body" and tags:
+                chunks.append(message.get("body", b""))
+                if (
+                    not message.get("more_body", False)
+                    and start["status"] == 200
+                    and generation == self._cache.generation
+                ):
+                    self._cache.set(
+                        key, (start["status"], start["headers"], b"".join(chunks)), tags
+                    )
+            await send(message)
+
+        await self._app(scope, receive, capturing_send)
+
+    async def _purging(self, send, message):
+        if message["type"] == "http.response.start":
+            tags = self._pop_surrogate_keys(message)
+            if message["status"] < 400:
+                self._cache.purge(tags)
+        await send(message)
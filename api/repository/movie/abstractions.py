@@ -1,4 +1,7 @@
 import abc
+import dataclasses
+import enum
+import functools
 import typing
 
 from api.entities.movie import Movie
@@ -8,7 +11,145 @@ class RepositoryException(Exception):
     pass
 
 
+class VersionConflictException(RepositoryException):
+    """
+    Raised when a conditional update finds a different movie version
+    """
+
+
+@dataclasses.dataclass(frozen=True)
+class MovieFilter:
+    """
+    Criteria used by MovieRepository.find. Fields left as None match any movie
+    """
+
+    title: typing.Optional[str] = None
+    min_release_year: typing.Optional[int] = None
+    max_release_year: typing.Optional[int] = None
+    watched: typing.Optional[bool] = None
+    # Inclusive ID range, e.g. a creation time range of time ordered IDs
+    min_id: typing.Optional[str] = None
+    max_id: typing.Optional[str] = None
+
+    def matches(self, movie: Movie) -> bool:
+        if self.title is not None and movie.title != self.title:
+            return False
+        if (
+            self.min_release_year is not None
+            and movie.release_year < self.min_release_year
+        ):
+            return False
+        if (
+            self.max_release_year is not None
+            and movie.release_year > self.max_release_year
+        ):
+            return False
+        if self.watched is not None and movie.watched != self.watched:
+            return False
+        if self.min_id is not None and movie.id < self.min_id:
+            return False
+        if self.max_id is not None and movie.id > self.max_id:
+            return False
+        return True
+
+
+class MovieSort(str, enum.Enum):
+    """
+    Sort order used by MovieRepository.find. Ties are broken by movie ID
+    in the same direction
+    """
+
+    RELEASE_YEAR_ASC = "release_year"
+    RELEASE_YEAR_DESC = "-release_year"
+    TITLE_ASC = "title"
+    TITLE_DESC = "-title"
+    # Creation order when IDs are time ordered
+    ID_ASC = "id"
+    ID_DESC = "-id"
+
+    @property
+    def field(self) -> str:
+        return self.value.lstrip("-")
+
+    @property
+    def descending(self) -> bool:
+        return self.value.startswith("-")
+
+
+class TitleMatch(str, enum.Enum):
+    """
+    How MovieRepository.get_by_title compares titles
+    """
+
+    EXACT = "exact"
+    # Ignoring case, diacritics and repeated whitespace
+    NORMALIZED = "normalized"
+
+
+# Sort key value and movie ID of the last movie of the previous page
+Keyset = typing.Tuple[typing.Any, str]
+
+# Per item outcome of a bulk operation: None on success, the error otherwise
+BulkResult = typing.List[typing.Optional[str]]
+
+NOT_EXECUTED = "Not executed: an earlier operation failed"
+
+
+@dataclasses.dataclass(frozen=True)
+class UpdateManyResult:
+    """
+    Outcome of MovieRepository.update_many
+    """
+
+    # Movies matching the filter
+    matched: int
+    # Movies which changed, only those are written
+    modified: int
+
+
+# Fields which can be left out of query results. ID and version are always loaded
+MOVIE_FIELDS = ("title", "description", "release_year", "watched")
+
+Fields = typing.Optional[typing.Collection[str]]
+
+
+def project_movie(movie: Movie, fields: Fields) -> Movie:
+    """
+    Copy of movie with only the given fields set and the others as None
+    """
+    if fields is None:
+        return movie
+    return Movie(
+        movie_id=movie.id,
+        version=movie.version,
+        **{
+            field: getattr(movie, field) if field in fields else None
+            for field in MOVIE_FIELDS
+        },
+    )
+
+
+def movie_changed(movie: Movie, params: dict) -> bool:
+    """
+    Whether applying update params would change any field of movie
+    """
+    return any(
+        field in params and getattr(movie, field) != params[field]
+        for field in MOVIE_FIELDS
+    )
+
+
 class MovieRepository(abc.ABC):
+    async def initialize(self):
+        """
+        Prepares the backend before requests are served. Does nothing by default
+        """
+
+    async def close(self):
+        """
+        Releases the backend on shutdown. Does nothing by default
+        """
+
     async def create(self, movie: Movie):
         """
         Inserts a Movie into database
@@ -17,30 +158,403 @@ class MovieRepository(abc.ABC):
         """
         raise NotImplementedError
 
-    async def get_by_id(self, movie_id: str) -> typing.Optional[Movie]:
+    async def get_by_id(
+        self, movie_id: str, fields: Fields = None
+    ) -> typing.Optional[Movie]:
         """
         Retrieves a Movie by ID. Returns None if not found
+
+        If fields is given, only those fields are loaded and the others are None
+        """
+        raise NotImplementedError
+
+    async def get_many(self, movie_ids: typing.List[str]) -> typing.Dict[str, Movie]:
+        """
+        Retrieves many Movies by ID. Missing IDs are left out of the result
+        """
+        movies = {}
+        for movie_id in movie_ids:
+            movie = await self.get_by_id(movie_id)
+            if movie is not None:
+                movies[movie_id] = movie
+        return movies
+
+    async def search(self, query: str, limit: int = 20) -> typing.List[Movie]:
+        """
+        Returns up to limit Movies whose title or description match the words
+        of the query, best matches first
+        """
+        raise NotImplementedError
+
+    async def autocomplete(self, prefix: str, limit: int = 10) -> typing.List[str]:
+        """
+        Returns up to limit distinct titles starting with prefix, ignoring
+        case, diacritics and repeated whitespace, in normalized title order
         """
         raise NotImplementedError
 
     async def get_by_title(
-        self, title: str, skip: int = 0, limit: int = 1000
+        self,
+        title: str,
+        skip: int = 0,
+        limit: int = 1000,
+        after: typing.Optional[str] = None,
+        fields: Fields = None,
+        match: TitleMatch = TitleMatch.EXACT,
+    ) -> typing.List[Movie]:
+        """
+        Returns a list of Movies with the given title ordered by ID
+
+        If after is given only movies with a greater ID are returned
+        """
+        raise NotImplementedError
+
+    async def find(
+        self,
+        movie_filter: MovieFilter,
+        sort: MovieSort = MovieSort.RELEASE_YEAR_ASC,
+        skip: int = 0,
+        limit: int = 1000,
+        after: typing.Optional[Keyset] = None,
+        fields: Fields = None,
     ) -> typing.List[Movie]:
         """
-        Returns a list of Movies with the given title
+        Returns a list of Movies matching the filter in the given order
+
+        If after is given only movies sorting after that keyset are returned.
+        If fields is given, only those fields and the sort field are loaded,
+        the sort field so that callers can build the next keyset
         """
         raise NotImplementedError
 
+    async def iter_by_title(
+        self,
+        title: str,
+        skip: int = 0,
+        limit: int = 0,
+        after: typing.Optional[str] = None,
+        batch_size: int = 1000,
+        fields: Fields = None,
+        match: TitleMatch = TitleMatch.EXACT,
+    ) -> typing.AsyncIterator[Movie]:
+        """
+        Lazily yields Movies with the given title ordered by ID
+
+        Fetches batch_size movies at a time by seeking past the last movie of
+        the previous batch. A limit of 0 yields every match
+        """
+        remaining = limit
+        while True:
+            page_size = batch_size if limit == 0 else min(batch_size, remaining)
+            page = await self.get_by_title(
+                title=title,
+                skip=skip,
+                limit=page_size,
+                after=after,
+                fields=fields,
+                match=match,
+            )
+            for movie in page:
+                yield movie
+            remaining -= len(page)
+            if len(page) < page_size or (limit != 0 and remaining <= 0):
+                return
+            skip, after = 0, page[-1].id
+
+    async def iter_find(
+        self,
+        movie_filter: MovieFilter,
+        sort: MovieSort = MovieSort.RELEASE_YEAR_ASC,
+        skip: int = 0,
+        limit: int = 0,
+        after: typing.Optional[Keyset] = None,
+        batch_size: int = 1000,
+        fields: Fields = None,
+    ) -> typing.AsyncIterator[Movie]:
+        """
+        Lazily yields Movies matching the filter in the given order
+
+        Fetches batch_size movies at a time by seeking past the last movie of
+        the previous batch. A limit of 0 yields every match
+        """
+        remaining = limit
+        while True:
+            page_size = batch_size if limit == 0 else min(batch_size, remaining)
+            page = await self.find(
+                movie_filter=movie_filter,
+                sort=sort,
+                skip=skip,
+                limit=page_size,
+                after=after,
+                fields=fields,
+            )
+            for movie in page:
+                yield movie
+            remaining -= len(page)
+            if len(page) < page_size or (limit != 0 and remaining <= 0):
+                return
+            last = page[-1]
+            skip, after = 0, (getattr(last, sort.field), last.id)
+
+    async def iter_ids(self, batch_size: int = 1000) -> typing.AsyncIterator[str]:
+        """
+        Lazily yields the IDs of all movies
+        """
+        async for movie in self.iter_find(
+            MovieFilter(), batch_size=batch_size, fields=()
+        ):
+            yield movie.id
+
     async def delete(self, movie_id: str) -> bool:
         """
-        Deletes a movie by ID
+        Deletes a movie by ID. Returns True if a movie was deleted
 
         Raises RepositoryException on failure
         """
         raise NotImplementedError
 
-    async def update(self, movie_id: str, params: dict):
+    async def update(
+        self,
+        movie_id: str,
+        params: dict,
+        expected_version: typing.Optional[int] = None,
+    ):
         """
-        Update a movie by its ID
+        Update a movie by its ID, incrementing its version
+
+        If expected_version is given and differs from the stored version
+        raises VersionConflictException
         """
         raise NotImplementedError
+
+    async def update_many(
+        self, movie_filter: MovieFilter, params: dict
+    ) -> UpdateManyResult:
+        """
+        Updates every movie matching the filter. Only movies which change are
+        written, incrementing their version
+
+        Raises RepositoryException on failure
+        """
+        if "id" in params:
+            raise RepositoryException("Can't update Movie ID")
+        if "version" in params:
+            raise RepositoryException("Can't update Movie version")
+        matched, updates = 0, []
+        async for movie in self.iter_find(movie_filter, sort=MovieSort.ID_ASC):
+            matched += 1
+            if movie_changed(movie, params):
+                updates.append((movie.id, params))
+        results = await self.bulk_update(updates) if updates else []
+        return UpdateManyResult(matched=matched, modified=results.count(None))
+
+    async def bulk_create(
+        self, movies: typing.List[Movie], ordered: bool = False
+    ) -> BulkResult:
+        """
+        Inserts many Movies at once
+
+        If ordered, stops at the first failure and reports the rest as not executed
+        """
+        return await self._bulk_apply(
+            [functools.partial(self.create, movie=movie) for movie in movies],
+            ordered,
+        )
+
+    async def bulk_update(
+        self, updates: typing.List[typing.Tuple[str, dict]], ordered: bool = False
+    ) -> BulkResult:
+        """
+        Updates many movies at once, given as (movie_id, params) pairs
+
+        If ordered, stops at the first failure and reports the rest as not executed
+        """
+        return await self._bulk_apply(
+            [
+                functools.partial(self.update, movie_id=movie_id, params=params)
+                for movie_id, params in updates
+            ],
+            ordered,
+        )
+
+    async def bulk_delete(
+        self, movie_ids: typing.List[str], ordered: bool = False
+    ) -> BulkResult:
+        """
+        Deletes many movies at once
+
+        If ordered, stops at the first failure and reports the rest as not executed
+        """
+        return await self._bulk_apply(
+            [
+                functools.partial(self.delete, movie_id=movie_id)
+                for movie_id in movie_ids
+            ],
+            ordered,
+        )
+
+    @staticmethod
+    async def _bulk_apply(
+        operations: typing.List[typing.Callable[[], typing.Awaitable]], ordered: bool
+    ) -> BulkResult:
+        """
+        Applies operations one by one in a single pass, collecting failures
+        """
+        results: BulkResult = []
+        failed = False
+        for operation in operations:
+            if ordered and failed:
+                results.append(NOT_EXECUTED)
+                continue
+            try:
+                await operation()
+                results.append(None)
+            except RepositoryException as e:
+                results.append(str(e))
+                failed = True
+        return results
+
+
+class DelegatingMovieRepository(MovieRepository):
+    """
+    Forwards every call to a wrapped MovieRepository. Base class for
+    repositories adding behaviour in front of a backend
+    """
+
+    def __init__(self, repository: MovieRepository):
+        self._repository = repository
+
+    async def initialize(self):
+        await self._repository.initialize()
+
+    async def close(self):
+        await self._repository.close()
+
+    async def create(self, movie: Movie):
+        return await self._repository.create(movie)
+
+    async def get_by_id(
+        self, movie_id: str, fields: Fields = None
+    ) -> typing.Optional[Movie]:
+        return await self._repository.get_by_id(movie_id, fields=fields)
+
+    async def get_many(self, movie_ids: typing.List[str]) -> typing.Dict[str, Movie]:
+        return await self._repository.get_many(movie_ids)
+
+    async def search(self, query: str, limit: int = 20) -> typing.List[Movie]:
+        return await self._repository.search(query, limit=limit)
+
+    async def autocomplete(self, prefix: str, limit: int = 10) -> typing.List[str]:
+        return await self._repository.autocomplete(prefix, limit=limit)
+
+    async def get_by_title(
+        self,
+        title: str,
+        skip: int = 0,
+        limit: int = 1000,
+        after: typing.Optional[str] = None,
+        fields: Fields = None,
+        match: TitleMatch = TitleMatch.EXACT,
+    ) -> typing.List[Movie]:
+        return await self._repository.get_by_title(
+            title=title,
+            skip=skip,
+            limit=limit,
+            after=after,
+            fields=fields,
+            match=match,
+        )
+
+    async def find(
+        self,
+        movie_filter: MovieFilter,
+        sort: MovieSort = MovieSort.RELEASE_YEAR_ASC,
+        skip: int = 0,
+        limit: int = 1000,
+        after: typing.Optional[Keyset] = None,
+        fields: Fields = None,
+    ) -> typing.List[Movie]:
+        return await self._repository.find(
+            movie_filter=movie_filter,
+            sort=sort,
+            skip=skip,
+            limit=limit,
+            after=after,
+            fields=fields,
+        )
+
+    def iter_by_title(
+        self,
+        title: str,
+        skip: int = 0,
+        limit: int = 0,
+        after: typing.Optional[str] = None,
+        batch_size: int = 1000,
+        fields: Fields = None,
+        match: TitleMatch = TitleMatch.EXACT,
+    ) -> typing.AsyncIterator[Movie]:
+        return self._repository.iter_by_title(
+            title=title,
+            skip=skip,
+            limit=limit,
+            after=after,
+            batch_size=batch_size,
+            fields=fields,
+            match=match,
+        )
+
+    def iter_find(
+        self,
+        movie_filter: MovieFilter,
+        sort: MovieSort = MovieSort.RELEASE_YEAR_ASC,
+        skip: int = 0,
+        limit: int = 0,
+        after: typing.Optional[Keyset] = None,
+        batch_size: int = 1000,
+        fields: Fields = None,
+    ) -> typing.AsyncIterator[Movie]:
+        return self._repository.iter_find(
+            movie_filter=movie_filter,
+            sort=sort,
+            skip=skip,
+            limit=limit,
+            after=after,
+            batch_size=batch_size,
+            fields=fields,
+        )
+
+    def iter_ids(self, batch_size: int = 1000) -> typing.AsyncIterator[str]:
+        return self._repository.iter_ids(batch_size=batch_size)
+
+    async def delete(self, movie_id: str) -> bool:
+        return await self._repository.delete(movie_id)
+
+    async def update(
+        self,
+        movie_id: str,
+        params: dict,
+        expected_version: typing.Optional[int] = None,
+    ):
+        return await self._repository.update(
+            movie_id, params, expected_version=expected_version
+        )
+
+    async def update_many(
+        self, movie_filter: MovieFilter, params: dict
+    ) -> UpdateManyResult:
+        return await self._repository.update_many(movie_filter, params)
+
+    async def bulk_create(
+        self, movies: typing.List[Movie], ordered: bool = False
+    ) -> BulkResult:
+        return await self._repository.bulk_create(movies, ordered=ordered)
+
+    async def bulk_update(
+        self, updates: typing.List[typing.Tuple[str, dict]], ordered: bool = False
+    ) -> BulkResult:
+        return await self._repository.bulk_update(updates, ordered=ordered)
+
+    async def bulk_delete(
+        self, movie_ids: typing.List[str], ordered: bool = False
+    ) -> BulkResult:
+        return await self._repository.bulk_delete(movie_ids, ordered=ordered)
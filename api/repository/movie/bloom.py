@@ -0,0 +1,187 @@
+import hashlib
+import math
+import typing
+
+from prometheus_client import Counter, Gauge
+
+from api.entities.movie import Movie
+from api.repository.movie.abstractions import (BulkResult,
+                                               DelegatingMovieRepository,
+                                               Fields, MovieRepository)
+
+BLOOM_FILTER_LOOKUPS = Counter(
+    "movie_repository_bloom_filter_lookups_total",
+    "Movie ID lookups checked against the bloom filter. false_positive counts "
+    "IDs the filter let through which were not found",
+    ["result"],
+)
+BLOOM_FILTER_FALSE_POSITIVE_RATE = Gauge(
+    "movie_repository_bloom_filter_estimated_false_positive_rate",
+    "False positive rate expected from the current bloom filter fill",
+)
+
+
+class CountingBloomFilter:
+    """
+    Probabilistic set of strings with no false negatives.
+
+    Every slot is a one byte counter instead of a bit so items can be removed.
+    Counters which reach 255 stay there, which can only cause false positives
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        capacity = max(1, capacity)
+        self._size = max(
+            1, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        )
+        self._hash_count = max(1, round(self._size / capacity * math.log(2)))
+        self._counters = bytearray(self._size)
+        self._count = 0
+
+    def _slots(self, item: str) -> typing.List[int]:
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return [(first + i * second) % self._size for i in range(self._hash_count)]
+
+    def add(self, item: str):
+        counters = self._counters
+        for slot in self._slots(item):
+            if counters[slot] < 255:
+                counters[slot] += 1
+        self._count += 1
+
+    def remove(self, item: str):
+        """
+        Removes an item. It must have been added before, otherwise other
+        items may become false negatives
+        """
+        counters = self._counters
+        slots = self._slots(item)
+        if not all(counters[slot] for slot in slots):
+            return
+        for slot in slots:
+            if 0 < counters[slot] < 255:
+                counters[slot] -= 1
+        self._count -= 1
+
+    def __contains__(self, item: str) -> bool:
+        counters = self._counters
+        return all(counters[slot] for slot in self._slots(item))
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def estimated_false_positive_rate(self) -> float:
+        fill = 1 - math.exp(-self._hash_count * self._count / self._size)
+        return fill**self._hash_count
+
+
+class BloomFilterMovieRepository(DelegatingMovieRepository):
+    """
+    Answers lookups of IDs which definitely don't exist without querying
+    the repository behind it.
+
+    The filter is built from all IDs on initialize and then only sees writes
+    made through this repository, so every writer must go through it. Movies
+    removed by bulk_delete stay in the filter as false positives until the
+    next rebuild
+    """
+
+    def __init__(
+        self,
+        repository: MovieRepository,
+        capacity: int = 1_000_000,
+        error_rate: float = 0.01,
+    ):
+        super().__init__(repository)
+        self._capacity = capacity
+        self._error_rate = error_rate
+        self._filter: typing.Optional[CountingBloomFilter] = None
+        # IDs created while the filter was being built
+        self._building: typing.Optional[typing.Set[str]] = None
+
+    async def initialize(self):
+        await super().initialize()
+        await self.rebuild()
+
+    async def rebuild(self):
+        """
+        Builds a new filter from the IDs of all movies. Lookups go straight to
+        the repository until it is ready
+        """
+        bloom_filter = CountingBloomFilter(self._capacity, self._error_rate)
+        self._building = set()
+        try:
+            async for movie_id in self._repository.iter_ids():
+                bloom_filter.add(movie_id)
+            # Created while streaming, possibly behind the cursor
+            for movie_id in self._building:
+                bloom_filter.add(movie_id)
+        finally:
+            self._building = None
+        self._filter = bloom_filter
+        self._update_gauge()
+
+    def _update_gauge(self):
+        BLOOM_FILTER_FALSE_POSITIVE_RATE.set(self._filter.estimated_false_positive_rate)
+
+    def _may_exist(self, movie_id: str) -> bool:
+        if self._filter is None:
+            return True
+        if movie_id in self._filter:
+            return True
+        BLOOM_FILTER_LOOKUPS.labels(result="negative").inc()
+        return False
+
+    def _record_found(self, found: bool):
+        if self._filter is not None:
+            BLOOM_FILTER_LOOKUPS.labels(
+                result="positive" if found else "false_positive"
+            ).inc()
+
+    def _add(self, movie_id: str):
+        if self._building is not None:
+            self._building.add(movie_id)
+        if self._filter is not None:
+            self._filter.add(movie_id)
+            self._update_gauge()
+
+    async def get_by_id(
+        self, movie_id: str, fields: Fields = None
+    ) -> typing.Optional[Movie]:
+        if not self._may_exist(movie_id):
+            return None
+        movie = await self._repository.get_by_id(movie_id, fields=fields)
+        self._record_found(movie is not None)
+        return movie
+
+    async def get_many(self, movie_ids: typing.List[str]) -> typing.Dict[str, Movie]:
+        candidates = [movie_id for movie_id in movie_ids if self._may_exist(movie_id)]
+        if not candidates:
+            return {}
+        movies = await self._repository.get_many(candidates)
+        for movie_id in candidates:
+            self._record_found(movie_id in movies)
+        return movies
+
+    async def create(self, movie: Movie):
+        # Added first so the movie is never missed once it is stored
+        self._add(movie.id)
+        return await self._repository.create(movie)
+
+    async def bulk_create(
+        self, movies: typing.List[Movie], ordered: bool = False
+    ) -> BulkResult:
+        for movie in movies:
+            self._add(movie.id)
+        return await self._repository.bulk_create(movies, ordered=ordered)
+
+    async def delete(self, movie_id: str) -> bool:
+        deleted = await self._repository.delete(movie_id)
+        # Only IDs known to have been added can be removed safely
+        if deleted and self._filter is not None and self._building is None:
+            self._filter.remove(movie_id)
+            self._update_gauge()
+        return deleted
@@ -0,0 +1,322 @@
+import collections
+import time
+import typing
+
+from prometheus_client import Counter
+
+from api.entities.movie import Movie
+from api.repository.movie.abstractions import (BulkResult,
+                                               DelegatingMovieRepository,
+                                               Fields, MovieFilter,
+                                               MovieRepository, TitleMatch,
+                                               UpdateManyResult, project_movie)
+from api.repository.movie.search import normalize_title
+
+CACHE_REQUESTS = Counter(
+    "movie_repository_cache_requests_total",
+    "Movie repository cache lookups",
+    ["cache", "result"],
+)
+
+_MISSING = object()
+
+
+class LruTtlCache:
+    """
+    Bounded mapping which evicts the least recently used entry once full.
+    Entries expire after their time to live
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        clock: typing.Callable[[], float] = time.monotonic,
+        on_evict: typing.Optional[typing.Callable[[typing.Hashable], None]] = None,
+    ):
+        self._max_size = max_size
+        self._clock = clock
+        self._on_evict = on_evict
+        self._entries: "collections.OrderedDict[typing.Hashable, tuple]" = (
+            collections.OrderedDict()
+        )
+
+    def get(self, key: typing.Hashable, default=None):
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        expires_at, value = entry
+        if expires_at <= self._clock():
+            self.pop(key)
+            return default
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: typing.Hashable, value, ttl: float):
+        self._entries[key] = (self._clock() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_size:
+            evicted, _ = self._entries.popitem(last=False)
+            if self._on_evict is not None:
+                self._on_evict(evicted)
+
+    def pop(self, key: typing.Hashable):
+        entry = self._entries.pop(key, None)
+        if entry is not None and self._on_evict is not None:
+            self._on_evict(key)
+
+    def most_recent(self) -> typing.Iterator[typing.Tuple[typing.Hashable, typing.Any]]:
+        """
+        Yields unexpired (key, value) pairs, most recently used first
+        """
+        now = self._clock()
+        for key in reversed(self._entries):
+            expires_at, value = self._entries[key]
+            if expires_at > now:
+                yield key, value
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class CachingMovieRepository(DelegatingMovieRepository):
+    """
+    Read-through cache in front of another repository.
+
+    Lookups by ID, including misses, and title queries are cached. Writes made
+    through this repository invalidate the affected entries
+    """
+
+    def __init__(
+        self,
+        repository: MovieRepository,
+        max_size: int = 10000,
+        ttl: float = 60.0,
+        negative_ttl: float = 5.0,
+        clock: typing.Callable[[], float] = time.monotonic,
+    ):
+        super().__init__(repository)
+        self._ttl = ttl
+        self._negative_ttl = negative_ttl
+        # movie_id -> Movie, or None for movies known to be missing
+        self._movies = LruTtlCache(max_size, clock)
+        # (title, skip, limit, after, fields, match) -> list of Movies. Normalized
+        # queries are keyed by the normalized title
+        self._titles = LruTtlCache(max_size, clock, on_evict=self._forget_title_key)
+        self._title_keys: typing.Dict[str, typing.Set[tuple]] = {}
+        # Bumped on every write so loads racing a write are not cached
+        self._writes = 0
+        self.stats = {"hits": 0, "misses": 0}
+
+    def _record(self, cache: str, hit: bool):
+        self.stats["hits" if hit else "misses"] += 1
+        CACHE_REQUESTS.labels(cache=cache, result="hit" if hit else "miss").inc()
+
+    def _cache_movie(self, movie_id: str, movie: typing.Optional[Movie]):
+        self._movies.set(
+            movie_id, movie, self._ttl if movie is not None else self._negative_ttl
+        )
+
+    def _forget_title_key(self, key: tuple):
+        keys = self._title_keys.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._title_keys[key[0]]
+
+    async def _current_titles(
+        self, movie_ids: typing.List[str]
+    ) -> typing.Dict[str, str]:
+        """
+        Titles of movies before a write, needed to invalidate their title queries
+        """
+        titles, unknown = {}, []
+        for movie_id in movie_ids:
+            movie = self._movies.get(movie_id, _MISSING)
+            if movie is _MISSING:
+                unknown.append(movie_id)
+            elif movie is not None:
+                titles[movie_id] = movie.title
+        # Without cached title queries there is nothing else to invalidate
+        if unknown and len(self._titles):
+            movies = await self._repository.get_many(unknown)
+            titles.update((movie_id, movie.title) for movie_id, movie in movies.items())
+        return titles
+
+    def _invalidate(self, movie_id: str, titles: typing.Iterable[typing.Optional[str]]):
+        self._writes += 1
+        self._movies.pop(movie_id)
+        for title in titles:
+            if title is None:
+                continue
+            for key in [
+                *self._title_keys.get(title, ()),
+                *self._title_keys.get(normalize_title(title), ()),
+            ]:
+                self._titles.pop(key)
+
+    async def warm_up(self, movie_ids: typing.List[str]):
+        """
+        Loads the given movies into the cache
+        """
+        writes = self._writes
+        movies = await self._repository.get_many(movie_ids)
+        if writes == self._writes:
+            for movie_id, movie in movies.items():
+                self._cache_movie(movie_id, movie)
+
+    def hottest(self, count: int) -> typing.List[str]:
+        """
+        Returns up to count IDs of cached movies, most recently used first
+        """
+        hottest = []
+        for movie_id, movie in self._movies.most_recent():
+            if len(hottest) >= count:
+                break
+            if movie is not None:
+                hottest.append(movie_id)
+        return hottest
+
+    async def get_by_id(
+        self, movie_id: str, fields: Fields = None
+    ) -> typing.Optional[Movie]:
+        movie = self._movies.get(movie_id, _MISSING)
+        if movie is not _MISSING:
+            self._record("id", hit=True)
+            return project_movie(movie, fields) if movie is not None else None
+        self._record("id", hit=False)
+        if fields is not None:
+            # Partial movies are not cached, the full one may be requested next
+            return await self._repository.get_by_id(movie_id, fields=fields)
+        writes = self._writes
+        movie = await self._repository.get_by_id(movie_id)
+        if writes == self._writes:
+            self._cache_movie(movie_id, movie)
+        return movie
+
+    async def get_many(self, movie_ids: typing.List[str]) -> typing.Dict[str, Movie]:
+        found, missing = {}, []
+        for movie_id in movie_ids:
+            movie = self._movies.get(movie_id, _MISSING)
+            self._record("id", hit=movie is not _MISSING)
+            if movie is _MISSING:
+                missing.append(movie_id)
+            elif movie is not None:
+                found[movie_id] = movie
+        if missing:
+            writes = self._writes
+            loaded = await self._repository.get_many(missing)
+            if writes == self._writes:
+                for movie_id in missing:
+                    self._cache_movie(movie_id, loaded.get(movie_id))
+            found.update(loaded)
+        return found
+
+    async def get_by_title(
+        self,
+        title: str,
+        skip: int = 0,
+        limit: int = 1000,
+        after: typing.Optional[str] = None,
+        fields: Fields = None,
+        match: TitleMatch = TitleMatch.EXACT,
+    ) -> typing.List[Movie]:
+        key = (
+            normalize_title(title) if match == TitleMatch.NORMALIZED else title,
+            skip,
+            limit,
+            after,
+            frozenset(fields) if fields else fields,
+            match,
+        )
+        movies = self._titles.get(key)
+        if movies is not None:
+            self._record("title", hit=True)
+            return list(movies)
+        self._record("title", hit=False)
+        writes = self._writes
+        movies = await self._repository.get_by_title(
+            title=title,
+            skip=skip,
+            limit=limit,
+            after=after,
+            fields=fields,
+            match=match,
+        )
+        if writes == self._writes:
+            self._titles.set(key, list(movies), self._ttl)
+            self._title_keys.setdefault(key[0], set()).add(key)
+        return movies
+
+    async def create(self, movie: Movie):
+        cached = self._movies.get(movie.id)
+        await self._repository.create(movie)
+        self._invalidate(movie.id, {movie.title, cached.title if cached else None})
+
+    async def update(
+        self,
+        movie_id: str,
+        params: dict,
+        expected_version: typing.Optional[int] = None,
+    ):
+        titles = await self._current_titles([movie_id])
+        try:
+            return await self._repository.update(
+                movie_id, params, expected_version=expected_version
+            )
+        finally:
+            self._invalidate(movie_id, {titles.get(movie_id), params.get("title")})
+
+    async def delete(self, movie_id: str) -> bool:
+        titles = await self._current_titles([movie_id])
+        try:
+            return await self._repository.delete(movie_id)
+        finally:
+            self._invalidate(movie_id, {titles.get(movie_id)})
+
+    async def update_many(
+        self, movie_filter: MovieFilter, params: dict
+    ) -> UpdateManyResult:
+        try:
+            return await self._repository.update_many(movie_filter, params)
+        finally:
+            # The updated movies are unknown, so nothing cached can be trusted
+            self._writes += 1
+            self._movies.clear()
+            self._titles.clear()
+            self._title_keys.clear()
+
+    async def bulk_create(
+        self, movies: typing.List[Movie], ordered: bool = False
+    ) -> BulkResult:
+        cached = {movie.id: self._movies.get(movie.id) for movie in movies}
+        try:
+            return await self._repository.bulk_create(movies, ordered=ordered)
+        finally:
+            for movie in movies:
+                previous = cached[movie.id]
+                self._invalidate(
+                    movie.id, {movie.title, previous.title if previous else None}
+                )
+
+    async def bulk_update(
+        self, updates: typing.List[typing.Tuple[str, dict]], ordered: bool = False
+    ) -> BulkResult:
+        titles = await self._current_titles([movie_id for movie_id, _ in updates])
+        try:
+            return await self._repository.bulk_update(updates, ordered=ordered)
+        finally:
+            for movie_id, params in updates:
+                self._invalidate(movie_id, {titles.get(movie_id), params.get("title")})
+
+    async def bulk_delete(
+        self, movie_ids: typing.List[str], ordered: bool = False
+    ) -> BulkResult:
+        titles = await self._current_titles(movie_ids)
+        try:
+            return await self._repository.bulk_delete(movie_ids, ordered=ordered)
+        finally:
+            for movie_id in movie_ids:
+                self._invalidate(movie_id, {titles.get(movie_id)})
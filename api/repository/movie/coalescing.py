@@ -0,0 +1,103 @@
+import asyncio
+import typing
+
+from api.entities.movie import Movie
+from api.repository.movie.abstractions import (DelegatingMovieRepository,
+                                               Fields, MovieRepository,
+                                               TitleMatch)
+
+
+class CoalescingMovieRepository(DelegatingMovieRepository):
+    """
+    Coalesces concurrent reads in front of another repository.
+
+    get_by_id calls made within the same event loop tick are loaded with a
+    single get_many call, and identical in-flight get_by_title calls share
+    one query
+    """
+
+    def __init__(self, repository: MovieRepository, max_batch_size: int = 1000):
+        super().__init__(repository)
+        self._max_batch_size = max_batch_size
+        self._pending_ids: typing.Dict[str, asyncio.Future] = {}
+        self._dispatch_scheduled = False
+        self._title_queries: typing.Dict[tuple, asyncio.Future] = {}
+        # Running loads, referenced so that they are not garbage collected
+        self._loads: typing.Set[asyncio.Future] = set()
+
+    async def get_by_id(
+        self, movie_id: str, fields: Fields = None
+    ) -> typing.Optional[Movie]:
+        if fields is not None:
+            # get_many loads whole movies, so projected reads go straight through
+            return await self._repository.get_by_id(movie_id, fields=fields)
+        future = self._pending_ids.get(movie_id)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._pending_ids[movie_id] = future
+            if not self._dispatch_scheduled:
+                self._dispatch_scheduled = True
+                # Runs once every callback ready in this tick had a chance to join
+                loop.call_soon(self._dispatch)
+        # A cancelled caller must not cancel the lookup shared with others
+        return await asyncio.shield(future)
+
+    def _dispatch(self):
+        self._dispatch_scheduled = False
+        pending, self._pending_ids = self._pending_ids, {}
+        movie_ids = list(pending)
+        for start in range(0, len(movie_ids), self._max_batch_size):
+            batch = {
+                movie_id: pending[movie_id]
+                for movie_id in movie_ids[start : start + self._max_batch_size]
+            }
+            load = asyncio.ensure_future(self._load(batch))
+            self._loads.add(load)
+            load.add_done_callback(self._loads.discard)
+
+    async def _load(self, batch: typing.Dict[str, asyncio.Future]):
+        try:
+            movies = await self._repository.get_many(list(batch))
+        except Exception as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for movie_id, future in batch.items():
+            if not future.done():
+                future.set_result(movies.get(movie_id))
+
+    async def get_by_title(
+        self,
+        title: str,
+        skip: int = 0,
+        limit: int = 1000,
+        after: typing.Optional[str] = None,
+        fields: Fields = None,
+        match: TitleMatch = TitleMatch.EXACT,
+    ) -> typing.List[Movie]:
+        key = (
+            title,
+            skip,
+            limit,
+            after,
+            frozenset(fields) if fields else fields,
+            match,
+        )
+        future = self._title_queries.get(key)
+        if future is None:
+            future = asyncio.ensure_future(
+                self._repository.get_by_title(
+                    title=title,
+                    skip=skip,
+                    limit=limit,
+                    after=after,
+                    fields=fields,
+                    match=match,
+                )
+            )
+            self._title_queries[key] = future
+            future.add_done_callback(lambda _: self._title_queries.pop(key, None))
+        # Callers get their own list so they can't affect each other
+        return list(await asyncio.shield(future))
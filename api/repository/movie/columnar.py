@@ -0,0 +1,186 @@
+import array
+import typing
+from collections.abc import MutableMapping
+
+from api.entities.movie import Movie
+
+# Code of a missing title and length of a missing description
+_NONE = 0xFFFFFFFF
+# Release year of a movie without one
+_NO_RELEASE_YEAR = -(2**31)
+
+
+class ColumnarMovieStore(MutableMapping):
+    """
+    Movie ID to Movie mapping storing every field in a compact column instead
+    of one Movie object per movie. Movies are materialized on every read, so
+    changing a returned Movie does not change the store.
+
+    Each movie gets a slot, reused after a delete:
+    - release years and versions are arrays of machine integers
+    - watched flags are packed eight to a byte
+    - titles are deduplicated, a slot holds the code of its title
+    - descriptions are UTF-8 in a single arena, a slot holds offset and length.
+      Space left by updates and deletes is reclaimed once it is half the arena
+
+    IDs are the only per movie Python objects left, shared with the indexes
+    of the repository
+    """
+
+    def __init__(self, movies: typing.Iterable[Movie] = ()):
+        self.clear()
+        for movie in movies:
+            self[movie.id] = movie
+
+    def clear(self):
+        self._slots: typing.Dict[str, int] = {}
+        self._free_slots: typing.List[int] = []
+        self._release_years = array.array("i")
+        self._versions = array.array("I")
+        self._watched = bytearray()
+        self._title_codes = array.array("I")
+        # code -> title, count of slots using it
+        self._titles: typing.List[typing.Optional[str]] = []
+        self._title_counts = array.array("I")
+        self._codes: typing.Dict[str, int] = {}
+        self._free_codes: typing.List[int] = []
+        self._description_offsets = array.array("Q")
+        self._description_lengths = array.array("I")
+        self._arena = bytearray()
+        self._garbage = 0
+
+    def copy(self) -> "ColumnarMovieStore":
+        store = ColumnarMovieStore()
+        store._slots = dict(self._slots)
+        store._free_slots = list(self._free_slots)
+        store._release_years = array.array("i", self._release_years)
+        store._versions = array.array("I", self._versions)
+        store._watched = bytearray(self._watched)
+        store._title_codes = array.array("I", self._title_codes)
+        store._titles = list(self._titles)
+        store._title_counts = array.array("I", self._title_counts)
+        store._codes = dict(self._codes)
+        store._free_codes = list(self._free_codes)
+        store._description_offsets = array.array("Q", self._description_offsets)
+        store._description_lengths = array.array("I", self._description_lengths)
+        store._arena = bytearray(self._arena)
+        store._garbage = self._garbage
+        return store
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def __iter__(self) -> typing.Iterator[str]:
+        return iter(self._slots)
+
+    def __contains__(self, movie_id: object) -> bool:
+        return movie_id in self._slots
+
+    def __getitem__(self, movie_id: str) -> Movie:
+        slot = self._slots[movie_id]
+        release_year = self._release_years[slot]
+        title_code = self._title_codes[slot]
+        return Movie(
+            movie_id=movie_id,
+            title=None if title_code == _NONE else self._titles[title_code],
+            description=self._description(slot),
+            release_year=None if release_year == _NO_RELEASE_YEAR else release_year,
+            watched=bool(self._watched[slot >> 3] & 1 << (slot & 7)),
+            version=self._versions[slot],
+        )
+
+    def __setitem__(self, movie_id: str, movie: Movie):
+        slot = self._slots.get(movie_id)
+        if slot is not None:
+            self._release(slot)
+        elif self._free_slots:
+            slot = self._free_slots.pop()
+        else:
+            slot = len(self._versions)
+            self._release_years.append(0)
+            self._versions.append(0)
+            self._title_codes.append(_NONE)
+            self._description_offsets.append(0)
+            self._description_lengths.append(_NONE)
+            if slot & 7 == 0:
+                self._watched.append(0)
+        self._slots[movie_id] = slot
+        self._release_years[slot] = (
+            _NO_RELEASE_YEAR if movie.release_year is None else movie.release_year
+        )
+        self._versions[slot] = movie.version
+        if movie.watched:
+            self._watched[slot >> 3] |= 1 << (slot & 7)
+        else:
+            self._watched[slot >> 3] &= ~(1 << (slot & 7))
+        self._title_codes[slot] = self._acquire_title(movie.title)
+        if movie.description is None:
+            self._description_lengths[slot] = _NONE
+        else:
+            encoded = movie.description.encode("utf-8")
+            self._description_offsets[slot] = len(self._arena)
+            self._description_lengths[slot] = len(encoded)
+            self._arena += encoded
+
+    def __delitem__(self, movie_id: str):
+        slot = self._slots.pop(movie_id)
+        self._release(slot)
+        self._title_codes[slot] = _NONE
+        self._description_lengths[slot] = _NONE
+        self._free_slots.append(slot)
+
+    def _description(self, slot: int) -> typing.Optional[str]:
+        length = self._description_lengths[slot]
+        if length == _NONE:
+            return None
+        offset = self._description_offsets[slot]
+        return self._arena[offset : offset + length].decode("utf-8")
+
+    def _acquire_title(self, title: typing.Optional[str]) -> int:
+        if title is None:
+            return _NONE
+        code = self._codes.get(title)
+        if code is None:
+            if self._free_codes:
+                code = self._free_codes.pop()
+                self._titles[code] = title
+            else:
+                code = len(self._titles)
+                self._titles.append(title)
+                self._title_counts.append(0)
+            self._codes[title] = code
+        self._title_counts[code] += 1
+        return code
+
+    def _release(self, slot: int):
+        """
+        Drops the references of a slot to its title and description
+        """
+        code = self._title_codes[slot]
+        if code != _NONE:
+            self._title_counts[code] -= 1
+            if not self._title_counts[code]:
+                del self._codes[self._titles[code]]
+                self._titles[code] = None
+                self._free_codes.append(code)
+        length = self._description_lengths[slot]
+        if length != _NONE:
+            self._garbage += length
+            if self._garbage * 2 > len(self._arena):
+                self._description_lengths[slot] = _NONE
+                self._compact()
+
+    def _compact(self):
+        """
+        Rewrites the arena without the space of replaced and deleted descriptions
+        """
+        arena = bytearray()
+        offsets, lengths = self._description_offsets, self._description_lengths
+        for slot in self._slots.values():
+            length = lengths[slot]
+            if length != _NONE:
+                offset = offsets[slot]
+                offsets[slot] = len(arena)
+                arena += self._arena[offset : offset + length]
+        self._arena = arena
+        self._garbage = 0
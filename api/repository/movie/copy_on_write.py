@@ -0,0 +1,225 @@
+import bisect
+import itertools
+import typing
+from collections.abc import MutableMapping
+
+# Buckets of a mapping, a power of two. The first write after a copy copies
+# one, so more buckets make it cheaper and the copy itself dearer
+_BUCKETS = 256
+# Values per chunk of a sorted list when built, chunks are split at twice that
+_LOAD = 512
+
+
+class CopyOnWriteMapping(MutableMapping):
+    """
+    Mapping split into buckets by key hash, so that copy only copies the
+    list of buckets. Buckets are shared with the copy until written, a write
+    copies the one bucket it changes.
+
+    bucket_factory creates the mapping of a bucket, which must support copy()
+    """
+
+    def __init__(
+        self,
+        bucket_factory: typing.Callable[[], typing.MutableMapping] = dict,
+        items: typing.Iterable[typing.Tuple[typing.Hashable, typing.Any]] = (),
+    ):
+        self._bucket_factory = bucket_factory
+        self._buckets: typing.List[typing.Optional[typing.MutableMapping]] = [
+            None
+        ] * _BUCKETS
+        # ids of the buckets only this mapping uses
+        self._owned: typing.Set[int] = set()
+        self._length = 0
+        self.update(items)
+
+    def copy(self) -> "CopyOnWriteMapping":
+        mapping = CopyOnWriteMapping(self._bucket_factory)
+        mapping._buckets = list(self._buckets)
+        mapping._length = self._length
+        self._owned = set()
+        return mapping
+
+    def _bucket(self, key) -> typing.MutableMapping:
+        """
+        Bucket of key, ready to be written
+        """
+        index = hash(key) & (_BUCKETS - 1)
+        bucket = self._buckets[index]
+        if bucket is None:
+            bucket = self._bucket_factory()
+        elif id(bucket) in self._owned:
+            return bucket
+        else:
+            bucket = bucket.copy()
+        self._buckets[index] = bucket
+        self._owned.add(id(bucket))
+        return bucket
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __iter__(self) -> typing.Iterator:
+        return itertools.chain.from_iterable(
+            bucket for bucket in self._buckets if bucket is not None
+        )
+
+    def values(self) -> typing.Iterator:
+        return itertools.chain.from_iterable(
+            bucket.values() for bucket in self._buckets if bucket is not None
+        )
+
+    def items(self) -> typing.Iterator[tuple]:
+        return itertools.chain.from_iterable(
+            bucket.items() for bucket in self._buckets if bucket is not None
+        )
+
+    def __contains__(self, key) -> bool:
+        bucket = self._buckets[hash(key) & (_BUCKETS - 1)]
+        return bucket is not None and key in bucket
+
+    def __getitem__(self, key):
+        bucket = self._buckets[hash(key) & (_BUCKETS - 1)]
+        if bucket is None:
+            raise KeyError(key)
+        return bucket[key]
+
+    def get(self, key, default=None):
+        bucket = self._buckets[hash(key) & (_BUCKETS - 1)]
+        if bucket is None:
+            return default
+        return bucket.get(key, default)
+
+    def __setitem__(self, key, value):
+        bucket = self._bucket(key)
+        if key not in bucket:
+            self._length += 1
+        bucket[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        del self._bucket(key)[key]
+        self._length -= 1
+
+
+class CopyOnWriteSortedList:
+    """
+    Sorted list split into chunks, so that copy only copies the list of
+    chunks. Chunks are shared with the copy until written, a write copies
+    the one chunk it changes.
+
+    Positions count from the start of the whole list
+    """
+
+    def __init__(self, values: typing.Iterable = ()):
+        values = sorted(values)
+        self._chunks: typing.List[list] = [
+            values[start : start + _LOAD] for start in range(0, len(values), _LOAD)
+        ]
+        self._maxes = [chunk[-1] for chunk in self._chunks]
+        # ids of the chunks only this list uses
+        self._owned: typing.Set[int] = {id(chunk) for chunk in self._chunks}
+        self._length = len(values)
+        # Position of the first value of every chunk, rebuilt after writes
+        self._offsets: typing.Optional[typing.List[int]] = None
+
+    def copy(self) -> "CopyOnWriteSortedList":
+        values = CopyOnWriteSortedList()
+        values._chunks = list(self._chunks)
+        values._maxes = list(self._maxes)
+        values._length = self._length
+        values._offsets = self._offsets
+        self._owned = set()
+        return values
+
+    def _chunk(self, index: int) -> list:
+        """
+        Chunk at index, ready to be written
+        """
+        chunk = self._chunks[index]
+        if id(chunk) not in self._owned:
+            chunk = self._chunks[index] = list(chunk)
+            self._owned.add(id(chunk))
+        self._offsets = None
+        return chunk
+
+    def _offset(self, index: int) -> int:
+        if self._offsets is None:
+            self._offsets = list(
+                itertools.accumulate((len(chunk) for chunk in self._chunks), initial=0)
+            )
+        return self._offsets[index]
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __iter__(self) -> typing.Iterator:
+        return itertools.chain.from_iterable(self._chunks)
+
+    def bisect_left(self, value) -> int:
+        index = bisect.bisect_left(self._maxes, value)
+        if index == len(self._chunks):
+            return self._length
+        return self._offset(index) + bisect.bisect_left(self._chunks[index], value)
+
+    def bisect_right(self, value) -> int:
+        index = bisect.bisect_right(self._maxes, value)
+        if index == len(self._chunks):
+            return self._length
+        return self._offset(index) + bisect.bisect_right(self._chunks[index], value)
+
+    def islice(self, start: int, stop: int, reverse: bool = False) -> typing.Iterator:
+        """
+        Values from position start to stop, walking the chunks directly
+        """
+        if reverse:
+            return itertools.islice(
+                reversed(self), self._length - stop, self._length - start
+            )
+        return itertools.islice(self, start, stop)
+
+    def __reversed__(self) -> typing.Iterator:
+        return itertools.chain.from_iterable(
+            reversed(chunk) for chunk in reversed(self._chunks)
+        )
+
+    def insort(self, value):
+        self._length += 1
+        if not self._chunks:
+            chunk = [value]
+            self._chunks.append(chunk)
+            self._maxes.append(value)
+            self._owned.add(id(chunk))
+            self._offsets = None
+            return
+        index = min(bisect.bisect_left(self._maxes, value), len(self._chunks) - 1)
+        chunk = self._chunk(index)
+        bisect.insort(chunk, value)
+        self._maxes[index] = chunk[-1]
+        if len(chunk) > 2 * _LOAD:
+            first, second = chunk[:_LOAD], chunk[_LOAD:]
+            self._chunks[index : index + 1] = [first, second]
+            self._maxes[index : index + 1] = [first[-1], second[-1]]
+            self._owned.discard(id(chunk))
+            self._owned.update((id(first), id(second)))
+
+    def remove(self, value):
+        """
+        Removes value if present
+        """
+        index = bisect.bisect_left(self._maxes, value)
+        if index == len(self._chunks):
+            return
+        position = bisect.bisect_left(self._chunks[index], value)
+        if self._chunks[index][position] != value:
+            return
+        chunk = self._chunk(index)
+        del chunk[position]
+        self._length -= 1
+        if chunk:
+            self._maxes[index] = chunk[-1]
+        else:
+            self._owned.discard(id(chunk))
+            del self._chunks[index]
+            del self._maxes[index]
@@ -0,0 +1,200 @@
+import asyncio
+import functools
+import os
+import typing
+from logging import getLogger
+
+from api.entities.movie import Movie
+from api.repository.movie.abstractions import BulkResult
+from api.repository.movie.memory import MemoryMovieRepository
+from api.repository.movie.snapshot import (encode_snapshot, read_snapshot,
+                                           write_snapshot)
+from api.repository.movie.wal import WriteAheadLog
+
+SNAPSHOT_FILE = "movies.snapshot"
+WAL_DIRECTORY = "wal"
+
+
+def _movie_record(movie: Movie) -> dict:
+    return {
+        "id": movie.id,
+        "title": movie.title,
+        "description": movie.description,
+        "release_year": movie.release_year,
+        "watched": movie.watched,
+        "version": movie.version,
+    }
+
+
+def _record_movie(record: dict) -> Movie:
+    return Movie(
+        movie_id=record["id"],
+        title=record["title"],
+        description=record["description"],
+        release_year=record["release_year"],
+        watched=record["watched"],
+        version=record["version"],
+    )
+
+
+class DurableMemoryMovieRepository(MemoryMovieRepository):
+    """
+    MemoryMovieRepository which survives restarts.
+
+    Writes are appended to a write ahead log and return once it is fsync'd.
+    Every snapshot_every records all movies are saved to a binary snapshot
+    and the log it covers is deleted. initialize recovers the movies from
+    the snapshot and the rest of the log
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        fsync_interval: float = 0.005,
+        snapshot_every: int = 100_000,
+        storage_factory: typing.Callable[[], typing.MutableMapping[str, Movie]] = dict,
+    ):
+        super().__init__(storage_factory)
+        self._snapshot_path = os.path.join(directory, SNAPSHOT_FILE)
+        self._wal = WriteAheadLog(
+            os.path.join(directory, WAL_DIRECTORY), fsync_interval
+        )
+        self._snapshot_every = snapshot_every
+        self._snapshot_lsn = 0
+        self._snapshot_lock = asyncio.Lock()
+        self._snapshot_task: typing.Optional[asyncio.Future] = None
+
+    async def initialize(self):
+        await super().initialize()
+        lsn, movies = 0, []
+        if os.path.exists(self._snapshot_path):
+            lsn, movies = read_snapshot(self._snapshot_path)
+        self._load(movies)
+        for _, record in self._wal.open(after_lsn=lsn):
+            self._replay(record)
+        self._snapshot_lsn = lsn
+
+    def _replay(self, record: dict):
+        self._copy_on_write()
+        if record["op"] == "put":
+            movie = _record_movie(record["movie"])
+            existing = self._storage.get(movie.id)
+            if existing is not None:
+                self._unindex(existing)
+            self._storage[movie.id] = movie
+            self._index(movie)
+        else:
+            movie = self._storage.pop(record["id"], None)
+            if movie is not None:
+                self._unindex(movie)
+
+    async def _commit(self):
+        await self._wal.sync()
+        if (
+            self._wal.lsn - self._snapshot_lsn >= self._snapshot_every
+            and self._snapshot_task is None
+        ):
+            self._snapshot_task = asyncio.ensure_future(self.snapshot())
+            self._snapshot_task.add_done_callback(self._snapshot_done)
+
+    def _snapshot_done(self, task: asyncio.Future):
+        self._snapshot_task = None
+        if not task.cancelled() and task.exception() is not None:
+            # Retried on the next write, the log keeps every record meanwhile
+            getLogger("api.DurableMemoryMovieRepository").error(
+                "snapshot failed", exc_info=task.exception()
+            )
+
+    async def snapshot(self):
+        """
+        Saves all movies to the snapshot and deletes the log it covers
+        """
+        async with self._snapshot_lock:
+            # Taken before rotate yields, so it holds exactly the writes up
+            # to lsn while writes go on during encoding
+            view = self.frozen_view()
+            lsn = await self._wal.rotate()
+            loop = asyncio.get_running_loop()
+            data = await loop.run_in_executor(
+                None, encode_snapshot, view._storage.values(), lsn
+            )
+            await loop.run_in_executor(None, write_snapshot, self._snapshot_path, data)
+            self._wal.remove_through(lsn)
+            self._snapshot_lsn = lsn
+
+    async def close(self):
+        if self._snapshot_task is not None:
+            await asyncio.wait([self._snapshot_task])
+        await self._wal.close()
+        await super().close()
+
+    async def _create(self, movie: Movie):
+        await super().create(movie)
+        self._wal.append({"op": "put", "movie": _movie_record(movie)})
+
+    async def _update(
+        self,
+        movie_id: str,
+        params: dict,
+        expected_version: typing.Optional[int] = None,
+    ):
+        await super().update(movie_id, params, expected_version=expected_version)
+        self._wal.append({"op": "put", "movie": _movie_record(self._storage[movie_id])})
+
+    async def _delete(self, movie_id: str) -> bool:
+        deleted = await super().delete(movie_id)
+        if deleted:
+            self._wal.append({"op": "delete", "id": movie_id})
+        return deleted
+
+    async def create(self, movie: Movie):
+        await self._create(movie)
+        await self._commit()
+
+    async def update(
+        self,
+        movie_id: str,
+        params: dict,
+        expected_version: typing.Optional[int] = None,
+    ):
+        await self._update(movie_id, params, expected_version=expected_version)
+        await self._commit()
+
+    async def delete(self, movie_id: str) -> bool:
+        deleted = await self._delete(movie_id)
+        await self._commit()
+        return deleted
+
+    # Bulk writes wait for a single group commit instead of one per movie
+
+    async def bulk_create(
+        self, movies: typing.List[Movie], ordered: bool = False
+    ) -> BulkResult:
+        results = await self._bulk_apply(
+            [functools.partial(self._create, movie) for movie in movies], ordered
+        )
+        await self._commit()
+        return results
+
+    async def bulk_update(
+        self, updates: typing.List[typing.Tuple[str, dict]], ordered: bool = False
+    ) -> BulkResult:
+        results = await self._bulk_apply(
+            [
+                functools.partial(self._update, movie_id, params)
+                for movie_id, params in updates
+            ],
+            ordered,
+        )
+        await self._commit()
+        return results
+
+    async def bulk_delete(
+        self, movie_ids: typing.List[str], ordered: bool = False
+    ) -> BulkResult:
+        results = await self._bulk_apply(
+            [functools.partial(self._delete, movie_id) for movie_id in movie_ids],
+            ordered,
+        )
+        await self._commit()
+        return results
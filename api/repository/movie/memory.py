@@ -1,44 +1,494 @@
+import bisect
+import copy
+import heapq
+import itertools
 import typing
 
 from api.entities.movie import Movie
-from api.repository.movie.abstractions import (MovieRepository,
-                                               RepositoryException)
+from api.repository.movie.abstractions import (MOVIE_FIELDS, Fields, Keyset,
+                                               MovieFilter, MovieRepository,
+                                               MovieSort, RepositoryException,
+                                               TitleMatch, UpdateManyResult,
+                                               VersionConflictException,
+                                               movie_changed, project_movie)
+from api.repository.movie.copy_on_write import (CopyOnWriteMapping,
+                                                CopyOnWriteSortedList)
+from api.repository.movie.search import (InvertedIndex, normalize_prefix,
+                                         normalize_title, tokenize)
+
+# Title matches count twice as much as description matches
+_TITLE_WEIGHT = 2.0
+
+
+def _inserted(values: list, value) -> list:
+    """
+    Copy of sorted values with value inserted
+    """
+    position = bisect.bisect_left(values, value)
+    return values[:position] + [value] + values[position:]
+
+
+def _removed(values: list, value) -> list:
+    """
+    Copy of sorted values without value
+    """
+    position = bisect.bisect_left(values, value)
+    if position < len(values) and values[position] == value:
+        return values[:position] + values[position + 1 :]
+    return values
 
 
 class MemoryMovieRepository(MovieRepository):
     """
-    Implements the repository pattern using a simple in memory database
+    Implements the repository pattern using a simple in memory database.
+
+    storage_factory creates the mapping holding the movies, e.g.
+    ColumnarMovieStore to trade read speed for a smaller memory footprint.
+    It must support copy().
+
+    Stored movies are never changed, writes replace them. frozen_view shares
+    the containers holding movies and indexes with a read only view, and the
+    next write copies them before changing anything (copy on write). The
+    containers are split into buckets or chunks shared by their copies, so
+    that copy and every later write only copy the parts they touch
     """
 
-    def __init__(self):
-        self._storage = {}
+    def __init__(
+        self,
+        storage_factory: typing.Callable[[], typing.MutableMapping[str, Movie]] = dict,
+    ):
+        self._storage_factory = storage_factory
+        self._storage = CopyOnWriteMapping(storage_factory)
+        self._clear_indexes()
+        # Whether a frozen view shares the containers
+        self._shared = False
+        self._frozen = False
+        # Latest frozen view, handed out again until the next write
+        self._view: typing.Optional["MemoryMovieRepository"] = None
+
+    def _clear_indexes(self):
+        # title -> ids kept sorted
+        self._title_index: typing.MutableMapping[
+            str, typing.List[str]
+        ] = CopyOnWriteMapping()
+        # normalized title -> ids kept sorted
+        self._normalized_title_index: typing.MutableMapping[
+            str, typing.List[str]
+        ] = CopyOnWriteMapping()
+        # (normalized title, title) of every distinct title
+        self._completions = CopyOnWriteSortedList()
+        # watched -> ids
+        self._watched_index: typing.Dict[bool, typing.MutableMapping[str, None]] = {
+            True: CopyOnWriteMapping(),
+            False: CopyOnWriteMapping(),
+        }
+        # (release_year, id) pairs
+        self._year_index = CopyOnWriteSortedList()
+        # All ids. Time ordered ids are inserted into the last chunk
+        self._id_index = CopyOnWriteSortedList()
+        self._title_text_index = InvertedIndex()
+        self._description_text_index = InvertedIndex()
+
+    def _load(self, movies: typing.Iterable[Movie]):
+        """
+        Replaces all movies, building the indexes in one pass instead of
+        inserting movies one by one
+        """
+        self._storage = CopyOnWriteMapping(self._storage_factory)
+        self._storage.update((movie.id, movie) for movie in movies)
+        self._clear_indexes()
+        self._view = None
+        title_index: typing.Dict[str, typing.List[str]] = {}
+        normalized_title_index: typing.Dict[str, typing.List[str]] = {}
+        year_index = []
+        movie_ids = sorted(self._storage)
+        # In id order, so appending keeps the id lists sorted
+        for movie_id in movie_ids:
+            movie = self._storage[movie_id]
+            title_index.setdefault(movie.title, []).append(movie_id)
+            normalized_title_index.setdefault(normalize_title(movie.title), []).append(
+                movie_id
+            )
+            self._watched_index[bool(movie.watched)][movie_id] = None
+            year_index.append((movie.release_year, movie_id))
+            self._title_text_index.add(movie_id, movie.title)
+            self._description_text_index.add(movie_id, movie.description)
+        self._title_index.update(title_index)
+        self._normalized_title_index.update(normalized_title_index)
+        self._completions = CopyOnWriteSortedList(
+            (normalize_title(title), title) for title in title_index
+        )
+        self._year_index = CopyOnWriteSortedList(year_index)
+        self._id_index = CopyOnWriteSortedList(movie_ids)
+
+    def frozen_view(self) -> "MemoryMovieRepository":
+        """
+        Read only view of the movies as they are now, taken in O(1). Later
+        writes are not visible in it, so it serves scans spanning many
+        batches or exports while writes go on. Full text search is not
+        available on it.
+
+        Views taken between two writes are the same, so that concurrent
+        iterations share the copies made by the next write
+        """
+        if self._view is not None:
+            return self._view
+        view = copy.copy(self)
+        view._frozen = True
+        view._view = None
+        view._title_text_index = view._description_text_index = None
+        self._shared = True
+        self._view = view
+        return view
+
+    def _copy_on_write(self):
+        """
+        Copies the containers shared with frozen views before a write, in
+        O(N / bucket size). Lists of IDs in the title indexes are replaced on
+        every write instead
+        """
+        if self._frozen:
+            raise RepositoryException("Can't write to a frozen view")
+        if not self._shared:
+            return
+        self._view = None
+        self._storage = self._storage.copy()
+        self._title_index = self._title_index.copy()
+        self._normalized_title_index = self._normalized_title_index.copy()
+        self._completions = self._completions.copy()
+        self._watched_index = {
+            watched: ids.copy() for watched, ids in self._watched_index.items()
+        }
+        self._year_index = self._year_index.copy()
+        self._id_index = self._id_index.copy()
+        self._shared = False
+
+    def _index(self, movie: Movie):
+        normalized = normalize_title(movie.title)
+        ids = self._title_index.get(movie.title, [])
+        if not ids:
+            self._completions.insort((normalized, movie.title))
+        self._title_index[movie.title] = _inserted(ids, movie.id)
+        self._normalized_title_index[normalized] = _inserted(
+            self._normalized_title_index.get(normalized, []), movie.id
+        )
+        self._watched_index[bool(movie.watched)][movie.id] = None
+        self._year_index.insort((movie.release_year, movie.id))
+        self._id_index.insort(movie.id)
+        self._title_text_index.add(movie.id, movie.title)
+        self._description_text_index.add(movie.id, movie.description)
+
+    def _unindex(self, movie: Movie):
+        normalized = normalize_title(movie.title)
+        ids = self._title_index.get(movie.title)
+        if ids is not None:
+            ids = _removed(ids, movie.id)
+            if ids:
+                self._title_index[movie.title] = ids
+            else:
+                del self._title_index[movie.title]
+                self._completions.remove((normalized, movie.title))
+        ids = self._normalized_title_index.get(normalized)
+        if ids is not None:
+            ids = _removed(ids, movie.id)
+            if ids:
+                self._normalized_title_index[normalized] = ids
+            else:
+                del self._normalized_title_index[normalized]
+        self._watched_index[bool(movie.watched)].pop(movie.id, None)
+        self._year_index.remove((movie.release_year, movie.id))
+        self._id_index.remove(movie.id)
+        self._title_text_index.remove(movie.id, movie.title)
+        self._description_text_index.remove(movie.id, movie.description)
+
+    def _year_range(self, movie_filter: MovieFilter) -> typing.Tuple[int, int]:
+        """
+        Returns the slice of the year index covered by the filter
+        """
+        low, high = 0, len(self._year_index)
+        if movie_filter.min_release_year is not None:
+            low = self._year_index.bisect_left((movie_filter.min_release_year,))
+        if movie_filter.max_release_year is not None:
+            high = self._year_index.bisect_left((movie_filter.max_release_year + 1,))
+        return low, max(low, high)
+
+    def _id_range(self, movie_filter: MovieFilter) -> typing.Tuple[int, int]:
+        """
+        Returns the slice of the id index covered by the filter
+        """
+        low, high = 0, len(self._id_index)
+        if movie_filter.min_id is not None:
+            low = self._id_index.bisect_left(movie_filter.min_id)
+        if movie_filter.max_id is not None:
+            high = self._id_index.bisect_right(movie_filter.max_id)
+        return low, max(low, high)
+
+    def _candidates(
+        self,
+        movie_filter: MovieFilter,
+        sort: MovieSort,
+        after: typing.Optional[Keyset],
+    ) -> typing.Tuple[typing.Iterable[str], bool]:
+        """
+        Picks the most selective index for the filter.
+
+        Returns candidate ids and whether they are already in the requested order
+        and positioned after the keyset
+        """
+        low, high = self._year_range(movie_filter)
+        id_low, id_high = self._id_range(movie_filter)
+        # Seek straight to the keyset instead of walking previous pages
+        if after is not None and sort.field == "release_year":
+            if sort.descending:
+                high = min(high, self._year_index.bisect_left(tuple(after)))
+            else:
+                low = max(low, self._year_index.bisect_right(tuple(after)))
+            high = max(low, high)
+        if after is not None and sort.field == "id":
+            if sort.descending:
+                id_high = min(id_high, self._id_index.bisect_left(after[1]))
+            else:
+                id_low = max(id_low, self._id_index.bisect_right(after[1]))
+            id_high = max(id_low, id_high)
+        year_ordered = sort.field == "release_year"
+        id_ordered = sort.field == "id"
+        options = []
+        if (
+            movie_filter.min_release_year is not None
+            or movie_filter.max_release_year is not None
+            or year_ordered
+        ):
+            options.append((high - low, "year"))
+        if (
+            movie_filter.min_id is not None
+            or movie_filter.max_id is not None
+            or id_ordered
+        ):
+            options.append((id_high - id_low, "id"))
+        if movie_filter.title is not None:
+            ids = self._title_index.get(movie_filter.title, [])
+            options.append((len(ids), "title"))
+        if movie_filter.watched is not None:
+            ids = self._watched_index[movie_filter.watched]
+            options.append((len(ids), "watched"))
+        if not options:
+            return self._storage.keys(), False
+        # Prefer the index providing the ordering on ties
+        preferred = "id" if id_ordered else "year"
+        _, chosen = min(options, key=lambda option: (option[0], option[1] != preferred))
+        if chosen == "title":
+            return self._title_index.get(movie_filter.title, []), False
+        if chosen == "watched":
+            return self._watched_index[movie_filter.watched], False
+        if chosen == "id":
+            ids = self._id_index.islice(
+                id_low, id_high, reverse=id_ordered and sort.descending
+            )
+            return ids, id_ordered
+        pairs = self._year_index.islice(
+            low, high, reverse=year_ordered and sort.descending
+        )
+        return (movie_id for _, movie_id in pairs), year_ordered
 
     async def create(self, movie: Movie):
+        self._copy_on_write()
+        existing = self._storage.get(movie.id)
+        if existing is not None:
+            self._unindex(existing)
+        movie._version = existing.version + 1 if existing is not None else 1
         self._storage[movie.id] = movie
+        self._index(movie)
+
+    async def get_by_id(
+        self, movie_id: str, fields: Fields = None
+    ) -> typing.Optional[Movie]:
+        movie = self._storage.get(movie_id)
+        if movie is None:
+            return None
+        return project_movie(movie, fields)
+
+    async def get_many(self, movie_ids: typing.List[str]) -> typing.Dict[str, Movie]:
+        storage = self._storage
+        return {
+            movie_id: storage[movie_id] for movie_id in movie_ids if movie_id in storage
+        }
+
+    async def search(self, query: str, limit: int = 20) -> typing.List[Movie]:
+        if self._frozen:
+            raise RepositoryException("Can't search a frozen view")
+        terms = tokenize(query)
+        scores = self._description_text_index.scores(terms)
+        for movie_id, score in self._title_text_index.scores(terms).items():
+            scores[movie_id] += _TITLE_WEIGHT * score
+        best = heapq.nsmallest(
+            limit, scores, key=lambda movie_id: (-scores[movie_id], movie_id)
+        )
+        return [self._storage[movie_id] for movie_id in best]
 
-    async def get_by_id(self, movie_id: str) -> typing.Optional[Movie]:
-        return self._storage.get(movie_id)
+    async def autocomplete(self, prefix: str, limit: int = 10) -> typing.List[str]:
+        prefix = normalize_prefix(prefix)
+        if not prefix:
+            return []
+        start = self._completions.bisect_left((prefix,))
+        titles = []
+        for normalized, title in self._completions.islice(start, start + limit):
+            if not normalized.startswith(prefix):
+                break
+            titles.append(title)
+        return titles
 
     async def get_by_title(
-        self, title: str, skip: int = 0, limit: int = 1000
+        self,
+        title: str,
+        skip: int = 0,
+        limit: int = 1000,
+        after: typing.Optional[str] = None,
+        fields: Fields = None,
+        match: TitleMatch = TitleMatch.EXACT,
     ) -> typing.List[Movie]:
-        return_value = []
-        for _, value in self._storage.items():
-            if title == value.title:
-                return_value.append(value)
-        if limit == 0:
-            return return_value[skip:]
-        return return_value[skip : skip + limit]
+        if match == TitleMatch.NORMALIZED:
+            ids = self._normalized_title_index.get(normalize_title(title))
+        else:
+            ids = self._title_index.get(title)
+        if not ids:
+            return []
+        start = skip
+        if after is not None:
+            start += bisect.bisect_right(ids, after)
+        stop = None if limit == 0 else start + limit
+        return [
+            project_movie(self._storage[movie_id], fields)
+            for movie_id in ids[start:stop]
+        ]
+
+    async def find(
+        self,
+        movie_filter: MovieFilter,
+        sort: MovieSort = MovieSort.RELEASE_YEAR_ASC,
+        skip: int = 0,
+        limit: int = 1000,
+        after: typing.Optional[Keyset] = None,
+        fields: Fields = None,
+    ) -> typing.List[Movie]:
+        candidates, ordered = self._candidates(movie_filter, sort, after)
+        movies = (self._storage[movie_id] for movie_id in candidates)
+        matches = (movie for movie in movies if movie_filter.matches(movie))
+        if not ordered:
+
+            def sort_key(movie: Movie) -> Keyset:
+                return getattr(movie, sort.field), movie.id
+
+            if after is not None:
+                after = tuple(after)
+                if sort.descending:
+                    matches = (movie for movie in matches if sort_key(movie) < after)
+                else:
+                    matches = (movie for movie in matches if sort_key(movie) > after)
+            matches = sorted(matches, key=sort_key, reverse=sort.descending)
+        stop = None if limit == 0 else skip + limit
+        page = itertools.islice(matches, skip, stop)
+        if fields is None:
+            return list(page)
+        fields = {*fields, sort.field}
+        return [project_movie(movie, fields) for movie in page]
+
+    # Every batch of an iteration is read from the same frozen view, so
+    # concurrent writes can't shift pages or show half of a bulk write
+
+    def iter_by_title(
+        self,
+        title: str,
+        skip: int = 0,
+        limit: int = 0,
+        after: typing.Optional[str] = None,
+        batch_size: int = 1000,
+        fields: Fields = None,
+        match: TitleMatch = TitleMatch.EXACT,
+    ) -> typing.AsyncIterator[Movie]:
+        view = self if self._frozen else self.frozen_view()
+        return super(MemoryMovieRepository, view).iter_by_title(
+            title=title,
+            skip=skip,
+            limit=limit,
+            after=after,
+            batch_size=batch_size,
+            fields=fields,
+            match=match,
+        )
+
+    def iter_find(
+        self,
+        movie_filter: MovieFilter,
+        sort: MovieSort = MovieSort.RELEASE_YEAR_ASC,
+        skip: int = 0,
+        limit: int = 0,
+        after: typing.Optional[Keyset] = None,
+        batch_size: int = 1000,
+        fields: Fields = None,
+    ) -> typing.AsyncIterator[Movie]:
+        view = self if self._frozen else self.frozen_view()
+        return super(MemoryMovieRepository, view).iter_find(
+            movie_filter=movie_filter,
+            sort=sort,
+            skip=skip,
+            limit=limit,
+            after=after,
+            batch_size=batch_size,
+            fields=fields,
+        )
 
     async def delete(self, movie_id: str) -> bool:
-        self._storage.pop(movie_id, None)
+        self._copy_on_write()
+        movie = self._storage.pop(movie_id, None)
+        if movie is None:
+            return False
+        self._unindex(movie)
+        return True
 
-    async def update(self, movie_id: str, params: dict):
+    async def update(
+        self,
+        movie_id: str,
+        params: dict,
+        expected_version: typing.Optional[int] = None,
+    ):
         movie = self._storage.get(movie_id)
         if movie is None:
             raise RepositoryException(f"Movie: {movie_id} not found")
-        for key, value in params.items():
-            if key == "id":
-                raise RepositoryException("Can't update Movie ID.")
-            if hasattr(movie, key):
-                setattr(movie, f"_{key}", value)
+        if "id" in params:
+            raise RepositoryException("Can't update Movie ID.")
+        if "version" in params:
+            raise RepositoryException("Can't update Movie version.")
+        if expected_version is not None and movie.version != expected_version:
+            raise VersionConflictException(
+                f"Movie: {movie_id} is at version {movie.version}"
+            )
+        self._copy_on_write()
+        self._unindex(movie)
+        # A new movie, readers holding the previous one never see it change
+        fields = {field: getattr(movie, field) for field in MOVIE_FIELDS}
+        fields.update((key, value) for key, value in params.items() if key in fields)
+        updated = Movie(movie_id=movie_id, version=movie.version + 1, **fields)
+        self._storage[movie_id] = updated
+        self._index(updated)
+
+    async def update_many(
+        self, movie_filter: MovieFilter, params: dict
+    ) -> UpdateManyResult:
+        if "id" in params:
+            raise RepositoryException("Can't update Movie ID.")
+        if "version" in params:
+            raise RepositoryException("Can't update Movie version.")
+        self._copy_on_write()
+        candidates, _ = self._candidates(movie_filter, MovieSort.ID_ASC, None)
+        # Collected first, updates change the indexes the candidates come from
+        matches = [
+            movie
+            for movie in (self._storage[movie_id] for movie_id in candidates)
+            if movie_filter.matches(movie)
+        ]
+        updates = [
+            (movie.id, params) for movie in matches if movie_changed(movie, params)
+        ]
+        # bulk_update, so subclasses persist the updates like any other
+        results = await self.bulk_update(updates) if updates else []
+        return UpdateManyResult(matched=len(matches), modified=results.count(None))
@@ -1,10 +1,22 @@
 import typing
 
 import motor.motor_asyncio
+import pymongo
+from pymongo import DeleteOne, IndexModel, UpdateOne
+from pymongo.errors import BulkWriteError
 
 from api.entities.movie import Movie
-from api.repository.movie.abstractions import (MovieRepository,
-                                               RepositoryException)
+from api.repository.movie.abstractions import (NOT_EXECUTED, BulkResult,
+                                               Fields, Keyset, MovieFilter,
+                                               MovieRepository, MovieSort,
+                                               RepositoryException, TitleMatch,
+                                               UpdateManyResult,
+                                               VersionConflictException)
+from api.repository.movie.search import (normalize_prefix, normalize_title,
+                                         prefix_upper_bound)
+
+# Leaves out the ObjectId, which is never used and costly to decode
+_PROJECTION = {"_id": 0}
 
 
 class MongoMovieRepository(MovieRepository):
@@ -12,68 +24,587 @@ class MongoMovieRepository(MovieRepository):
     Implements the repository pattern using a Mongo database
     """
 
+    # Equality fields first, then the sort field, then id as tie breaker
+    INDEXES = [
+        IndexModel([("id", pymongo.ASCENDING)], name="id_unique", unique=True),
+        IndexModel(
+            [("title", pymongo.ASCENDING), ("id", pymongo.ASCENDING)], name="title_id"
+        ),
+        IndexModel(
+            [
+                ("title", pymongo.ASCENDING),
+                ("release_year", pymongo.ASCENDING),
+                ("id", pymongo.ASCENDING),
+            ],
+            name="title_release_year_id",
+        ),
+        IndexModel(
+            [
+                ("watched", pymongo.ASCENDING),
+                ("release_year", pymongo.ASCENDING),
+                ("id", pymongo.ASCENDING),
+            ],
+            name="watched_release_year_id",
+        ),
+        IndexModel(
+            [("release_year", pymongo.ASCENDING), ("id", pymongo.ASCENDING)],
+            name="release_year_id",
+        ),
+        IndexModel(
+            [("title_normalized", pymongo.ASCENDING), ("id", pymongo.ASCENDING)],
+            name="title_normalized_id",
+        ),
+        # Covers autocomplete queries, documents are never fetched
+        IndexModel(
+            [("title_normalized", pymongo.ASCENDING), ("title", pymongo.ASCENDING)],
+            name="title_normalized_title",
+        ),
+        IndexModel(
+            [("title", pymongo.TEXT), ("description", pymongo.TEXT)],
+            name="title_description_text",
+            weights={"title": 2, "description": 1},
+        ),
+    ]
+
     def __init__(
         self,
         conn_string: str = "mongodb://localhost:27017",
         database: str = "movie_track_db",
+        ensure_indexes: bool = True,
+        verify_query_plans: bool = False,
     ):
         self._client = motor.motor_asyncio.AsyncIOMotorClient(conn_string)
         self._database = self._client[database]
         self._movies = self._database["movies"]
+        self._ensure_indexes = ensure_indexes
+        self._verify_query_plans = verify_query_plans
+
+    async def initialize(self):
+        if self._ensure_indexes:
+            await self.ensure_indexes()
+            await self.backfill_normalized_titles()
+            await self.backfill_versions()
+        if self._verify_query_plans:
+            await self.verify_query_plans()
+
+    async def ensure_indexes(self):
+        """
+        Creates the indexes required by the queries. Existing indexes are kept
+        """
+        await self._movies.create_indexes(self.INDEXES)
+
+    async def backfill_normalized_titles(self):
+        """
+        Sets title_normalized on documents written before it existed
+        """
+        requests = []
+        async for document in self._movies.find(
+            {"title_normalized": {"$exists": False}}, {"_id": 0, "id": 1, "title": 1}
+        ):
+            requests.append(
+                UpdateOne(
+                    {"id": document["id"]},
+                    {
+                        "$set": {
+                            "title_normalized": normalize_title(document.get("title"))
+                        }
+                    },
+                )
+            )
+            if len(requests) == 1000:
+                await self._movies.bulk_write(requests, ordered=False)
+                requests = []
+        if requests:
+            await self._movies.bulk_write(requests, ordered=False)
+
+    async def backfill_versions(self):
+        """
+        Sets version 1 on documents written before versions existed, so that
+        their next write increments it to 2 like for every other backend
+        """
+        await self._movies.update_many(
+            {"version": {"$exists": False}}, {"$set": {"version": 1}}
+        )
+
+    def _query_shapes(self) -> typing.Dict[str, typing.Any]:
+        """
+        One cursor per query shape issued by this repository
+        """
+        keyset = (2000, "")
+        return {
+            "get_by_id": self._movies.find({"id": ""}).limit(1),
+            "get_many": self._movies.find({"id": {"$in": [""]}}),
+            "iter_ids": self._ids_cursor(),
+            "get_by_title": self._title_cursor("", 0, 0, None),
+            "get_by_title_after": self._title_cursor("", 0, 0, ""),
+            "get_by_normalized_title": self._title_cursor(
+                "", 0, 0, "", match=TitleMatch.NORMALIZED
+            ),
+            "find_watched_years": self._find_cursor(
+                MovieFilter(
+                    min_release_year=1990, max_release_year=2000, watched=False
+                ),
+                MovieSort.RELEASE_YEAR_DESC,
+                0,
+                0,
+                None,
+            ),
+            "find_title_years": self._find_cursor(
+                MovieFilter(title="", min_release_year=1990),
+                MovieSort.RELEASE_YEAR_ASC,
+                0,
+                0,
+                None,
+            ),
+            "find_years_after": self._find_cursor(
+                MovieFilter(min_release_year=1990),
+                MovieSort.RELEASE_YEAR_ASC,
+                0,
+                0,
+                keyset,
+            ),
+            "find_title_sorted": self._find_cursor(
+                MovieFilter(), MovieSort.TITLE_ASC, 0, 0, None
+            ),
+            "search": self._search_cursor("", 20),
+            "autocomplete": self._autocomplete_cursor("a"),
+            "find_recently_added": self._find_cursor(
+                MovieFilter(min_id=""), MovieSort.ID_DESC, 0, 0, ("", "")
+            ),
+        }
+
+    @classmethod
+    def _collection_scans(cls, plan) -> bool:
+        """
+        True if any stage of an explain() plan scans the whole collection
+        """
+        if isinstance(plan, dict):
+            if plan.get("stage") == "COLLSCAN":
+                return True
+            return any(cls._collection_scans(value) for value in plan.values())
+        if isinstance(plan, list):
+            return any(cls._collection_scans(value) for value in plan)
+        return False
+
+    async def verify_query_plans(self):
+        """
+        Runs explain() on every query shape
+
+        Raises RepositoryException if any of them is not served by an index
+        """
+        unindexed = []
+        for name, cursor in self._query_shapes().items():
+            explanation = await cursor.explain()
+            if self._collection_scans(explanation["queryPlanner"]["winningPlan"]):
+                unindexed.append(name)
+        if unindexed:
+            raise RepositoryException(
+                f"Queries not backed by an index: {', '.join(unindexed)}"
+            )
+
+    @staticmethod
+    def _to_movie(document: dict) -> Movie:
+        return Movie(
+            movie_id=document.get("id"),
+            title=document.get("title"),
+            description=document.get("description"),
+            release_year=document.get("release_year"),
+            watched=document.get("watched"),
+            version=document.get("version", 1),
+        )
+
+    @staticmethod
+    def _to_document(movie: Movie) -> dict:
+        return {
+            "id": movie.id,
+            "title": movie.title,
+            "description": movie.description,
+            "release_year": movie.release_year,
+            "watched": movie.watched,
+            "title_normalized": normalize_title(movie.title),
+        }
+
+    @staticmethod
+    def _update_document(params: dict) -> dict:
+        """
+        Update params plus the fields derived from them
+        """
+        if "title" not in params:
+            return params
+        return {**params, "title_normalized": normalize_title(params["title"])}
+
+    @staticmethod
+    def _projection(fields: Fields, *required: str) -> dict:
+        """
+        Projection loading only the requested fields, the required ones,
+        ID and version. Everything is loaded when fields is None
+        """
+        if fields is None:
+            return _PROJECTION
+        projection = {"_id": 0, "id": 1, "version": 1}
+        projection.update((field, 1) for field in (*fields, *required))
+        return projection
+
+    @staticmethod
+    def _filter_query(movie_filter: MovieFilter) -> dict:
+        """
+        Builds a query whose shape matches the compound indexes:
+        equality fields first, then the release_year range
+        """
+        query = {}
+        if movie_filter.title is not None:
+            query["title"] = movie_filter.title
+        if movie_filter.watched is not None:
+            query["watched"] = movie_filter.watched
+        year_range = {}
+        if movie_filter.min_release_year is not None:
+            year_range["$gte"] = movie_filter.min_release_year
+        if movie_filter.max_release_year is not None:
+            year_range["$lte"] = movie_filter.max_release_year
+        if year_range:
+            query["release_year"] = year_range
+        id_range = {}
+        if movie_filter.min_id is not None:
+            id_range["$gte"] = movie_filter.min_id
+        if movie_filter.max_id is not None:
+            id_range["$lte"] = movie_filter.max_id
+        if id_range:
+            query["id"] = id_range
+        return query
+
+    @staticmethod
+    def _keyset_query(sort: MovieSort, after: Keyset) -> dict:
+        """
+        Matches documents sorting after the keyset so deep pages seek
+        through the index instead of skipping documents
+        """
+        operator = "$lt" if sort.descending else "$gt"
+        value, movie_id = after
+        if sort.field == "id":
+            return {"id": {operator: movie_id}}
+        return {
+            "$or": [
+                {sort.field: {operator: value}},
+                {sort.field: value, "id": {operator: movie_id}},
+            ]
+        }
 
     async def create(self, movie: Movie):
 
         await self._movies.update_one(
             {"id": movie.id},
-            {
-                "$set": {
-                    "id": movie.id,
-                    "title": movie.title,
-                    "description": movie.description,
-                    "release_year": movie.release_year,
-                    "watched": movie.watched,
-                }
-            },
+            {"$set": self._to_document(movie), "$inc": {"version": 1}},
             upsert=True,
         )
 
-    async def get_by_id(self, movie_id: str) -> typing.Optional[Movie]:
-        document = await self._movies.find_one({"id": movie_id})
+    async def get_by_id(
+        self, movie_id: str, fields: Fields = None
+    ) -> typing.Optional[Movie]:
+        document = await self._movies.find_one(
+            {"id": movie_id}, self._projection(fields)
+        )
         if document:
-            return Movie(
-                movie_id=document.get("id"),
-                title=document.get("title"),
-                description=document.get("description"),
-                release_year=document.get("release_year"),
-                watched=document.get("watched"),
-            )
+            return self._to_movie(document)
         return None
 
+    async def get_many(self, movie_ids: typing.List[str]) -> typing.Dict[str, Movie]:
+        documents = self._movies.find({"id": {"$in": list(movie_ids)}}, _PROJECTION)
+        return {
+            document["id"]: self._to_movie(document) async for document in documents
+        }
+
+    def _title_cursor(
+        self,
+        title: str,
+        skip: int,
+        limit: int,
+        after: typing.Optional[str],
+        fields: Fields = None,
+        match: TitleMatch = TitleMatch.EXACT,
+    ):
+        if match == TitleMatch.NORMALIZED:
+            query = {"title_normalized": normalize_title(title)}
+        else:
+            query = {"title": title}
+        if after is not None:
+            query["id"] = {"$gt": after}
+        return (
+            self._movies.find(query, self._projection(fields))
+            .sort("id", pymongo.ASCENDING)
+            .skip(skip)
+            .limit(limit)
+        )
+
+    def _autocomplete_cursor(self, prefix: str):
+        return self._movies.find(
+            {"title_normalized": {"$gte": prefix, "$lt": prefix_upper_bound(prefix)}},
+            {"_id": 0, "title_normalized": 1, "title": 1},
+        ).sort([("title_normalized", pymongo.ASCENDING), ("title", pymongo.ASCENDING)])
+
+    def _search_cursor(self, query: str, limit: int):
+        score = {"$meta": "textScore"}
+        return (
+            self._movies.find(
+                {"$text": {"$search": query}}, {**_PROJECTION, "score": score}
+            )
+            .sort([("score", score), ("id", pymongo.ASCENDING)])
+            .limit(limit)
+        )
+
+    def _ids_cursor(self):
+        return self._movies.find({}, {"_id": 0, "id": 1}).sort("id", pymongo.ASCENDING)
+
+    def _find_cursor(
+        self,
+        movie_filter: MovieFilter,
+        sort: MovieSort,
+        skip: int,
+        limit: int,
+        after: typing.Optional[Keyset],
+        fields: Fields = None,
+    ):
+        direction = pymongo.DESCENDING if sort.descending else pymongo.ASCENDING
+        query = self._filter_query(movie_filter)
+        if after is not None:
+            query = {"$and": [query, self._keyset_query(sort, after)]}
+        sort_keys = [(sort.field, direction)]
+        if sort.field != "id":
+            sort_keys.append(("id", direction))
+        return (
+            self._movies.find(query, self._projection(fields, sort.field))
+            .sort(sort_keys)
+            .skip(skip)
+            .limit(limit)
+        )
+
+    async def autocomplete(self, prefix: str, limit: int = 10) -> typing.List[str]:
+        prefix = normalize_prefix(prefix)
+        if not prefix:
+            return []
+        titles: typing.List[str] = []
+        # Movies sharing a title are adjacent in the index, skip over them
+        documents = self._autocomplete_cursor(prefix).batch_size(limit)
+        async for document in documents:
+            if not titles or titles[-1] != document["title"]:
+                titles.append(document["title"])
+                if len(titles) == limit:
+                    break
+        await documents.close()
+        return titles
+
+    async def search(self, query: str, limit: int = 20) -> typing.List[Movie]:
+        documents = self._search_cursor(query, limit)
+        return [self._to_movie(document) async for document in documents]
+
     async def get_by_title(
-        self, title: str, skip: int = 0, limit: int = 1000
+        self,
+        title: str,
+        skip: int = 0,
+        limit: int = 1000,
+        after: typing.Optional[str] = None,
+        fields: Fields = None,
+        match: TitleMatch = TitleMatch.EXACT,
     ) -> typing.List[Movie]:
         return_value: typing.List[Movie] = []
         # Get cursor from DB
-        documents = self._movies.find({"title": title}).skip(skip).limit(limit)
+        documents = self._title_cursor(title, skip, limit, after, fields, match)
         # Iterate through documents
         async for document in documents:
-            return_value.append(
-                Movie(
-                    movie_id=document.get("id"),
-                    title=document.get("title"),
-                    description=document.get("description"),
-                    release_year=document.get("release_year"),
-                    watched=document.get("watched"),
-                )
-            )
+            return_value.append(self._to_movie(document))
         return return_value
 
+    async def find(
+        self,
+        movie_filter: MovieFilter,
+        sort: MovieSort = MovieSort.RELEASE_YEAR_ASC,
+        skip: int = 0,
+        limit: int = 1000,
+        after: typing.Optional[Keyset] = None,
+        fields: Fields = None,
+    ) -> typing.List[Movie]:
+        documents = self._find_cursor(movie_filter, sort, skip, limit, after, fields)
+        return [self._to_movie(document) async for document in documents]
+
+    async def iter_by_title(
+        self,
+        title: str,
+        skip: int = 0,
+        limit: int = 0,
+        after: typing.Optional[str] = None,
+        batch_size: int = 1000,
+        fields: Fields = None,
+        match: TitleMatch = TitleMatch.EXACT,
+    ) -> typing.AsyncIterator[Movie]:
+        documents = self._title_cursor(title, skip, limit, after, fields, match)
+        async for document in documents.batch_size(batch_size):
+            yield self._to_movie(document)
+
+    async def iter_find(
+        self,
+        movie_filter: MovieFilter,
+        sort: MovieSort = MovieSort.RELEASE_YEAR_ASC,
+        skip: int = 0,
+        limit: int = 0,
+        after: typing.Optional[Keyset] = None,
+        batch_size: int = 1000,
+        fields: Fields = None,
+    ) -> typing.AsyncIterator[Movie]:
+        documents = self._find_cursor(movie_filter, sort, skip, limit, after, fields)
+        async for document in documents.batch_size(batch_size):
+            yield self._to_movie(document)
+
+    async def iter_ids(self, batch_size: int = 1000) -> typing.AsyncIterator[str]:
+        # Covered by the id index, documents are never fetched
+        documents = self._ids_cursor()
+        async for document in documents.batch_size(batch_size):
+            yield document["id"]
+
     async def delete(self, movie_id: str) -> bool:
-        await self._movies.delete_one({"id": movie_id})
+        result = await self._movies.delete_one({"id": movie_id})
+        return result.deleted_count > 0
 
-    async def update(self, movie_id: str, params: dict):
+    async def update(
+        self,
+        movie_id: str,
+        params: dict,
+        expected_version: typing.Optional[int] = None,
+    ):
         if "id" in params:
             raise RepositoryException("Can't update Movie ID")
-        result = await self._movies.update_one({"id": movie_id}, {"$set": params})
+        if "version" in params:
+            raise RepositoryException("Can't update Movie version")
+        query = {"id": movie_id}
+        if expected_version is not None:
+            query["version"] = expected_version
+        result = await self._movies.update_one(
+            query, {"$set": self._update_document(params), "$inc": {"version": 1}}
+        )
         if result.modified_count == 0:
+            if expected_version is not None:
+                document = await self._movies.find_one(
+                    {"id": movie_id}, {"version": 1, "_id": 0}
+                )
+                if document is not None:
+                    raise VersionConflictException(
+                        f"Movie: {movie_id} is at version {document.get('version', 1)}"
+                    )
             raise RepositoryException(f"Movie: {movie_id} not updated")
+
+    async def update_many(
+        self, movie_filter: MovieFilter, params: dict
+    ) -> UpdateManyResult:
+        if "id" in params:
+            raise RepositoryException("Can't update Movie ID")
+        if "version" in params:
+            raise RepositoryException("Can't update Movie version")
+        query = self._filter_query(movie_filter)
+        if not params:
+            return UpdateManyResult(
+                matched=await self._movies.count_documents(query), modified=0
+            )
+        # Expressions of a $set stage see the document before the stage, so
+        # the version is only incremented for movies which change. Documents
+        # left as they were don't count as modified
+        changed = {
+            "$or": [
+                {"$ne": [f"${field}", {"$literal": value}]}
+                for field, value in params.items()
+            ]
+        }
+        version = {"$add": [{"$ifNull": ["$version", 1]}, 1]}
+        result = await self._movies.update_many(
+            query,
+            [
+                {
+                    "$set": {
+                        **{
+                            field: {"$literal": value}
+                            for field, value in self._update_document(params).items()
+                        },
+                        "version": {"$cond": [changed, version, "$version"]},
+                    }
+                }
+            ],
+        )
+        return UpdateManyResult(
+            matched=result.matched_count, modified=result.modified_count
+        )
+
+    async def _bulk_write(
+        self,
+        requests: list,
+        positions: typing.List[int],
+        results: BulkResult,
+        ordered: bool,
+    ) -> BulkResult:
+        """
+        Sends all requests in a single bulk_write and records write errors
+        at the result position of the failing request
+        """
+        if not requests:
+            return results
+        try:
+            await self._movies.bulk_write(requests, ordered=ordered)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            for error in errors:
+                results[positions[error["index"]]] = error.get("errmsg", "write failed")
+            if ordered and errors:
+                for position in positions[errors[0]["index"] + 1 :]:
+                    results[position] = NOT_EXECUTED
+        return results
+
+    async def bulk_create(
+        self, movies: typing.List[Movie], ordered: bool = False
+    ) -> BulkResult:
+        requests = [
+            UpdateOne(
+                {"id": movie.id},
+                {"$set": self._to_document(movie), "$inc": {"version": 1}},
+                upsert=True,
+            )
+            for movie in movies
+        ]
+        return await self._bulk_write(
+            requests, list(range(len(movies))), [None] * len(movies), ordered
+        )
+
+    async def bulk_update(
+        self, updates: typing.List[typing.Tuple[str, dict]], ordered: bool = False
+    ) -> BulkResult:
+        results: BulkResult = [None] * len(updates)
+        # One round trip to report missing movies per item
+        existing = {
+            document["id"]
+            async for document in self._movies.find(
+                {"id": {"$in": [movie_id for movie_id, _ in updates]}},
+                {"id": 1, "_id": 0},
+            )
+        }
+        requests, positions = [], []
+        for position, (movie_id, params) in enumerate(updates):
+            if "id" in params or "version" in params:
+                results[position] = "Can't update Movie ID or version"
+            elif movie_id not in existing:
+                results[position] = f"Movie: {movie_id} not found"
+            else:
+                requests.append(
+                    UpdateOne(
+                        {"id": movie_id},
+                        {"$set": self._update_document(params), "$inc": {"version": 1}},
+                    )
+                )
+                positions.append(position)
+                continue
+            if ordered:
+                results[position + 1 :] = [NOT_EXECUTED] * (len(updates) - position - 1)
+                break
+        return await self._bulk_write(requests, positions, results, ordered)
+
+    async def bulk_delete(
+        self, movie_ids: typing.List[str], ordered: bool = False
+    ) -> BulkResult:
+        requests = [DeleteOne({"id": movie_id}) for movie_id in movie_ids]
+        return await self._bulk_write(
+            requests, list(range(len(movie_ids))), [None] * len(movie_ids), ordered
+        )
@@ -0,0 +1,162 @@
+import array
+import collections
+import math
+import re
+import typing
+import unicodedata
+
+_TOKEN = re.compile(r"\w+")
+_WHITESPACE = re.compile(r"\s+")
+# Removed documents kept in an InvertedIndex before compacting is considered
+_MIN_DEAD = 1024
+
+
+def normalize_title(title: typing.Optional[str]) -> str:
+    """
+    Case folded title without diacritics and with single spaces, used to
+    match titles the way users type them
+    """
+    if not title:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", title)
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return _WHITESPACE.sub(" ", stripped.casefold()).strip()
+
+
+def normalize_prefix(prefix: str) -> str:
+    """
+    Normalizes a typed prefix like normalize_title, keeping a trailing space
+    so that a finished word only completes to titles continuing after it
+    """
+    normalized = normalize_title(prefix)
+    if normalized and prefix[-1:].isspace():
+        normalized += " "
+    return normalized
+
+
+def prefix_upper_bound(prefix: str) -> str:
+    """
+    Smallest string greater than every string starting with prefix
+    """
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def tokenize(text: typing.Optional[str]) -> typing.List[str]:
+    """
+    Splits text into case folded words
+    """
+    if not text:
+        return []
+    return _TOKEN.findall(text.casefold())
+
+
+class InvertedIndex:
+    """
+    Term to document index of a single text field with BM25 scoring.
+
+    Documents are added and removed incrementally. Scoring only visits the
+    postings of the query terms, never the whole collection.
+
+    Documents are numbered, and the postings of a term are packed into one
+    array of (number, term frequency) pairs. A removed document keeps its
+    postings until the dead documents outnumber the live ones, then every
+    posting list is compacted at once
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self._k1 = k1
+        self._b = b
+        # doc_id -> number, and number -> doc_id or None once removed
+        self._numbers: typing.Dict[str, int] = {}
+        self._doc_ids: typing.List[typing.Optional[str]] = []
+        # number -> token count
+        self._lengths = array.array("I")
+        # term -> number, frequency, number, frequency...
+        self._postings: typing.Dict[str, array.array] = {}
+        self._total_length = 0
+        self._dead = 0
+
+    def add(self, doc_id: str, text: typing.Optional[str]):
+        if doc_id in self._numbers:
+            self.remove(doc_id, None)
+        tokens = tokenize(text)
+        number = len(self._doc_ids)
+        self._numbers[doc_id] = number
+        self._doc_ids.append(doc_id)
+        self._lengths.append(len(tokens))
+        for term, frequency in collections.Counter(tokens).items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = array.array("I")
+            postings.append(number)
+            postings.append(frequency)
+        self._total_length += len(tokens)
+
+    def remove(self, doc_id: str, text: typing.Optional[str]):
+        """
+        Removes a document. Its postings are dropped lazily, so text may be
+        None
+        """
+        number = self._numbers.pop(doc_id, None)
+        if number is None:
+            return
+        self._doc_ids[number] = None
+        self._total_length -= self._lengths[number]
+        self._dead += 1
+        if self._dead > _MIN_DEAD and self._dead > len(self._numbers):
+            self._compact()
+
+    def _compact(self):
+        """
+        Renumbers the live documents and drops the postings of removed ones
+        """
+        renumbered = array.array("I", [0]) * len(self._doc_ids)
+        doc_ids, lengths = [], array.array("I")
+        for number, doc_id in enumerate(self._doc_ids):
+            if doc_id is not None:
+                renumbered[number] = len(doc_ids)
+                self._numbers[doc_id] = len(doc_ids)
+                doc_ids.append(doc_id)
+                lengths.append(self._lengths[number])
+        postings = {}
+        for term, packed in self._postings.items():
+            live = array.array("I")
+            for position in range(0, len(packed), 2):
+                number = packed[position]
+                if self._doc_ids[number] is not None:
+                    live.append(renumbered[number])
+                    live.append(packed[position + 1])
+            if live:
+                postings[term] = live
+        self._doc_ids, self._lengths, self._postings = doc_ids, lengths, postings
+        self._dead = 0
+
+    def scores(self, terms: typing.Iterable[str]) -> typing.Dict[str, float]:
+        """
+        BM25 score of every document containing at least one of the terms
+        """
+        scores: typing.Dict[str, float] = collections.defaultdict(float)
+        count = len(self._numbers)
+        if not count:
+            return scores
+        average_length = self._total_length / count or 1
+        k1, b = self._k1, self._b
+        doc_ids, lengths = self._doc_ids, self._lengths
+        for term in set(terms):
+            packed = self._postings.get(term)
+            if not packed:
+                continue
+            postings = [
+                (number, frequency)
+                for number, frequency in zip(packed[::2], packed[1::2])
+                if doc_ids[number] is not None
+            ]
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for number, frequency in postings:
+                norm = k1 * (1 - b + b * lengths[number] / average_length)
+                scores[doc_ids[number]] += (
+                    idf * frequency * (k1 + 1) / (frequency + norm)
+                )
+        return scores
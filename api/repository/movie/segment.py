@@ -0,0 +1,332 @@
+import bisect
+import struct
+import typing
+
+from api.entities.movie import Movie
+from api.repository.movie.abstractions import (Fields, Keyset, MovieFilter,
+                                               RepositoryException,
+                                               project_movie)
+from api.repository.movie.search import normalize_title
+
+# magic, format version, generation, movie count
+_HEADER = struct.Struct("<8sI4xQQ")
+# offset and byte length of a section
+_SECTION = struct.Struct("<QQ")
+_MAGIC = b"MOVIESEG"
+_FORMAT_VERSION = 2
+_NO_TITLE = 0x1
+_NO_DESCRIPTION = 0x2
+_NO_RELEASE_YEAR = 0x4
+_WATCHED = 0x8
+# Stored release year of a movie without one, sorting before every year
+_MISSING_YEAR = -(2**31)
+# Sections in file order, with the memoryview format of their items
+_SECTIONS = (
+    ("versions", "I"),
+    ("release_years", "i"),
+    ("flags", "B"),
+    ("id_offsets", "Q"),
+    ("ids", "B"),
+    ("title_offsets", "Q"),
+    ("titles", "B"),
+    ("normalized_offsets", "Q"),
+    ("normalized_titles", "B"),
+    ("description_offsets", "Q"),
+    ("descriptions", "B"),
+    # Positions sorted by (title, id), (normalized title, id), (release year, id),
+    # (watched, id)
+    ("title_order", "I"),
+    ("normalized_order", "I"),
+    ("year_order", "I"),
+    ("watched_order", "I"),
+)
+_ALIGNMENT = 8
+
+
+class SegmentException(RepositoryException):
+    pass
+
+
+def _texts(texts: typing.List[str]) -> typing.Tuple[bytes, bytes]:
+    """
+    Byte offsets of every text, one past the end included, and the UTF-8 texts
+    """
+    offsets = [0]
+    encoded = []
+    for text in texts:
+        data = text.encode("utf-8")
+        encoded.append(data)
+        offsets.append(offsets[-1] + len(data))
+    return struct.pack(f"<{len(offsets)}Q", *offsets), b"".join(encoded)
+
+
+def encode_segment(movies: typing.Iterable[Movie], generation: int) -> bytes:
+    """
+    Encodes movies in the shared segment format.
+
+    Movies are stored in ID order, field by field, followed by the orderings
+    needed to look them up by title, release year and watched status, so that
+    readers can answer queries straight from a memory map
+    """
+    movies = sorted(movies, key=lambda movie: movie.id)
+    count = len(movies)
+    normalized_cache: typing.Dict[str, str] = {}
+    titles, normalized_titles, release_years, flags = [], [], [], []
+    for movie in movies:
+        title = movie.title or ""
+        normalized = normalized_cache.get(title)
+        if normalized is None:
+            normalized = normalized_cache[title] = normalize_title(title)
+        titles.append(title)
+        normalized_titles.append(normalized)
+        release_years.append(
+            _MISSING_YEAR if movie.release_year is None else movie.release_year
+        )
+        flags.append(
+            (_NO_TITLE if movie.title is None else 0)
+            | (_NO_DESCRIPTION if movie.description is None else 0)
+            | (_NO_RELEASE_YEAR if movie.release_year is None else 0)
+            | (_WATCHED if movie.watched else 0)
+        )
+    # Positions are in ID order already, so sorting is stable on the ID
+    positions = range(count)
+    sections = [
+        struct.pack(f"<{count}I", *(movie.version for movie in movies)),
+        struct.pack(f"<{count}i", *release_years),
+        bytes(flags),
+        *_texts([movie.id for movie in movies]),
+        *_texts(titles),
+        *_texts(normalized_titles),
+        *_texts([movie.description or "" for movie in movies]),
+        struct.pack(f"<{count}I", *sorted(positions, key=titles.__getitem__)),
+        struct.pack(
+            f"<{count}I", *sorted(positions, key=normalized_titles.__getitem__)
+        ),
+        struct.pack(f"<{count}I", *sorted(positions, key=release_years.__getitem__)),
+        struct.pack(
+            f"<{count}I",
+            *(position for position in positions if not flags[position] & _WATCHED),
+            *(position for position in positions if flags[position] & _WATCHED),
+        ),
+    ]
+    offset = _HEADER.size + _SECTION.size * len(sections)
+    table, body = [], []
+    for section in sections:
+        padding = -offset % _ALIGNMENT
+        body.append(b"\0" * padding)
+        offset += padding
+        table.append(_SECTION.pack(offset, len(section)))
+        body.append(section)
+        offset += len(section)
+    return b"".join(
+        [_HEADER.pack(_MAGIC, _FORMAT_VERSION, generation, count), *table, *body]
+    )
+
+
+class MovieSegment:
+    """
+    Read only view of an encoded segment, e.g. a memory map shared between
+    processes. Fields are read from the buffer on access, only the movies
+    returned are materialized.
+
+    Movies are addressed by position, their index in ID order
+    """
+
+    def __init__(self, buffer):
+        view = memoryview(buffer)
+        try:
+            magic, format_version, generation, count = _HEADER.unpack_from(view)
+        except struct.error as e:
+            raise SegmentException("Segment is truncated") from e
+        if magic != _MAGIC or format_version != _FORMAT_VERSION:
+            raise SegmentException("Not a movie segment")
+        self.generation = generation
+        self._count = count
+        for index, (name, item_format) in enumerate(_SECTIONS):
+            offset, length = _SECTION.unpack_from(
+                view, _HEADER.size + _SECTION.size * index
+            )
+            if offset + length > len(view):
+                raise SegmentException("Segment is truncated")
+            setattr(self, f"_{name}", view[offset : offset + length].cast(item_format))
+
+    def __len__(self) -> int:
+        return self._count
+
+    @staticmethod
+    def _text(offsets: memoryview, texts: memoryview, position: int) -> str:
+        return str(texts[offsets[position] : offsets[position + 1]], "utf-8")
+
+    def id(self, position: int) -> str:
+        return self._text(self._id_offsets, self._ids, position)
+
+    def title_key(self, position: int) -> str:
+        """
+        Title of the movie at position, empty if it has none
+        """
+        return self._text(self._title_offsets, self._titles, position)
+
+    def normalized_title(self, position: int) -> str:
+        return self._text(self._normalized_offsets, self._normalized_titles, position)
+
+    def release_year_key(self, position: int) -> int:
+        """
+        Release year of the movie at position, sorting first if it has none
+        """
+        return self._release_years[position]
+
+    def watched(self, position: int) -> bool:
+        return bool(self._flags[position] & _WATCHED)
+
+    def sort_key(self, field: str) -> typing.Callable[[int], typing.Tuple]:
+        """
+        Key ordering positions by a MovieSort field and then by ID
+        """
+        value = {
+            "release_year": self.release_year_key,
+            "title": self.title_key,
+            "id": self.id,
+        }[field]
+        return lambda position: (value(position), self.id(position))
+
+    @staticmethod
+    def keyset_key(field: str, after: Keyset) -> typing.Tuple:
+        """
+        Keyset in the form of sort_key
+        """
+        value, movie_id = after
+        if value is None:
+            value = _MISSING_YEAR if field == "release_year" else ""
+        return value, movie_id
+
+    def matches(self, position: int, movie_filter: MovieFilter) -> bool:
+        """
+        MovieFilter.matches without materializing the movie
+        """
+        if (
+            movie_filter.title is not None
+            and self.title_key(position) != movie_filter.title
+        ):
+            return False
+        if (
+            movie_filter.min_release_year is not None
+            or movie_filter.max_release_year is not None
+        ):
+            if self._flags[position] & _NO_RELEASE_YEAR:
+                return False
+            release_year = self._release_years[position]
+            if (
+                movie_filter.min_release_year is not None
+                and release_year < movie_filter.min_release_year
+            ):
+                return False
+            if (
+                movie_filter.max_release_year is not None
+                and release_year > movie_filter.max_release_year
+            ):
+                return False
+        if movie_filter.watched is not None and self.watched(position) != (
+            movie_filter.watched
+        ):
+            return False
+        if movie_filter.min_id is not None or movie_filter.max_id is not None:
+            movie_id = self.id(position)
+            if movie_filter.min_id is not None and movie_id < movie_filter.min_id:
+                return False
+            if movie_filter.max_id is not None and movie_id > movie_filter.max_id:
+                return False
+        return True
+
+    def movie(self, position: int, fields: Fields = None) -> Movie:
+        flags = self._flags[position]
+        movie = Movie(
+            movie_id=self.id(position),
+            title=None if flags & _NO_TITLE else self.title_key(position),
+            description=(
+                None
+                if flags & _NO_DESCRIPTION
+                else self._text(self._description_offsets, self._descriptions, position)
+            ),
+            release_year=(
+                None if flags & _NO_RELEASE_YEAR else self._release_years[position]
+            ),
+            watched=bool(flags & _WATCHED),
+            version=self._versions[position],
+        )
+        return project_movie(movie, fields)
+
+    def position(self, movie_id: str) -> typing.Optional[int]:
+        """
+        Position of the movie with the given ID, None if there is none
+        """
+        position = bisect.bisect_left(range(self._count), movie_id, key=self.id)
+        if position < self._count and self.id(position) == movie_id:
+            return position
+        return None
+
+    def id_range(
+        self, min_id: typing.Optional[str], max_id: typing.Optional[str]
+    ) -> range:
+        """
+        Positions of the movies with IDs between min_id and max_id, inclusive
+        """
+        positions = range(self._count)
+        low, high = 0, self._count
+        if min_id is not None:
+            low = bisect.bisect_left(positions, min_id, key=self.id)
+        if max_id is not None:
+            high = bisect.bisect_right(positions, max_id, key=self.id)
+        return range(low, max(low, high))
+
+    def _order_slice(
+        self, order: memoryview, key: typing.Callable[[int], typing.Any], low, high
+    ) -> typing.Sequence[int]:
+        start = 0 if low is None else bisect.bisect_left(order, low, key=key)
+        stop = len(order) if high is None else bisect.bisect_right(order, high, key=key)
+        return order[start : max(start, stop)]
+
+    def by_title(self, title: str) -> typing.Sequence[int]:
+        """
+        Positions of the movies with the given title, in ID order
+        """
+        return self._order_slice(self._title_order, self.title_key, title, title)
+
+    def by_normalized_title(self, normalized: str) -> typing.Sequence[int]:
+        """
+        Positions of the movies with the given normalized title, in ID order
+        """
+        return self._order_slice(
+            self._normalized_order, self.normalized_title, normalized, normalized
+        )
+
+    def from_normalized_title(self, normalized: str) -> typing.Sequence[int]:
+        """
+        Positions of the movies from the given normalized title onwards, in
+        normalized title order
+        """
+        return self._order_slice(
+            self._normalized_order, self.normalized_title, normalized, None
+        )
+
+    def by_title_order(self) -> typing.Sequence[int]:
+        """
+        Positions of all movies in (title, ID) order
+        """
+        return self._title_order
+
+    def by_release_year(
+        self, min_year: typing.Optional[int], max_year: typing.Optional[int]
+    ) -> typing.Sequence[int]:
+        """
+        Positions of the movies released between min_year and max_year,
+        inclusive, in (release year, ID) order
+        """
+        return self._order_slice(
+            self._year_order, self.release_year_key, min_year, max_year
+        )
+
+    def by_watched(self, watched: bool) -> typing.Sequence[int]:
+        """
+        Positions of the movies with the given watched status, in ID order
+        """
+        return self._order_slice(self._watched_order, self.watched, watched, watched)
@@ -0,0 +1,734 @@
+import asyncio
+import bisect
+import dataclasses
+import fcntl
+import heapq
+import itertools
+import json
+import mmap
+import os
+import typing
+
+from api.entities.movie import Movie
+from api.repository.movie.abstractions import (BulkResult, Fields, Keyset,
+                                               MovieFilter, MovieRepository,
+                                               MovieSort, RepositoryException,
+                                               TitleMatch, UpdateManyResult,
+                                               VersionConflictException)
+from api.repository.movie.durable import _movie_record, _record_movie
+from api.repository.movie.memory import MemoryMovieRepository
+from api.repository.movie.search import normalize_prefix, normalize_title
+from api.repository.movie.segment import MovieSegment, encode_segment
+
+SEGMENT_FILE = "movies.segment"
+DELTA_FILE = "movies.delta"
+SOCKET_FILE = "writer.sock"
+LOCK_FILE = "writer.lock"
+# Largest request or response exchanged with the writer
+_LINE_LIMIT = 64 * 1024 * 1024
+# Times the duration of the last segment waited before the next one, so that
+# encoding the growing catalog takes at most a fifth of the writer's time
+_SEGMENT_BACKOFF = 4
+# Rows the delta log holds before the next publish writes a new segment, at
+# least _MIN_DELTA or a 1/_DELTA_SHARE of the catalog. Until the segment is
+# due, small writes are appended beyond that
+_MIN_DELTA = 1024
+_DELTA_SHARE = 16
+
+
+def _replace_file(path: str, data: bytes):
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(data)
+    # Readers keep the previous segment mapped until they pick up this one
+    os.replace(temporary, path)
+
+
+def _append_file(path: str, data: bytes):
+    with open(path, "ab") as f:
+        f.write(data)
+
+
+def _delta_line(record: dict) -> bytes:
+    return json.dumps(record, separators=(",", ":")).encode("utf-8") + b"\n"
+
+
+class _Overlay(MemoryMovieRepository):
+    """
+    Movies of the delta log, which replace the movies of the segment with the
+    same IDs. Deleted movies are replaced by none
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.replaced: typing.Set[str] = set()
+
+    def replay(self, record: dict):
+        self._copy_on_write()
+        if record["op"] == "put":
+            movie = _record_movie(record["movie"])
+            existing = self._storage.get(movie.id)
+            if existing is not None:
+                self._unindex(existing)
+            self._storage[movie.id] = movie
+            self._index(movie)
+            self.replaced.add(movie.id)
+        else:
+            movie = self._storage.pop(record["id"], None)
+            if movie is not None:
+                self._unindex(movie)
+            self.replaced.add(record["id"])
+
+
+class SharedMemoryMovieRepository(MovieRepository):
+    """
+    Memory backend shared by the worker processes of one host.
+
+    The first process to initialize becomes the writer: it holds the movies
+    in a MemoryMovieRepository and publishes them after every write, at most
+    every publish_interval seconds. A publish appends the written movies to a
+    delta log. Once that holds a share of the catalog, a publish encodes the
+    whole catalog into a new segment file and starts an empty log, at most
+    every few times the last segment took. Put directory on a tmpfs such as
+    /dev/shm so neither file ever touches a disk.
+
+    The other processes are readers: they memory map the latest segment and
+    answer queries from it without a copy of the catalog, with the movies of
+    the delta log loaded in memory in place of their versions in the
+    segment. Writes and full text search are sent to the writer over a unix
+    socket, and return once the writer published the result. If the writer
+    exits, readers fail writes until the workers are restarted
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        repository_factory: typing.Callable[
+            [], MemoryMovieRepository
+        ] = MemoryMovieRepository,
+        publish_interval: float = 0.01,
+        startup_timeout: float = 30.0,
+    ):
+        self._directory = directory
+        self._segment_path = os.path.join(directory, SEGMENT_FILE)
+        self._delta_path = os.path.join(directory, DELTA_FILE)
+        self._socket_path = os.path.join(directory, SOCKET_FILE)
+        self._repository_factory = repository_factory
+        self._publish_interval = publish_interval
+        self._startup_timeout = startup_timeout
+        self._lock_file: typing.Optional[typing.TextIO] = None
+        # Set in the writer process only
+        self._writer: typing.Optional[MemoryMovieRepository] = None
+        self._server: typing.Optional[asyncio.AbstractServer] = None
+        self._connections: typing.Set[asyncio.Task] = set()
+        self._generation = 0
+        self._publish_lock = asyncio.Lock()
+        self._pending: typing.Optional[asyncio.Future] = None
+        # IDs written since the last publish, None to write a new segment
+        self._dirty: typing.Optional[typing.Set[str]] = None
+        # Rows in the delta log of the current segment
+        self._delta_rows = 0
+        # Loop time from which the next segment may be written
+        self._segment_due = 0.0
+        # Running publishes, referenced so that they are not garbage collected
+        self._flushes: typing.Set[asyncio.Future] = set()
+        # Latest segment mapped by a reader and the inode it was read from
+        self._segment: typing.Optional[MovieSegment] = None
+        self._segment_inode: typing.Optional[int] = None
+        # Delta log read by a reader: its inode, the bytes read, the generation
+        # of the segment it follows and its movies
+        self._delta_inode: typing.Optional[int] = None
+        self._delta_offset = 0
+        self._delta_generation: typing.Optional[int] = None
+        self._overlay = _Overlay()
+
+    @property
+    def is_writer(self) -> bool:
+        return self._writer is not None
+
+    async def initialize(self):
+        os.makedirs(self._directory, exist_ok=True)
+        self._lock_file = open(os.path.join(self._directory, LOCK_FILE), "a")
+        try:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            await self._wait_for_segment()
+            return
+        writer = self._repository_factory()
+        await writer.initialize()
+        self._writer = writer
+        if os.path.exists(self._segment_path):
+            # Continues the generations of the previous writer
+            self._generation = self._map_segment().generation
+            self._segment = None
+        await self._publish_now()
+        if os.path.exists(self._socket_path):
+            os.remove(self._socket_path)
+        self._server = await asyncio.start_unix_server(
+            self._serve, path=self._socket_path, limit=_LINE_LIMIT
+        )
+
+    async def _wait_for_segment(self):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self._startup_timeout
+        # Written after the segment
+        while not os.path.exists(self._delta_path):
+            if loop.time() > deadline:
+                raise RepositoryException("No movie segment was published")
+            await asyncio.sleep(0.05)
+
+    async def close(self):
+        if self._writer is not None:
+            if self._pending is not None:
+                await self._flush()
+            # Failures were already set on the futures their callers wait on
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+            self._server.close()
+            for connection in self._connections:
+                connection.cancel()
+            await asyncio.gather(*self._connections, return_exceptions=True)
+            await self._server.wait_closed()
+            os.remove(self._socket_path)
+            await self._writer.close()
+            self._writer = None
+        self._segment = None
+        if self._lock_file is not None:
+            # Closing releases the lock for the next writer
+            self._lock_file.close()
+            self._lock_file = None
+
+    # Publishing, in the writer
+
+    async def _publish(self):
+        """
+        Waits until every write so far is published to the readers
+        """
+        if self._pending is None:
+            loop = asyncio.get_running_loop()
+            self._pending = loop.create_future()
+            loop.call_later(self._publish_interval, self._flush_in_background)
+        await asyncio.shield(self._pending)
+
+    def _flush_in_background(self):
+        flush = asyncio.ensure_future(self._flush())
+        self._flushes.add(flush)
+        flush.add_done_callback(self._flushes.discard)
+
+    async def _flush(self):
+        future, self._pending = self._pending, None
+        if future is None:
+            return
+        try:
+            await self._publish_now()
+        except Exception as e:
+            future.set_exception(e)
+            return
+        future.set_result(None)
+
+    def _written(self, movie_ids: typing.Iterable[str]):
+        """
+        Marks movies to be published
+        """
+        if self._dirty is not None:
+            self._dirty.update(movie_ids)
+
+    async def _publish_now(self):
+        async with self._publish_lock:
+            dirty, self._dirty = self._dirty, set()
+            loop = asyncio.get_running_loop()
+            delta_size = max(_MIN_DELTA, len(self._writer._storage) // _DELTA_SHARE)
+            try:
+                if dirty is None or len(dirty) > delta_size:
+                    # Too many rows for the delta log, waits for the segment
+                    await asyncio.sleep(self._segment_due - loop.time())
+                    dirty = None
+                elif (
+                    self._delta_rows + len(dirty) > delta_size
+                    and loop.time() >= self._segment_due
+                ):
+                    dirty = None
+                if dirty is None:
+                    started = loop.time()
+                    await self._publish_segment()
+                    finished = loop.time()
+                    self._segment_due = (
+                        finished + (finished - started) * _SEGMENT_BACKOFF
+                    )
+                elif dirty:
+                    await self._publish_delta(dirty)
+            except BaseException:
+                # The rows published are unknown, the next publish writes all
+                self._dirty = None
+                raise
+
+    async def _publish_segment(self):
+        self._generation += 1
+        view = self._writer.frozen_view()
+        loop = asyncio.get_running_loop()
+        data = await loop.run_in_executor(
+            None, encode_segment, view._storage.values(), self._generation
+        )
+        await loop.run_in_executor(None, _replace_file, self._segment_path, data)
+        # Replaced after the segment, so that readers never find a delta log
+        # newer than the segment
+        header = _delta_line({"generation": self._generation})
+        await loop.run_in_executor(None, _replace_file, self._delta_path, header)
+        self._delta_rows = 0
+
+    async def _publish_delta(self, movie_ids: typing.Set[str]):
+        storage = self._writer._storage
+        records = []
+        for movie_id in movie_ids:
+            movie = storage.get(movie_id)
+            if movie is None:
+                records.append({"op": "delete", "id": movie_id})
+            else:
+                records.append({"op": "put", "movie": _movie_record(movie)})
+        data = b"".join(_delta_line(record) for record in records)
+        await asyncio.get_running_loop().run_in_executor(
+            None, _append_file, self._delta_path, data
+        )
+        self._delta_rows += len(records)
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        connection = asyncio.current_task()
+        self._connections.add(connection)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return
+                request = json.loads(line)
+                try:
+                    response = {
+                        "result": await self._dispatch(
+                            request["method"], request["args"]
+                        )
+                    }
+                except RepositoryException as e:
+                    response = {
+                        "error": str(e),
+                        "conflict": isinstance(e, VersionConflictException),
+                    }
+                writer.write(json.dumps(response).encode("utf-8") + b"\n")
+                await writer.drain()
+        except asyncio.CancelledError:
+            # Cancelled by close, the server task would log it otherwise
+            return
+        finally:
+            self._connections.discard(connection)
+            writer.close()
+
+    async def _dispatch(self, method: str, args: dict):
+        if method == "create":
+            return await self.create(_record_movie(args["movie"]))
+        if method == "bulk_create":
+            movies = [_record_movie(record) for record in args["movies"]]
+            return await self.bulk_create(movies, ordered=args["ordered"])
+        if method == "update_many":
+            result = await self.update_many(
+                MovieFilter(**args["movie_filter"]), args["params"]
+            )
+            return dataclasses.asdict(result)
+        if method == "search":
+            return [_movie_record(movie) for movie in await self.search(**args)]
+        if method in ("update", "delete", "bulk_update", "bulk_delete"):
+            return await getattr(self, method)(**args)
+        raise RepositoryException(f"Unknown method: {method}")
+
+    # Reading and forwarding, in the readers
+
+    def _current(self) -> typing.Tuple[MovieSegment, typing.Optional[_Overlay]]:
+        """
+        Latest published segment, and the movies replacing its own if any
+        """
+        # Looked at first: the delta log is replaced after the segment, so the
+        # segment mapped next is at least as new
+        delta = os.stat(self._delta_path)
+        segment = self._map_segment()
+        if (delta.st_ino, delta.st_size) != (self._delta_inode, self._delta_offset):
+            self._read_delta()
+            if self._delta_generation > segment.generation:
+                # Replaced meanwhile, so its segment is in place already
+                segment = self._map_segment()
+        if self._delta_generation != segment.generation or not self._overlay.replaced:
+            return segment, None
+        return segment, self._overlay
+
+    def _read_delta(self):
+        with open(self._delta_path, "rb") as f:
+            inode = os.fstat(f.fileno()).st_ino
+            if inode != self._delta_inode:
+                self._delta_inode = inode
+                self._delta_offset = 0
+                self._overlay = _Overlay()
+            f.seek(self._delta_offset)
+            data = f.read()
+        # A line still being appended is read again next time
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            record = json.loads(line)
+            if "generation" in record:
+                self._delta_generation = record["generation"]
+            else:
+                self._overlay.replay(record)
+        self._delta_offset += end
+
+    def _map_segment(self) -> MovieSegment:
+        """
+        Latest published segment, mapped again only when it changed
+        """
+        inode = os.stat(self._segment_path).st_ino
+        if self._segment is None or inode != self._segment_inode:
+            with open(self._segment_path, "rb") as f:
+                inode = os.fstat(f.fileno()).st_ino
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            # The previous map is unmapped once its last movie view is dropped
+            self._segment = MovieSegment(mapped)
+            self._segment_inode = inode
+        return self._segment
+
+    async def _call(self, method: str, **args):
+        """
+        Runs a method in the writer process
+        """
+        try:
+            reader, writer = await asyncio.open_unix_connection(
+                self._socket_path, limit=_LINE_LIMIT
+            )
+        except OSError as e:
+            raise RepositoryException("Movie writer process is unavailable") from e
+        try:
+            request = {"method": method, "args": args}
+            writer.write(json.dumps(request).encode("utf-8") + b"\n")
+            await writer.drain()
+            line = await reader.readline()
+        finally:
+            writer.close()
+            await writer.wait_closed()
+        if not line:
+            raise RepositoryException("Movie writer process is unavailable")
+        response = json.loads(line)
+        if "error" in response:
+            if response["conflict"]:
+                raise VersionConflictException(response["error"])
+            raise RepositoryException(response["error"])
+        return response["result"]
+
+    async def create(self, movie: Movie):
+        if self._writer is None:
+            await self._call("create", movie=_movie_record(movie))
+            return
+        self._written([movie.id])
+        await self._writer.create(movie)
+        await self._publish()
+
+    async def get_by_id(
+        self, movie_id: str, fields: Fields = None
+    ) -> typing.Optional[Movie]:
+        if self._writer is not None:
+            return await self._writer.get_by_id(movie_id, fields=fields)
+        segment, overlay = self._current()
+        if overlay is not None and movie_id in overlay.replaced:
+            return await overlay.get_by_id(movie_id, fields=fields)
+        position = segment.position(movie_id)
+        if position is None:
+            return None
+        return segment.movie(position, fields)
+
+    async def get_many(self, movie_ids: typing.List[str]) -> typing.Dict[str, Movie]:
+        if self._writer is not None:
+            return await self._writer.get_many(movie_ids)
+        segment, overlay = self._current()
+        movies = {}
+        if overlay is not None:
+            movies.update(
+                await overlay.get_many(
+                    [movie_id for movie_id in movie_ids if movie_id in overlay.replaced]
+                )
+            )
+            movie_ids = [
+                movie_id for movie_id in movie_ids if movie_id not in overlay.replaced
+            ]
+        for movie_id in movie_ids:
+            position = segment.position(movie_id)
+            if position is not None:
+                movies[movie_id] = segment.movie(position)
+        return movies
+
+    async def search(self, query: str, limit: int = 20) -> typing.List[Movie]:
+        if self._writer is not None:
+            return await self._writer.search(query, limit=limit)
+        records = await self._call("search", query=query, limit=limit)
+        return [_record_movie(record) for record in records]
+
+    async def autocomplete(self, prefix: str, limit: int = 10) -> typing.List[str]:
+        if self._writer is not None:
+            return await self._writer.autocomplete(prefix, limit=limit)
+        prefix = normalize_prefix(prefix)
+        if not prefix:
+            return []
+        segment, overlay = self._current()
+        completions = set()
+        last = None
+        for position in segment.from_normalized_title(prefix):
+            normalized = segment.normalized_title(position)
+            if not normalized.startswith(prefix):
+                break
+            # Titles sharing a normalized title are not sorted, finish the group
+            if normalized != last and len(completions) >= limit:
+                break
+            last = normalized
+            if overlay is not None and segment.id(position) in overlay.replaced:
+                continue
+            completions.add((normalized, segment.title_key(position)))
+        if overlay is not None:
+            titles = await overlay.autocomplete(prefix, limit=limit)
+            completions.update((normalize_title(title), title) for title in titles)
+        return [title for _, title in sorted(completions)[:limit]]
+
+    async def get_by_title(
+        self,
+        title: str,
+        skip: int = 0,
+        limit: int = 1000,
+        after: typing.Optional[str] = None,
+        fields: Fields = None,
+        match: TitleMatch = TitleMatch.EXACT,
+    ) -> typing.List[Movie]:
+        if self._writer is not None:
+            return await self._writer.get_by_title(
+                title, skip=skip, limit=limit, after=after, fields=fields, match=match
+            )
+        segment, overlay = self._current()
+        if match == TitleMatch.NORMALIZED:
+            positions = segment.by_normalized_title(normalize_title(title))
+        else:
+            positions = segment.by_title(title)
+        start = 0
+        if after is not None:
+            start = bisect.bisect_right(positions, after, key=segment.id)
+        stop = None if limit == 0 else skip + limit
+        if overlay is None:
+            positions = positions[start:]
+            return [
+                segment.movie(position, fields) for position in positions[skip:stop]
+            ]
+        # Merged in ID order with the overlay's movies, which replace the segment's
+        positions = (
+            position
+            for position in positions[start:]
+            if segment.id(position) not in overlay.replaced
+        )
+        movies = heapq.merge(
+            [
+                segment.movie(position, fields)
+                for position in itertools.islice(positions, stop)
+            ],
+            await overlay.get_by_title(
+                title, limit=stop or 0, after=after, fields=fields, match=match
+            ),
+            key=lambda movie: movie.id,
+        )
+        return list(itertools.islice(movies, skip, stop))
+
+    async def find(
+        self,
+        movie_filter: MovieFilter,
+        sort: MovieSort = MovieSort.RELEASE_YEAR_ASC,
+        skip: int = 0,
+        limit: int = 1000,
+        after: typing.Optional[Keyset] = None,
+        fields: Fields = None,
+    ) -> typing.List[Movie]:
+        if self._writer is not None:
+            return await self._writer.find(
+                movie_filter,
+                sort=sort,
+                skip=skip,
+                limit=limit,
+                after=after,
+                fields=fields,
+            )
+        segment, overlay = self._current()
+        key = segment.sort_key(sort.field)
+        # (candidate positions, whether they are in sort order)
+        options = []
+        if movie_filter.title is not None:
+            positions = segment.by_title(movie_filter.title)
+            options.append((positions, sort.field in ("title", "id")))
+        if (
+            movie_filter.min_release_year is not None
+            or movie_filter.max_release_year is not None
+        ):
+            positions = segment.by_release_year(
+                movie_filter.min_release_year, movie_filter.max_release_year
+            )
+            options.append((positions, sort.field == "release_year"))
+        if movie_filter.min_id is not None or movie_filter.max_id is not None:
+            positions = segment.id_range(movie_filter.min_id, movie_filter.max_id)
+            options.append((positions, sort.field == "id"))
+        if movie_filter.watched is not None:
+            positions = segment.by_watched(movie_filter.watched)
+            options.append((positions, sort.field == "id"))
+        if not options:
+            if sort.field == "title":
+                options.append((segment.by_title_order(), True))
+            elif sort.field == "release_year":
+                options.append((segment.by_release_year(None, None), True))
+            else:
+                options.append((range(len(segment)), True))
+        # Prefer the ordered candidates on ties
+        candidates, ordered = min(
+            options, key=lambda option: (len(option[0]), not option[1])
+        )
+        after_key = None if after is None else segment.keyset_key(sort.field, after)
+        if ordered:
+            if sort.descending:
+                if after_key is not None:
+                    candidates = candidates[
+                        : bisect.bisect_left(candidates, after_key, key=key)
+                    ]
+                candidates = reversed(candidates)
+            elif after_key is not None:
+                candidates = candidates[
+                    bisect.bisect_right(candidates, after_key, key=key) :
+                ]
+            matches = (
+                position
+                for position in candidates
+                if segment.matches(position, movie_filter)
+            )
+        else:
+            matches = [
+                position
+                for position in candidates
+                if segment.matches(position, movie_filter)
+            ]
+            if after_key is not None:
+                if sort.descending:
+                    matches = [
+                        position for position in matches if key(position) < after_key
+                    ]
+                else:
+                    matches = [
+                        position for position in matches if key(position) > after_key
+                    ]
+            matches = sorted(matches, key=key, reverse=sort.descending)
+        stop = None if limit == 0 else skip + limit
+        if fields is not None:
+            fields = {*fields, sort.field}
+        if overlay is None:
+            page = itertools.islice(matches, skip, stop)
+            return [segment.movie(position, fields) for position in page]
+        # Merged in sort order with the overlay's movies, which replace the
+        # segment's
+        matches = (
+            position
+            for position in matches
+            if segment.id(position) not in overlay.replaced
+        )
+        movies = heapq.merge(
+            [
+                segment.movie(position, fields)
+                for position in itertools.islice(matches, stop)
+            ],
+            await overlay.find(
+                movie_filter, sort=sort, limit=stop or 0, after=after, fields=fields
+            ),
+            key=lambda movie: segment.keyset_key(
+                sort.field, (getattr(movie, sort.field), movie.id)
+            ),
+            reverse=sort.descending,
+        )
+        return list(itertools.islice(movies, skip, stop))
+
+    async def iter_ids(self, batch_size: int = 1000) -> typing.AsyncIterator[str]:
+        if self._writer is not None:
+            async for movie_id in self._writer.iter_ids(batch_size=batch_size):
+                yield movie_id
+            return
+        segment, overlay = self._current()
+        for position in range(len(segment)):
+            movie_id = segment.id(position)
+            if overlay is None or movie_id not in overlay.replaced:
+                yield movie_id
+        if overlay is not None:
+            async for movie_id in overlay.iter_ids(batch_size=batch_size):
+                yield movie_id
+
+    async def delete(self, movie_id: str) -> bool:
+        if self._writer is None:
+            return await self._call("delete", movie_id=movie_id)
+        self._written([movie_id])
+        deleted = await self._writer.delete(movie_id)
+        await self._publish()
+        return deleted
+
+    async def update(
+        self,
+        movie_id: str,
+        params: dict,
+        expected_version: typing.Optional[int] = None,
+    ):
+        if self._writer is None:
+            await self._call(
+                "update",
+                movie_id=movie_id,
+                params=params,
+                expected_version=expected_version,
+            )
+            return
+        self._written([movie_id])
+        await self._writer.update(movie_id, params, expected_version=expected_version)
+        await self._publish()
+
+    async def update_many(
+        self, movie_filter: MovieFilter, params: dict
+    ) -> UpdateManyResult:
+        if self._writer is None:
+            result = await self._call(
+                "update_many",
+                movie_filter=dataclasses.asdict(movie_filter),
+                params=params,
+            )
+            return UpdateManyResult(**result)
+        # The updated movies are unknown, so the next publish writes them all
+        self._dirty = None
+        result = await self._writer.update_many(movie_filter, params)
+        await self._publish()
+        return result
+
+    async def bulk_create(
+        self, movies: typing.List[Movie], ordered: bool = False
+    ) -> BulkResult:
+        if self._writer is None:
+            return await self._call(
+                "bulk_create",
+                movies=[_movie_record(movie) for movie in movies],
+                ordered=ordered,
+            )
+        self._written(movie.id for movie in movies)
+        results = await self._writer.bulk_create(movies, ordered=ordered)
+        await self._publish()
+        return results
+
+    async def bulk_update(
+        self, updates: typing.List[typing.Tuple[str, dict]], ordered: bool = False
+    ) -> BulkResult:
+        if self._writer is None:
+            return await self._call("bulk_update", updates=updates, ordered=ordered)
+        self._written(movie_id for movie_id, _ in updates)
+        results = await self._writer.bulk_update(updates, ordered=ordered)
+        await self._publish()
+        return results
+
+    async def bulk_delete(
+        self, movie_ids: typing.List[str], ordered: bool = False
+    ) -> BulkResult:
+        if self._writer is None:
+            return await self._call("bulk_delete", movie_ids=movie_ids, ordered=ordered)
+        self._written(movie_ids)
+        results = await self._writer.bulk_delete(movie_ids, ordered=ordered)
+        await self._publish()
+        return results
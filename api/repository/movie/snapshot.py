@@ -0,0 +1,162 @@
+import array
+import mmap
+import os
+import struct
+import typing
+import zlib
+
+from api.entities.movie import Movie
+from api.repository.movie.abstractions import RepositoryException
+
+# magic, format version, LSN of the last write included, movie count
+_HEADER = struct.Struct("<8sIQQ")
+# Byte length of a column
+_LENGTH = struct.Struct("<Q")
+# CRC32 of everything after the header
+_FOOTER = struct.Struct("<I")
+_MAGIC = b"MOVIESNP"
+_FORMAT_VERSION = 1
+_WATCHED = 0x1
+_NO_RELEASE_YEAR = 0x2
+# Length of a missing text
+_NONE = 0xFFFFFFFF
+
+
+class SnapshotException(RepositoryException):
+    pass
+
+
+def _text_column(texts: typing.List[typing.Optional[str]]) -> typing.List[bytes]:
+    """
+    Character lengths followed by all texts as a single UTF-8 string, so a
+    column is decoded with one call instead of one per movie
+    """
+    lengths = array.array("I", (_NONE if text is None else len(text) for text in texts))
+    joined = "".join(text for text in texts if text is not None).encode("utf-8")
+    return [lengths.tobytes(), _LENGTH.pack(len(joined)), joined]
+
+
+def encode_snapshot(movies: typing.Iterable[Movie], lsn: int) -> bytes:
+    """
+    Encodes movies in the binary snapshot format.
+
+    Movies are stored column by column: versions, release years, flags and
+    then the id, title and description texts
+    """
+    movies = list(movies)
+    flags = bytearray(len(movies))
+    for position, movie in enumerate(movies):
+        if movie.watched:
+            flags[position] |= _WATCHED
+        if movie.release_year is None:
+            flags[position] |= _NO_RELEASE_YEAR
+    parts = [
+        array.array("I", (movie.version for movie in movies)).tobytes(),
+        array.array("i", (movie.release_year or 0 for movie in movies)).tobytes(),
+        bytes(flags),
+        *_text_column([movie.id for movie in movies]),
+        *_text_column([movie.title for movie in movies]),
+        *_text_column([movie.description for movie in movies]),
+    ]
+    body = b"".join(parts)
+    return b"".join(
+        (
+            _HEADER.pack(_MAGIC, _FORMAT_VERSION, lsn, len(movies)),
+            body,
+            _FOOTER.pack(zlib.crc32(body)),
+        )
+    )
+
+
+def decode_snapshot(buffer) -> typing.Tuple[int, typing.List[Movie]]:
+    """
+    Decodes a snapshot from any buffer, e.g. a memory map.
+    Returns the LSN and the movies
+
+    Raises SnapshotException if the buffer is not a valid snapshot
+    """
+    view = memoryview(buffer)
+    if len(view) < _HEADER.size + _FOOTER.size:
+        raise SnapshotException("Snapshot is truncated")
+    magic, format_version, lsn, count = _HEADER.unpack_from(view)
+    if magic != _MAGIC or format_version != _FORMAT_VERSION:
+        raise SnapshotException("Not a movie snapshot")
+    end = len(view) - _FOOTER.size
+    (checksum,) = _FOOTER.unpack_from(view, end)
+    if zlib.crc32(view[_HEADER.size : end]) != checksum:
+        raise SnapshotException("Snapshot checksum mismatch")
+    offset = _HEADER.size
+
+    def column(typecode: str) -> array.array:
+        nonlocal offset
+        values = array.array(typecode)
+        size = values.itemsize * count
+        values.frombytes(view[offset : offset + size])
+        offset += size
+        return values
+
+    def texts() -> typing.List[typing.Optional[str]]:
+        nonlocal offset
+        lengths = column("I")
+        (size,) = _LENGTH.unpack_from(view, offset)
+        offset += _LENGTH.size
+        joined = str(view[offset : offset + size], "utf-8")
+        offset += size
+        values, position = [], 0
+        for length in lengths:
+            if length == _NONE:
+                values.append(None)
+            else:
+                values.append(joined[position : position + length])
+                position += length
+        return values
+
+    try:
+        versions = column("I")
+        release_years = column("i")
+        flags = bytes(view[offset : offset + count])
+        offset += count
+        ids, titles, descriptions = texts(), texts(), texts()
+    except (struct.error, ValueError) as e:
+        raise SnapshotException("Snapshot is malformed") from e
+    if offset != end:
+        raise SnapshotException("Snapshot has trailing data")
+    return lsn, [
+        Movie(
+            movie_id=ids[position],
+            title=titles[position],
+            description=descriptions[position],
+            release_year=(
+                None if flags[position] & _NO_RELEASE_YEAR else release_years[position]
+            ),
+            watched=bool(flags[position] & _WATCHED),
+            version=versions[position],
+        )
+        for position in range(count)
+    ]
+
+
+def write_snapshot(path: str, data: bytes):
+    """
+    Atomically replaces the snapshot at path with data, durably
+    """
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+    directory = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(directory)
+    finally:
+        os.close(directory)
+
+
+def read_snapshot(path: str) -> typing.Tuple[int, typing.List[Movie]]:
+    """
+    Loads the snapshot at path through a memory map
+    """
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return decode_snapshot(mapped)
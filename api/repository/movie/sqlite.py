@@ -0,0 +1,566 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import typing
+from concurrent.futures import ThreadPoolExecutor
+
+from api.entities.movie import Movie
+from api.repository.movie.abstractions import (MOVIE_FIELDS, NOT_EXECUTED,
+                                               BulkResult, Fields, Keyset,
+                                               MovieFilter, MovieRepository,
+                                               MovieSort, RepositoryException,
+                                               TitleMatch, UpdateManyResult,
+                                               VersionConflictException)
+from api.repository.movie.search import (normalize_prefix, normalize_title,
+                                         prefix_upper_bound, tokenize)
+
+# Prepared statements kept per connection. Statements are only built from
+# fixed fragments, so the number of distinct ones is bounded
+_CACHED_STATEMENTS = 256
+_BUSY_TIMEOUT_MS = 5000
+
+# Equality columns first, then the sort column, then id as tie breaker
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS movies (
+    id TEXT NOT NULL UNIQUE,
+    title TEXT,
+    title_normalized TEXT NOT NULL DEFAULT '',
+    description TEXT,
+    release_year INTEGER,
+    watched INTEGER NOT NULL DEFAULT 0,
+    version INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS movies_title_id ON movies (title, id);
+CREATE INDEX IF NOT EXISTS movies_title_release_year_id
+    ON movies (title, release_year, id);
+CREATE INDEX IF NOT EXISTS movies_watched_release_year_id
+    ON movies (watched, release_year, id);
+CREATE INDEX IF NOT EXISTS movies_release_year_id ON movies (release_year, id);
+CREATE INDEX IF NOT EXISTS movies_title_normalized_id
+    ON movies (title_normalized, id);
+-- Covers autocomplete queries, rows are never fetched
+CREATE INDEX IF NOT EXISTS movies_title_normalized_title
+    ON movies (title_normalized, title);
+"""
+
+# Full text index kept in sync with the movies table by triggers
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS movies_fts USING fts5(
+    title, description, content='movies', content_rowid='rowid',
+    tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS movies_fts_insert AFTER INSERT ON movies BEGIN
+    INSERT INTO movies_fts (rowid, title, description)
+    VALUES (new.rowid, new.title, new.description);
+END;
+CREATE TRIGGER IF NOT EXISTS movies_fts_delete AFTER DELETE ON movies BEGIN
+    INSERT INTO movies_fts (movies_fts, rowid, title, description)
+    VALUES ('delete', old.rowid, old.title, old.description);
+END;
+CREATE TRIGGER IF NOT EXISTS movies_fts_update
+AFTER UPDATE OF title, description ON movies BEGIN
+    INSERT INTO movies_fts (movies_fts, rowid, title, description)
+    VALUES ('delete', old.rowid, old.title, old.description);
+    INSERT INTO movies_fts (rowid, title, description)
+    VALUES (new.rowid, new.title, new.description);
+END;
+"""
+
+_UPSERT = """
+INSERT INTO movies
+    (id, title, title_normalized, description, release_year, watched, version)
+VALUES (?, ?, ?, ?, ?, ?, 1)
+ON CONFLICT (id) DO UPDATE SET
+    title = excluded.title,
+    title_normalized = excluded.title_normalized,
+    description = excluded.description,
+    release_year = excluded.release_year,
+    watched = excluded.watched,
+    version = version + 1
+"""
+_DELETE = "DELETE FROM movies WHERE id = ?"
+_VERSION = "SELECT version FROM movies WHERE id = ?"
+_FIRST_IDS = "SELECT id FROM movies ORDER BY id LIMIT ?"
+_IDS_AFTER = "SELECT id FROM movies WHERE id > ? ORDER BY id LIMIT ?"
+_AUTOCOMPLETE = """
+SELECT DISTINCT title_normalized, title FROM movies
+WHERE title_normalized >= ? AND title_normalized < ?
+ORDER BY title_normalized, title LIMIT ?
+"""
+
+# Title matches count twice as much as description matches
+_TITLE_WEIGHT = 2.0
+
+
+def _fetch_all(
+    connection: sqlite3.Connection, sql: str, params: typing.Sequence
+) -> typing.List[sqlite3.Row]:
+    return connection.execute(sql, params).fetchall()
+
+
+class SqliteMovieRepository(MovieRepository):
+    """
+    Implements the repository pattern using a SQLite database in WAL mode.
+
+    Queries run on a pool of reader threads with a connection each, writes on
+    a single writer thread since SQLite allows one writer at a time. The
+    event loop only waits for their results.
+
+    With full_text_search, search uses an FTS5 index ranked by BM25.
+    Otherwise it scans titles and descriptions with LIKE, unranked
+    """
+
+    def __init__(
+        self,
+        path: str = "movies.db",
+        pool_size: int = 4,
+        full_text_search: bool = True,
+    ):
+        self._path = path
+        self._full_text_search = full_text_search
+        self._readers = ThreadPoolExecutor(
+            max_workers=pool_size, thread_name_prefix="sqlite-reader"
+        )
+        self._writer = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="sqlite-writer"
+        )
+        self._local = threading.local()
+        self._connections: typing.List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._schema_ready = False
+
+    def _connection(self) -> sqlite3.Connection:
+        """
+        Connection of the current thread, opened on first use
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            return connection
+        # Only ever used by this thread, closed from the event loop thread
+        connection = sqlite3.connect(
+            self._path, check_same_thread=False, cached_statements=_CACHED_STATEMENTS
+        )
+        connection.row_factory = sqlite3.Row
+        connection.execute(f"PRAGMA busy_timeout = {_BUSY_TIMEOUT_MS}")
+        # Durable at checkpoints in WAL mode, without an fsync per commit
+        connection.execute("PRAGMA synchronous = NORMAL")
+        with self._lock:
+            self._connections.append(connection)
+            if not self._schema_ready:
+                self._create_schema(connection)
+                self._schema_ready = True
+        self._local.connection = connection
+        return connection
+
+    def _create_schema(self, connection: sqlite3.Connection):
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.executescript(_SCHEMA)
+        if not self._full_text_search:
+            return
+        exists = connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'movies_fts'"
+        ).fetchone()
+        connection.executescript(_FTS_SCHEMA)
+        if not exists:
+            # Indexes the movies written before full text search was enabled
+            with connection:
+                connection.execute(
+                    "INSERT INTO movies_fts (movies_fts) VALUES ('rebuild')"
+                )
+
+    async def _run(self, executor: ThreadPoolExecutor, function, *args):
+        def call():
+            try:
+                return function(self._connection(), *args)
+            except sqlite3.Error as e:
+                raise RepositoryException(str(e)) from e
+
+        return await asyncio.get_running_loop().run_in_executor(executor, call)
+
+    async def _read(
+        self, sql: str, params: typing.Sequence
+    ) -> typing.List[sqlite3.Row]:
+        return await self._run(self._readers, _fetch_all, sql, params)
+
+    async def _write(self, function, *args):
+        return await self._run(self._writer, function, *args)
+
+    async def initialize(self):
+        await self._write(lambda connection: None)
+
+    def _shutdown(self):
+        self._readers.shutdown(wait=True)
+        self._writer.shutdown(wait=True)
+        with self._lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections = []
+
+    async def close(self):
+        # Waits for the running statements, which must not block the loop
+        await asyncio.get_running_loop().run_in_executor(None, self._shutdown)
+
+    @staticmethod
+    def _to_movie(row: sqlite3.Row) -> Movie:
+        values = dict(zip(row.keys(), row))
+        watched = values.get("watched")
+        return Movie(
+            movie_id=values["id"],
+            title=values.get("title"),
+            description=values.get("description"),
+            release_year=values.get("release_year"),
+            watched=None if watched is None else bool(watched),
+            version=values.get("version", 1),
+        )
+
+    @staticmethod
+    def _to_row(movie: Movie) -> tuple:
+        return (
+            movie.id,
+            movie.title,
+            normalize_title(movie.title),
+            movie.description,
+            movie.release_year,
+            bool(movie.watched),
+        )
+
+    @staticmethod
+    def _columns(fields: Fields, *required: str) -> str:
+        """
+        Columns loading only the requested fields, the required ones, ID and
+        version. Everything is loaded when fields is None
+        """
+        if fields is None:
+            selected = MOVIE_FIELDS
+        else:
+            selected = [
+                field for field in MOVIE_FIELDS if field in fields or field in required
+            ]
+        return ", ".join(("id", "version", *selected))
+
+    @staticmethod
+    def _filter_conditions(
+        movie_filter: MovieFilter,
+    ) -> typing.Tuple[typing.List[str], typing.List]:
+        """
+        Builds conditions whose shape matches the indexes: equality columns
+        first, then the release_year range
+        """
+        conditions, params = [], []
+        if movie_filter.title is not None:
+            conditions.append("title = ?")
+            params.append(movie_filter.title)
+        if movie_filter.watched is not None:
+            conditions.append("watched = ?")
+            params.append(movie_filter.watched)
+        if movie_filter.min_release_year is not None:
+            conditions.append("release_year >= ?")
+            params.append(movie_filter.min_release_year)
+        if movie_filter.max_release_year is not None:
+            conditions.append("release_year <= ?")
+            params.append(movie_filter.max_release_year)
+        if movie_filter.min_id is not None:
+            conditions.append("id >= ?")
+            params.append(movie_filter.min_id)
+        if movie_filter.max_id is not None:
+            conditions.append("id <= ?")
+            params.append(movie_filter.max_id)
+        return conditions, params
+
+    def _find_query(
+        self,
+        movie_filter: MovieFilter,
+        sort: MovieSort,
+        skip: int,
+        limit: int,
+        after: typing.Optional[Keyset],
+        fields: Fields,
+    ) -> typing.Tuple[str, typing.List]:
+        conditions, params = self._filter_conditions(movie_filter)
+        direction = "DESC" if sort.descending else "ASC"
+        if after is not None:
+            # Seeks through the index instead of skipping rows
+            operator = "<" if sort.descending else ">"
+            value, movie_id = after
+            if sort.field == "id":
+                conditions.append(f"id {operator} ?")
+                params.append(movie_id)
+            else:
+                conditions.append(f"({sort.field}, id) {operator} (?, ?)")
+                params.extend((value, movie_id))
+        order = f"{sort.field} {direction}"
+        if sort.field != "id":
+            order += f", id {direction}"
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        columns = self._columns(fields, sort.field)
+        sql = f"SELECT {columns} FROM movies{where} ORDER BY {order} LIMIT ? OFFSET ?"
+        return sql, [*params, limit or -1, skip]
+
+    async def create(self, movie: Movie):
+        def upsert(connection: sqlite3.Connection):
+            with connection:
+                connection.execute(_UPSERT, self._to_row(movie))
+
+        await self._write(upsert)
+
+    async def get_by_id(
+        self, movie_id: str, fields: Fields = None
+    ) -> typing.Optional[Movie]:
+        rows = await self._read(
+            f"SELECT {self._columns(fields)} FROM movies WHERE id = ?", (movie_id,)
+        )
+        if rows:
+            return self._to_movie(rows[0])
+        return None
+
+    async def get_many(self, movie_ids: typing.List[str]) -> typing.Dict[str, Movie]:
+        # A single statement whatever the number of IDs
+        rows = await self._read(
+            f"SELECT {self._columns(None)} FROM movies "
+            "WHERE id IN (SELECT value FROM json_each(?))",
+            (json.dumps(list(movie_ids)),),
+        )
+        return {row["id"]: self._to_movie(row) for row in rows}
+
+    async def search(self, query: str, limit: int = 20) -> typing.List[Movie]:
+        terms = tokenize(query)
+        if not terms:
+            return []
+        columns = ", ".join(
+            f"movies.{column}" for column in self._columns(None).split(", ")
+        )
+        if self._full_text_search:
+            match = " OR ".join('"' + term.replace('"', '""') + '"' for term in terms)
+            rows = await self._read(
+                f"SELECT {columns} FROM movies_fts "
+                "JOIN movies ON movies.rowid = movies_fts.rowid "
+                "WHERE movies_fts MATCH ? "
+                f"ORDER BY bm25(movies_fts, {_TITLE_WEIGHT}, 1.0), movies.id "
+                "LIMIT ?",
+                (match, limit),
+            )
+        else:
+            conditions = " OR ".join(
+                ["title LIKE ? OR description LIKE ?"] * len(terms)
+            )
+            patterns = [f"%{term}%" for term in terms for _ in range(2)]
+            rows = await self._read(
+                f"SELECT {columns} FROM movies WHERE {conditions} "
+                "ORDER BY id LIMIT ?",
+                (*patterns, limit),
+            )
+        return [self._to_movie(row) for row in rows]
+
+    async def autocomplete(self, prefix: str, limit: int = 10) -> typing.List[str]:
+        prefix = normalize_prefix(prefix)
+        if not prefix:
+            return []
+        rows = await self._read(
+            _AUTOCOMPLETE, (prefix, prefix_upper_bound(prefix), limit)
+        )
+        return [row["title"] for row in rows]
+
+    async def get_by_title(
+        self,
+        title: str,
+        skip: int = 0,
+        limit: int = 1000,
+        after: typing.Optional[str] = None,
+        fields: Fields = None,
+        match: TitleMatch = TitleMatch.EXACT,
+    ) -> typing.List[Movie]:
+        if match == TitleMatch.NORMALIZED:
+            conditions, params = ["title_normalized = ?"], [normalize_title(title)]
+        else:
+            conditions, params = ["title = ?"], [title]
+        if after is not None:
+            conditions.append("id > ?")
+            params.append(after)
+        rows = await self._read(
+            f"SELECT {self._columns(fields)} FROM movies "
+            f"WHERE {' AND '.join(conditions)} ORDER BY id LIMIT ? OFFSET ?",
+            (*params, limit or -1, skip),
+        )
+        return [self._to_movie(row) for row in rows]
+
+    async def find(
+        self,
+        movie_filter: MovieFilter,
+        sort: MovieSort = MovieSort.RELEASE_YEAR_ASC,
+        skip: int = 0,
+        limit: int = 1000,
+        after: typing.Optional[Keyset] = None,
+        fields: Fields = None,
+    ) -> typing.List[Movie]:
+        sql, params = self._find_query(movie_filter, sort, skip, limit, after, fields)
+        return [self._to_movie(row) for row in await self._read(sql, params)]
+
+    async def iter_ids(self, batch_size: int = 1000) -> typing.AsyncIterator[str]:
+        # Covered by the id index, rows are never fetched
+        rows = await self._read(_FIRST_IDS, (batch_size,))
+        while True:
+            for row in rows:
+                yield row["id"]
+            if len(rows) < batch_size:
+                return
+            rows = await self._read(_IDS_AFTER, (rows[-1]["id"], batch_size))
+
+    @staticmethod
+    def _delete_movie(connection: sqlite3.Connection, movie_id: str) -> bool:
+        return connection.execute(_DELETE, (movie_id,)).rowcount > 0
+
+    @staticmethod
+    def _update_values(params: dict) -> dict:
+        """
+        Columns set by update params, in a fixed order
+        """
+        if "id" in params:
+            raise RepositoryException("Can't update Movie ID")
+        if "version" in params:
+            raise RepositoryException("Can't update Movie version")
+        return {field: params[field] for field in MOVIE_FIELDS if field in params}
+
+    @classmethod
+    def _assignments(cls, params: dict) -> typing.Tuple[str, typing.List]:
+        """
+        SET clause of an update, incrementing the version
+        """
+        values = cls._update_values(params)
+        if "title" in values:
+            values["title_normalized"] = normalize_title(values["title"])
+        assignments = "".join(f"{column} = ?, " for column in values)
+        return f"{assignments}version = version + 1", list(values.values())
+
+    @classmethod
+    def _update_movie(
+        cls,
+        connection: sqlite3.Connection,
+        movie_id: str,
+        params: dict,
+        expected_version: typing.Optional[int] = None,
+    ):
+        assignments, arguments = cls._assignments(params)
+        sql = f"UPDATE movies SET {assignments} WHERE id = ?"
+        arguments.append(movie_id)
+        if expected_version is not None:
+            sql += " AND version = ?"
+            arguments.append(expected_version)
+        if connection.execute(sql, arguments).rowcount:
+            return
+        row = connection.execute(_VERSION, (movie_id,)).fetchone()
+        if row is None:
+            raise RepositoryException(f"Movie: {movie_id} not found")
+        raise VersionConflictException(f"Movie: {movie_id} is at version {row[0]}")
+
+    async def delete(self, movie_id: str) -> bool:
+        def delete(connection: sqlite3.Connection) -> bool:
+            with connection:
+                return self._delete_movie(connection, movie_id)
+
+        return await self._write(delete)
+
+    async def update(
+        self,
+        movie_id: str,
+        params: dict,
+        expected_version: typing.Optional[int] = None,
+    ):
+        def update(connection: sqlite3.Connection):
+            with connection:
+                self._update_movie(connection, movie_id, params, expected_version)
+
+        await self._write(update)
+
+    async def update_many(
+        self, movie_filter: MovieFilter, params: dict
+    ) -> UpdateManyResult:
+        values = self._update_values(params)
+        conditions, arguments = self._filter_conditions(movie_filter)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        assignments, values_arguments = self._assignments(params)
+        # Movies which would not change keep their version
+        changed = " OR ".join(f"{column} IS NOT ?" for column in values)
+
+        def update_many(connection: sqlite3.Connection) -> UpdateManyResult:
+            with connection:
+                matched = connection.execute(
+                    f"SELECT count(*) FROM movies{where}", arguments
+                ).fetchone()[0]
+                if not values:
+                    return UpdateManyResult(matched=matched, modified=0)
+                modified = connection.execute(
+                    f"UPDATE movies SET {assignments}"
+                    f"{where or ' WHERE 1'} AND ({changed})",
+                    [*values_arguments, *arguments, *values.values()],
+                ).rowcount
+            return UpdateManyResult(matched=matched, modified=modified)
+
+        return await self._write(update_many)
+
+    async def _bulk_write(
+        self,
+        operations: typing.List[typing.Callable[[sqlite3.Connection], typing.Any]],
+        ordered: bool,
+    ) -> BulkResult:
+        """
+        Applies operations in a single transaction, collecting failures.
+        A failed statement only undoes itself, not the transaction
+        """
+
+        def apply(connection: sqlite3.Connection) -> BulkResult:
+            results: BulkResult = []
+            failed = False
+            with connection:
+                for operation in operations:
+                    if ordered and failed:
+                        results.append(NOT_EXECUTED)
+                        continue
+                    try:
+                        operation(connection)
+                        results.append(None)
+                    except (RepositoryException, sqlite3.Error) as e:
+                        results.append(str(e))
+                        failed = True
+            return results
+
+        return await self._write(apply)
+
+    async def bulk_create(
+        self, movies: typing.List[Movie], ordered: bool = False
+    ) -> BulkResult:
+        return await self._bulk_write(
+            [
+                lambda connection, row=self._to_row(movie): connection.execute(
+                    _UPSERT, row
+                )
+                for movie in movies
+            ],
+            ordered,
+        )
+
+    async def bulk_update(
+        self, updates: typing.List[typing.Tuple[str, dict]], ordered: bool = False
+    ) -> BulkResult:
+        return await self._bulk_write(
+            [
+                lambda connection, movie_id=movie_id, params=params: (
+                    self._update_movie(connection, movie_id, params)
+                )
+                for movie_id, params in updates
+            ],
+            ordered,
+        )
+
+    async def bulk_delete(
+        self, movie_ids: typing.List[str], ordered: bool = False
+    ) -> BulkResult:
+        return await self._bulk_write(
+            [
+                lambda connection, movie_id=movie_id: self._delete_movie(
+                    connection, movie_id
+                )
+                for movie_id in movie_ids
+            ],
+            ordered,
+        )
@@ -0,0 +1,185 @@
+import asyncio
+import json
+import os
+import struct
+import typing
+import zlib
+
+# payload length, CRC32 of the payload, LSN
+_FRAME = struct.Struct("<IIQ")
+_SEGMENT_PREFIX = "wal-"
+_SEGMENT_SUFFIX = ".log"
+
+
+def _segment_name(first_lsn: int) -> str:
+    return f"{_SEGMENT_PREFIX}{first_lsn:020d}{_SEGMENT_SUFFIX}"
+
+
+class WriteAheadLog:
+    """
+    Append only log of JSON records split into segment files.
+
+    Records are written as soon as they are appended. sync waits until they
+    are fsync'd, which happens at most every fsync_interval seconds for all
+    records appended in the meantime (group commit)
+    """
+
+    def __init__(self, directory: str, fsync_interval: float = 0.005):
+        self._directory = directory
+        self._fsync_interval = fsync_interval
+        self._file: typing.Optional[typing.BinaryIO] = None
+        self._lsn = 0
+        self._synced_lsn = 0
+        self._pending: typing.Optional[asyncio.Future] = None
+        # Running flushes, referenced so that they are not garbage collected
+        self._flushes: typing.Set[asyncio.Future] = set()
+        # fsync of the segment before the last rotation, while in progress
+        self._rotation: typing.Optional[asyncio.Future] = None
+
+    @property
+    def lsn(self) -> int:
+        """
+        Sequence number of the last appended record
+        """
+        return self._lsn
+
+    def _segments(self) -> typing.List[typing.Tuple[int, str]]:
+        segments = []
+        for name in os.listdir(self._directory):
+            if name.startswith(_SEGMENT_PREFIX) and name.endswith(_SEGMENT_SUFFIX):
+                first_lsn = int(name[len(_SEGMENT_PREFIX) : -len(_SEGMENT_SUFFIX)])
+                segments.append((first_lsn, os.path.join(self._directory, name)))
+        return sorted(segments)
+
+    def _open_segment(self, first_lsn: int):
+        path = os.path.join(self._directory, _segment_name(first_lsn))
+        self._file = open(path, "ab")
+
+    def open(self, after_lsn: int = 0) -> typing.List[typing.Tuple[int, dict]]:
+        """
+        Returns the records after after_lsn and opens the log for appending.
+
+        A torn or corrupt record, left by a crash during a write, ends the log
+        and is truncated away
+        """
+        os.makedirs(self._directory, exist_ok=True)
+        self._lsn = after_lsn
+        records = []
+        segments = self._segments()
+        for position, (_, path) in enumerate(segments):
+            with open(path, "rb") as f:
+                data = f.read()
+            offset = 0
+            while offset + _FRAME.size <= len(data):
+                length, checksum, lsn = _FRAME.unpack_from(data, offset)
+                start = offset + _FRAME.size
+                payload = data[start : start + length]
+                if len(payload) < length or zlib.crc32(payload) != checksum:
+                    break
+                offset = start + length
+                if lsn > after_lsn:
+                    self._lsn = lsn
+                    records.append((lsn, json.loads(payload)))
+            if offset < len(data):
+                with open(path, "r+b") as f:
+                    f.truncate(offset)
+                for _, later_path in segments[position + 1 :]:
+                    os.remove(later_path)
+                break
+        self._synced_lsn = self._lsn
+        segments = self._segments()
+        self._open_segment(segments[-1][0] if segments else self._lsn + 1)
+        return records
+
+    def append(self, record: dict) -> int:
+        """
+        Writes a record and returns its LSN. It is durable once sync returns
+        """
+        payload = json.dumps(record, separators=(",", ":")).encode("utf-8")
+        self._lsn += 1
+        self._file.write(_FRAME.pack(len(payload), zlib.crc32(payload), self._lsn))
+        self._file.write(payload)
+        return self._lsn
+
+    async def sync(self):
+        """
+        Waits until every record appended so far is fsync'd
+        """
+        if self._synced_lsn >= self._lsn:
+            return
+        if self._pending is None:
+            loop = asyncio.get_running_loop()
+            self._pending = loop.create_future()
+            loop.call_later(self._fsync_interval, self._flush_in_background)
+        await asyncio.shield(self._pending)
+
+    def _flush_in_background(self):
+        flush = asyncio.ensure_future(self._flush())
+        self._flushes.add(flush)
+        flush.add_done_callback(self._flushes.discard)
+
+    async def _flush(self):
+        future, self._pending = self._pending, None
+        if future is None or self._file is None:
+            return
+        lsn = self._lsn
+        try:
+            self._file.flush()
+            # A duplicate stays valid if the segment is rotated meanwhile
+            fd = os.dup(self._file.fileno())
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, os.fsync, fd)
+            finally:
+                os.close(fd)
+            if self._rotation is not None:
+                # Earlier records may still be in the previous segment
+                await asyncio.shield(self._rotation)
+        except Exception as e:
+            future.set_exception(e)
+            return
+        self._synced_lsn = max(self._synced_lsn, lsn)
+        future.set_result(None)
+
+    async def rotate(self) -> int:
+        """
+        Starts a new segment and waits until every record before it is
+        durable. Returns the LSN of the last record in the previous segments.
+
+        The new segment is started before rotate first yields, records
+        appended meanwhile go to it
+        """
+        self._file.flush()
+        previous, lsn = self._file, self._lsn
+        self._open_segment(lsn + 1)
+        rotation = self._rotation = asyncio.get_running_loop().run_in_executor(
+            None, os.fsync, previous.fileno()
+        )
+        rotation.add_done_callback(lambda _: previous.close())
+        try:
+            await asyncio.shield(rotation)
+        finally:
+            if self._rotation is rotation:
+                self._rotation = None
+        self._synced_lsn = max(self._synced_lsn, lsn)
+        return lsn
+
+    def remove_through(self, lsn: int):
+        """
+        Deletes the segments holding only records up to lsn
+        """
+        segments = self._segments()
+        for (_, path), (next_first_lsn, _) in zip(segments, segments[1:]):
+            if next_first_lsn <= lsn + 1:
+                os.remove(path)
+
+    async def close(self):
+        if self._file is None:
+            return
+        if self._pending is not None:
+            await self._flush()
+        # Failures were already set on the futures their callers wait on
+        await asyncio.gather(*self._flushes, return_exceptions=True)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
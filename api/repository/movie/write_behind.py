@@ -0,0 +1,492 @@
+import asyncio
+import dataclasses
+import typing
+from logging import getLogger
+
+from prometheus_client import Counter
+
+from api.entities.movie import Movie
+from api.repository.movie.abstractions import (MOVIE_FIELDS, BulkResult,
+                                               DelegatingMovieRepository,
+                                               Fields, Keyset, MovieFilter,
+                                               MovieRepository, MovieSort,
+                                               RepositoryException, TitleMatch,
+                                               UpdateManyResult, project_movie)
+from api.repository.movie.cache import LruTtlCache
+
+WRITE_BEHIND_FAILURES = Counter(
+    "movie_repository_write_behind_failures_total",
+    "Buffered movie writes which failed after the caller returned. write counts "
+    "movies the wrapped repository rejected, which are dropped, flush counts "
+    "flushes which failed and are retried",
+    ["kind"],
+)
+
+
+@dataclasses.dataclass
+class _PendingWrite:
+    """
+    Buffered mutations of a single movie
+    """
+
+    # Whole movie of a buffered create, None if only updates are buffered
+    movie: typing.Optional[Movie] = None
+    # Merged params of buffered updates, last write wins
+    params: dict = dataclasses.field(default_factory=dict)
+    # Set once the buffered state was read, so that it gets its own version
+    observed: bool = False
+
+
+def _patched(movie: Movie, params: dict, version: int) -> Movie:
+    return Movie(
+        movie_id=movie.id,
+        version=version,
+        **{field: params.get(field, getattr(movie, field)) for field in MOVIE_FIELDS},
+    )
+
+
+def _buffered_movie(
+    pending: _PendingWrite, stored: typing.Optional[Movie]
+) -> typing.Optional[Movie]:
+    """
+    Movie once pending is written over the stored one
+    """
+    if pending.movie is not None:
+        return pending.movie
+    if stored is None:
+        return None
+    return _patched(stored, pending.params, stored.version + 1)
+
+
+class WriteBehindMovieRepository(DelegatingMovieRepository):
+    """
+    Buffers creates and updates in front of another repository.
+
+    Mutations are kept per movie ID for up to window seconds, successive
+    updates merged last write wins, then written with one bulk_create and one
+    bulk_update call. Lookups by ID are answered from the buffer, queries
+    flush it first. Updates read the stored movie to check it exists only
+    when it is neither buffered nor known to exist, IDs seen in writes and
+    reads are known for up to known_ttl seconds.
+
+    Once max_pending movies are buffered, writers wait for a flush. Deletes,
+    bulk operations and updates with an expected version write through.
+    Failures of buffered writes are logged and counted in
+    WRITE_BEHIND_FAILURES, the caller has already returned.
+    Only valid if all writes go through this process
+    """
+
+    def __init__(
+        self,
+        repository: MovieRepository,
+        window: float = 0.05,
+        max_pending: int = 10000,
+        known_size: int = 100000,
+        known_ttl: float = 60.0,
+    ):
+        super().__init__(repository)
+        self._window = window
+        self._max_pending = max_pending
+        # movie_id -> True, for movies known to exist
+        self._known = LruTtlCache(known_size)
+        self._known_ttl = known_ttl
+        self._pending: typing.Dict[str, _PendingWrite] = {}
+        # movie_id -> future done once its write finished
+        self._in_flight: typing.Dict[str, asyncio.Future] = {}
+        self._timer: typing.Optional[asyncio.TimerHandle] = None
+        self._flushes: typing.Set[asyncio.Future] = set()
+
+    async def close(self):
+        await self.flush()
+        await super().close()
+
+    async def flush(self):
+        """
+        Writes every buffered mutation to the wrapped repository
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending = self._pending, {}
+        if pending:
+            await self._write(pending)
+        in_flight = set(self._in_flight.values())
+        if in_flight:
+            await asyncio.shield(asyncio.gather(*in_flight))
+
+    def _schedule_flush(self):
+        if self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(
+                self._window, self._flush_in_background
+            )
+
+    def _flush_in_background(self):
+        self._timer = None
+        flush = asyncio.ensure_future(self.flush())
+        self._flushes.add(flush)
+        flush.add_done_callback(self._flush_done)
+
+    def _flush_done(self, flush: asyncio.Future):
+        self._flushes.discard(flush)
+        if not flush.cancelled() and flush.exception() is not None:
+            # The mutations are buffered again and retried with the next flush
+            getLogger("api.WriteBehindMovieRepository").error(
+                "flush failed", exc_info=flush.exception()
+            )
+
+    async def _write(self, pending: typing.Dict[str, _PendingWrite]):
+        written = asyncio.get_running_loop().create_future()
+        for movie_id in pending:
+            self._in_flight[movie_id] = written
+        # Runs in its own task, so that cancelling the caller can't drop it
+        write = asyncio.ensure_future(self._write_batch(pending, written))
+        try:
+            await asyncio.shield(write)
+        except asyncio.CancelledError:
+            # Failures are then logged and retried like in the background
+            self._flushes.add(write)
+            write.add_done_callback(self._flush_done)
+            raise
+
+    async def _write_batch(
+        self, pending: typing.Dict[str, _PendingWrite], written: asyncio.Future
+    ):
+        creates = [write.movie for write in pending.values() if write.movie is not None]
+        updates = [
+            (movie_id, write.params)
+            for movie_id, write in pending.items()
+            if write.movie is None and write.params
+        ]
+        # (movie_id, error) of every write which reached the wrapped repository
+        errors: typing.List[typing.Tuple[str, typing.Optional[str]]] = []
+        try:
+            if creates:
+                results = await self._repository.bulk_create(creates)
+                errors += zip((movie.id for movie in creates), results)
+            if updates:
+                results = await self._repository.bulk_update(updates)
+                errors += zip((movie_id for movie_id, _ in updates), results)
+        except BaseException as e:
+            if isinstance(e, Exception):
+                WRITE_BEHIND_FAILURES.labels(kind="flush").inc()
+            # The creates may have been written before the updates failed
+            done = {movie_id for movie_id, _ in errors}
+            self._restore(
+                {
+                    movie_id: write
+                    for movie_id, write in pending.items()
+                    if movie_id not in done
+                }
+            )
+            raise
+        finally:
+            for movie_id in pending:
+                if self._in_flight.get(movie_id) is written:
+                    del self._in_flight[movie_id]
+            written.set_result(None)
+            self._report(errors)
+
+    def _report(self, errors: typing.List[typing.Tuple[str, typing.Optional[str]]]):
+        for movie_id, error in errors:
+            if error is None:
+                self._remember([movie_id])
+            else:
+                self._known.pop(movie_id)
+                WRITE_BEHIND_FAILURES.labels(kind="write").inc()
+                getLogger("api.WriteBehindMovieRepository").error(
+                    "write of movie %s failed: %s", movie_id, error
+                )
+
+    def _remember(self, movie_ids: typing.Iterable[str]):
+        for movie_id in movie_ids:
+            self._known.set(movie_id, True, self._known_ttl)
+
+    def _restore(self, pending: typing.Dict[str, _PendingWrite]):
+        """
+        Buffers mutations which could not be written again, under the ones
+        buffered since
+        """
+        for movie_id, write in pending.items():
+            newer = self._pending.get(movie_id)
+            if newer is None:
+                self._pending[movie_id] = write
+            elif newer.movie is None:
+                if write.movie is not None:
+                    newer.movie = _patched(
+                        write.movie, newer.params, write.movie.version
+                    )
+                    newer.params = {}
+                else:
+                    newer.params = {**write.params, **newer.params}
+        if self._pending:
+            self._schedule_flush()
+
+    async def _wait_written(self, movie_ids: typing.Iterable[str]):
+        """
+        Waits for the writes of the given movies in progress, if any
+        """
+        in_flight = {
+            self._in_flight[movie_id]
+            for movie_id in movie_ids
+            if movie_id in self._in_flight
+        }
+        if in_flight:
+            await asyncio.shield(asyncio.gather(*in_flight))
+
+    async def _flush_movies(self, movie_ids: typing.Iterable[str]):
+        """
+        Writes the buffered mutations of the given movies right away
+        """
+        movie_ids = list(movie_ids)
+        await self._wait_written(movie_ids)
+        pending = {
+            movie_id: self._pending.pop(movie_id)
+            for movie_id in movie_ids
+            if movie_id in self._pending
+        }
+        if pending:
+            await self._write(pending)
+
+    async def _pending_write(self, movie_id: str) -> _PendingWrite:
+        """
+        Buffered mutations of a movie about to be written, making room first.
+        Nothing is awaited after it returns, so the caller can update it safely
+        """
+        while True:
+            pending = self._pending.get(movie_id)
+            if pending is not None and pending.observed:
+                # The state which was read keeps the version it was read with
+                await self._flush_movies([movie_id])
+            elif pending is not None:
+                return pending
+            elif len(self._pending) < self._max_pending:
+                break
+            else:
+                await self.flush()
+        pending = self._pending[movie_id] = _PendingWrite()
+        self._schedule_flush()
+        return pending
+
+    async def create(self, movie: Movie):
+        pending = await self._pending_write(movie.id)
+        pending.movie = movie
+        pending.params = {}
+
+    async def update(
+        self,
+        movie_id: str,
+        params: dict,
+        expected_version: typing.Optional[int] = None,
+    ):
+        if "id" in params:
+            raise RepositoryException("Can't update Movie ID")
+        if "version" in params:
+            raise RepositoryException("Can't update Movie version")
+        if expected_version is not None:
+            # The stored version has to be checked, so the update is not buffered
+            await self._flush_movies([movie_id])
+            return await self._repository.update(
+                movie_id, params, expected_version=expected_version
+            )
+        known = (
+            movie_id in self._pending
+            or movie_id in self._in_flight
+            or self._known.get(movie_id, False)
+        )
+        if not known:
+            if await self._repository.get_by_id(movie_id, fields=()) is None:
+                raise RepositoryException(f"Movie: {movie_id} not found")
+            self._remember([movie_id])
+        pending = await self._pending_write(movie_id)
+        params = {field: params[field] for field in MOVIE_FIELDS if field in params}
+        if pending.movie is not None:
+            pending.movie = _patched(pending.movie, params, pending.movie.version)
+        else:
+            pending.params.update(params)
+
+    async def delete(self, movie_id: str) -> bool:
+        await self._wait_written([movie_id])
+        pending = self._pending.pop(movie_id, None)
+        self._known.pop(movie_id)
+        deleted = await self._repository.delete(movie_id)
+        return deleted or (pending is not None and pending.movie is not None)
+
+    async def get_by_id(
+        self, movie_id: str, fields: Fields = None
+    ) -> typing.Optional[Movie]:
+        while True:
+            await self._wait_written([movie_id])
+            pending = self._pending.get(movie_id)
+            if pending is None:
+                movie = await self._repository.get_by_id(movie_id, fields=fields)
+                if movie is not None:
+                    self._remember([movie_id])
+                return movie
+            stored = None
+            if pending.movie is None:
+                stored = await self._repository.get_by_id(movie_id)
+                if self._pending.get(movie_id) is not pending:
+                    # Written meanwhile, stored may or may not include it
+                    continue
+            pending.observed = True
+            movie = _buffered_movie(pending, stored)
+            return None if movie is None else project_movie(movie, fields)
+
+    async def get_many(self, movie_ids: typing.List[str]) -> typing.Dict[str, Movie]:
+        while True:
+            await self._wait_written(movie_ids)
+            pending = {
+                movie_id: self._pending[movie_id]
+                for movie_id in movie_ids
+                if movie_id in self._pending
+            }
+            stored = await self._repository.get_many(
+                [
+                    movie_id
+                    for movie_id in movie_ids
+                    if movie_id not in pending or pending[movie_id].movie is None
+                ]
+            )
+            if all(
+                self._pending.get(movie_id) is write
+                for movie_id, write in pending.items()
+            ):
+                break
+        self._remember(stored)
+        for movie_id, write in pending.items():
+            write.observed = True
+            movie = _buffered_movie(write, stored.get(movie_id))
+            if movie is None:
+                stored.pop(movie_id, None)
+            else:
+                stored[movie_id] = movie
+        return stored
+
+    # Queries see every buffered mutation by flushing first
+
+    async def search(self, query: str, limit: int = 20) -> typing.List[Movie]:
+        await self.flush()
+        return await super().search(query, limit=limit)
+
+    async def autocomplete(self, prefix: str, limit: int = 10) -> typing.List[str]:
+        await self.flush()
+        return await super().autocomplete(prefix, limit=limit)
+
+    async def get_by_title(
+        self,
+        title: str,
+        skip: int = 0,
+        limit: int = 1000,
+        after: typing.Optional[str] = None,
+        fields: Fields = None,
+        match: TitleMatch = TitleMatch.EXACT,
+    ) -> typing.List[Movie]:
+        await self.flush()
+        return await super().get_by_title(
+            title=title,
+            skip=skip,
+            limit=limit,
+            after=after,
+            fields=fields,
+            match=match,
+        )
+
+    async def find(
+        self,
+        movie_filter: MovieFilter,
+        sort: MovieSort = MovieSort.RELEASE_YEAR_ASC,
+        skip: int = 0,
+        limit: int = 1000,
+        after: typing.Optional[Keyset] = None,
+        fields: Fields = None,
+    ) -> typing.List[Movie]:
+        await self.flush()
+        return await super().find(
+            movie_filter=movie_filter,
+            sort=sort,
+            skip=skip,
+            limit=limit,
+            after=after,
+            fields=fields,
+        )
+
+    async def iter_by_title(
+        self,
+        title: str,
+        skip: int = 0,
+        limit: int = 0,
+        after: typing.Optional[str] = None,
+        batch_size: int = 1000,
+        fields: Fields = None,
+        match: TitleMatch = TitleMatch.EXACT,
+    ) -> typing.AsyncIterator[Movie]:
+        await self.flush()
+        async for movie in super().iter_by_title(
+            title=title,
+            skip=skip,
+            limit=limit,
+            after=after,
+            batch_size=batch_size,
+            fields=fields,
+            match=match,
+        ):
+            yield movie
+
+    async def iter_find(
+        self,
+        movie_filter: MovieFilter,
+        sort: MovieSort = MovieSort.RELEASE_YEAR_ASC,
+        skip: int = 0,
+        limit: int = 0,
+        after: typing.Optional[Keyset] = None,
+        batch_size: int = 1000,
+        fields: Fields = None,
+    ) -> typing.AsyncIterator[Movie]:
+        await self.flush()
+        async for movie in super().iter_find(
+            movie_filter=movie_filter,
+            sort=sort,
+            skip=skip,
+            limit=limit,
+            after=after,
+            batch_size=batch_size,
+            fields=fields,
+        ):
+            yield movie
+
+    async def iter_ids(self, batch_size: int = 1000) -> typing.AsyncIterator[str]:
+        await self.flush()
+        async for movie_id in super().iter_ids(batch_size=batch_size):
+            yield movie_id
+
+    # Bulk operations are batched already, so they write through
+
+    async def update_many(
+        self, movie_filter: MovieFilter, params: dict
+    ) -> UpdateManyResult:
+        await self.flush()
+        return await super().update_many(movie_filter, params)
+
+    async def bulk_create(
+        self, movies: typing.List[Movie], ordered: bool = False
+    ) -> BulkResult:
+        await self._flush_movies(movie.id for movie in movies)
+        results = await super().bulk_create(movies, ordered=ordered)
+        self._remember(
+            movie.id for movie, error in zip(movies, results) if error is None
+        )
+        return results
+
+    async def bulk_update(
+        self, updates: typing.List[typing.Tuple[str, dict]], ordered: bool = False
+    ) -> BulkResult:
+        await self._flush_movies(movie_id for movie_id, _ in updates)
+        return await super().bulk_update(updates, ordered=ordered)
+
+    async def bulk_delete(
+        self, movie_ids: typing.List[str], ordered: bool = False
+    ) -> BulkResult:
+        await self._flush_movies(movie_ids)
+        for movie_id in movie_ids:
+            self._known.pop(movie_id)
+        return await super().bulk_delete(movie_ids, ordered=ordered)
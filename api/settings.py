@@ -1,3 +1,4 @@
+import typing
 from functools import lru_cache
 
 from pydantic import BaseSettings, Field
@@ -11,6 +12,103 @@ class Settings(BaseSettings):
         description="Enable prometheus metrics if set to true. Default: True",
         env="ENABLE_METRICS",
     )
+    enable_response_cache: bool = Field(
+        False,
+        title="Enable Response Cache",
+        description="Cache serialized GET responses of the movies API. "
+        "Default: False",
+        env="ENABLE_RESPONSE_CACHE",
+    )
+    response_cache_max_size: int = Field(
+        10000,
+        title="Response Cache Max Size",
+        description="Maximum number of cached responses",
+        env="RESPONSE_CACHE_MAX_SIZE",
+    )
+    response_cache_ttl_seconds: float = Field(
+        60.0,
+        title="Response Cache TTL",
+        description="Seconds a cached response stays valid",
+        env="RESPONSE_CACHE_TTL_SECONDS",
+    )
+    movie_id_generator: typing.Literal["uuid4", "uuid7"] = Field(
+        "uuid4",
+        title="Movie ID Generator",
+        description="Generator of new movie IDs. uuid7 IDs are time ordered, which "
+        "keeps inserts local in the id index and makes sorting by id list movies "
+        "in creation order. Default: uuid4",
+        env="MOVIE_ID_GENERATOR",
+    )
+    repository_backend: typing.Literal["mongo", "memory", "shared", "sqlite"] = Field(
+        "mongo",
+        title="Repository Backend",
+        description="Where movies are stored. shared keeps a single memory backend "
+        "for all worker processes of a host, sqlite a local database file. "
+        "Default: mongo",
+        env="REPOSITORY_BACKEND",
+    )
+    memory_storage: typing.Literal["dict", "columnar"] = Field(
+        "dict",
+        title="Memory Storage",
+        description="How the memory backend holds movies. columnar packs fields "
+        "into arrays and deduplicates titles at the cost of building a Movie on "
+        "every read. The indexes stay the same, so a loaded repository shrinks "
+        "by about 5%, see benchmarks/memory.py. Default: dict",
+        env="MEMORY_STORAGE",
+    )
+    memory_data_directory: typing.Optional[str] = Field(
+        None,
+        title="Memory Data Directory",
+        description="Directory for the write ahead log and snapshots of the memory "
+        "backend. Movies are lost on restart if not set",
+        env="MEMORY_DATA_DIRECTORY",
+    )
+    memory_fsync_interval_seconds: float = Field(
+        0.005,
+        title="Memory Fsync Interval",
+        description="Seconds writes wait to share an fsync of the write ahead log",
+        env="MEMORY_FSYNC_INTERVAL_SECONDS",
+    )
+    memory_snapshot_every: int = Field(
+        100_000,
+        title="Memory Snapshot Every",
+        description="Number of logged writes after which a new snapshot is taken",
+        env="MEMORY_SNAPSHOT_EVERY",
+    )
+    shared_memory_directory: str = Field(
+        "/dev/shm/movie-tracker",
+        title="Shared Memory Directory",
+        description="Directory of the segment and delta log the shared backend "
+        "publishes to its readers. Should be on a tmpfs",
+        env="SHARED_MEMORY_DIRECTORY",
+    )
+    shared_memory_publish_interval_seconds: float = Field(
+        0.01,
+        title="Shared Memory Publish Interval",
+        description="Seconds writes wait to share their publication",
+        env="SHARED_MEMORY_PUBLISH_INTERVAL_SECONDS",
+    )
+    # SQLite Settings
+    sqlite_path: str = Field(
+        "movies.db",
+        title="SQLite Path",
+        description="Database file of the sqlite backend",
+        env="SQLITE_PATH",
+    )
+    sqlite_pool_size: int = Field(
+        4,
+        title="SQLite Pool Size",
+        description="Number of threads, each with its own connection, running "
+        "queries of the sqlite backend. Writes have a thread of their own",
+        env="SQLITE_POOL_SIZE",
+    )
+    sqlite_full_text_search: bool = Field(
+        True,
+        title="SQLite Full Text Search",
+        description="Keep an FTS5 index of titles and descriptions for search. "
+        "Search scans the table otherwise. Default: True",
+        env="SQLITE_FULL_TEXT_SEARCH",
+    )
     # MongoDB Settings
     mongo_connection_string: str = Field(
         "mongodb://localhost:27017",
@@ -25,6 +123,117 @@ class Settings(BaseSettings):
         env="MONGODB_DATABASE_NAME",
     )
 
+    # Repository Settings
+    enable_request_coalescing: bool = Field(
+        False,
+        title="Enable Request Coalescing",
+        description="Batch concurrent lookups by ID and share identical in-flight "
+        "title queries. Default: False",
+        env="ENABLE_REQUEST_COALESCING",
+    )
+    coalescing_max_batch_size: int = Field(
+        1000,
+        title="Coalescing Max Batch Size",
+        description="Maximum number of IDs loaded by a single coalesced query",
+        env="COALESCING_MAX_BATCH_SIZE",
+    )
+
+    enable_write_behind: bool = Field(
+        False,
+        title="Enable Write Behind",
+        description="Buffer creates and updates per movie and write them in bulk, "
+        "merging successive updates. Only valid if all writes go through this "
+        "process. Writes are acknowledged once buffered, so a write the database "
+        "rejects later is only logged and counted in the "
+        "movie_repository_write_behind_failures_total metric, the client is not "
+        "told. Default: False",
+        env="ENABLE_WRITE_BEHIND",
+    )
+    write_behind_window_seconds: float = Field(
+        0.05,
+        title="Write Behind Window",
+        description="Seconds a buffered write waits to be merged with later ones",
+        env="WRITE_BEHIND_WINDOW_SECONDS",
+    )
+    write_behind_max_pending: int = Field(
+        10000,
+        title="Write Behind Max Pending",
+        description="Number of buffered movies after which writers wait for a flush",
+        env="WRITE_BEHIND_MAX_PENDING",
+    )
+
+    enable_bloom_filter: bool = Field(
+        False,
+        title="Enable Bloom Filter",
+        description="Answer lookups of unknown movie IDs from an in process bloom "
+        "filter built on startup. Only valid if all writes go through this "
+        "process. Default: False",
+        env="ENABLE_BLOOM_FILTER",
+    )
+    bloom_filter_capacity: int = Field(
+        1_000_000,
+        title="Bloom Filter Capacity",
+        description="Number of movie IDs the bloom filter is sized for",
+        env="BLOOM_FILTER_CAPACITY",
+    )
+    bloom_filter_error_rate: float = Field(
+        0.01,
+        title="Bloom Filter Error Rate",
+        description="False positive rate of the bloom filter at full capacity",
+        env="BLOOM_FILTER_ERROR_RATE",
+    )
+
+    enable_cache: bool = Field(
+        False,
+        title="Enable Cache",
+        description="Cache movie lookups in process. Default: False",
+        env="ENABLE_CACHE",
+    )
+    cache_max_size: int = Field(
+        10000,
+        title="Cache Max Size",
+        description="Maximum number of cached movies and title queries",
+        env="CACHE_MAX_SIZE",
+    )
+    cache_ttl_seconds: float = Field(
+        60.0,
+        title="Cache TTL",
+        description="Seconds a cached movie or title query stays valid",
+        env="CACHE_TTL_SECONDS",
+    )
+    cache_negative_ttl_seconds: float = Field(
+        5.0,
+        title="Cache Negative TTL",
+        description="Seconds a movie ID known to be missing stays cached",
+        env="CACHE_NEGATIVE_TTL_SECONDS",
+    )
+    cache_warm_up_size: int = Field(
+        0,
+        title="Cache Warm Up Size",
+        description="Number of hottest movie IDs saved on shutdown and loaded into "
+        "the cache on startup. Default: 0 (disabled)",
+        env="CACHE_WARM_UP_SIZE",
+    )
+    cache_warm_up_file: str = Field(
+        "movie_cache_warm_up.txt",
+        title="Cache Warm Up File",
+        description="File holding the hottest movie IDs, one per line",
+        env="CACHE_WARM_UP_FILE",
+    )
+    mongo_ensure_indexes: bool = Field(
+        True,
+        title="MongoDB Ensure Indexes",
+        description="Create the required indexes on startup. Default: True",
+        env="MONGODB_ENSURE_INDEXES",
+    )
+    mongo_verify_query_plans: bool = Field(
+        False,
+        title="MongoDB Verify Query Plans",
+        description="Fail startup if any query is not backed by an index. "
+        "Default: False",
+        env="MONGODB_VERIFY_QUERY_PLANS",
+    )
+
     def __hash__(self) -> int:
         return 1
 
@@ -0,0 +1,43 @@
+"""
+Latency of in memory title autocomplete.
+
+Run with: python -m benchmarks.autocomplete
+"""
+import asyncio
+import random
+import time
+
+from api.entities.movie import Movie
+from api.repository.movie.memory import MemoryMovieRepository
+
+WORDS = ["the", "last", "night", "return", "star", "city", "dark", "love", "élan"]
+
+
+async def main():
+    random.seed(0)
+    repo = MemoryMovieRepository()
+    for index in range(100_000):
+        title = " ".join(random.choices(WORDS, k=3)) + f" {index % 1000}"
+        await repo.create(
+            Movie(
+                movie_id=f"{index:08d}",
+                title=title.title(),
+                description="A description",
+                release_year=1990 + index % 30,
+            )
+        )
+    prefixes = [word[:length] for word in WORDS for length in range(1, len(word) + 1)]
+    timings = []
+    for _ in range(20):
+        for prefix in prefixes:
+            start = time.perf_counter()
+            await repo.autocomplete(prefix, limit=10)
+            timings.append(time.perf_counter() - start)
+    timings.sort()
+    p50 = timings[len(timings) // 2] * 1e6
+    p99 = timings[int(len(timings) * 0.99)] * 1e6
+    print(f"autocomplete over 100000 movies: p50 {p50:.1f} us, p99 {p99:.1f} us")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,75 @@
+"""
+Bytes per movie held by a loaded MemoryMovieRepository, with the dict of
+Movie objects storage compared with ColumnarMovieStore. Both include every
+index, and the share of each container is printed too. IDs are counted with
+the last container dropped, the id index.
+
+Run with: python -m benchmarks.memory
+"""
+import gc
+import tracemalloc
+import uuid
+
+from api.entities.movie import Movie
+from api.repository.movie.columnar import ColumnarMovieStore
+from api.repository.movie.memory import MemoryMovieRepository
+
+COUNT = 200_000
+# Containers of the repository, dropped one by one to measure their share
+CONTAINERS = (
+    "_storage",
+    "_title_text_index",
+    "_description_text_index",
+    "_title_index",
+    "_normalized_title_index",
+    "_completions",
+    "_watched_index",
+    "_year_index",
+    "_id_index",
+)
+
+
+def movies():
+    for index in range(COUNT):
+        yield Movie(
+            movie_id=str(uuid.UUID(int=index)),
+            title=f"Movie {index % 20_000}",
+            description=f"A description long enough to look like a real one {index}.",
+            release_year=1990 + index % 30,
+            watched=index % 2 == 0,
+        )
+
+
+def traced() -> int:
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    return size
+
+
+def measure(storage_factory):
+    """
+    Bytes per movie of the whole repository and of each container
+    """
+    tracemalloc.start()
+    repo = MemoryMovieRepository(storage_factory)
+    repo._load(movies())
+    total = traced()
+    shares = {}
+    for name in CONTAINERS:
+        before = traced()
+        setattr(repo, name, None)
+        shares[name] = (before - traced()) / COUNT
+    tracemalloc.stop()
+    return total / COUNT, shares
+
+
+def main():
+    for name, storage_factory in (("dict", dict), ("columnar", ColumnarMovieStore)):
+        total, shares = measure(storage_factory)
+        print(f"{COUNT} movies, {name} storage: {total:.0f} bytes/movie")
+        for container, share in shares.items():
+            print(f"  {container}: {share:.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Per movie cost of serializing list responses.
+
+Compares the response_model path (MovieResponse, validation against
+List[MovieResponse], jsonable_encoder, JSONResponse) with the encoded fast path.
+
+Run with: python -m benchmarks.serialization
+"""
+import timeit
+import typing
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import parse_obj_as
+from starlette.responses import JSONResponse
+
+from api.dto.encoding import encode_movies
+from api.dto.movie import MovieResponse
+from api.entities.movie import Movie
+
+
+def response_model_path(movies: typing.List[Movie]) -> bytes:
+    responses = [
+        MovieResponse(
+            id=movie.id,
+            title=movie.title,
+            description=movie.description,
+            release_year=movie.release_year,
+            watched=movie.watched,
+        )
+        for movie in movies
+    ]
+    validated = parse_obj_as(typing.List[MovieResponse], responses)
+    return JSONResponse(jsonable_encoder(validated)).body
+
+
+def fast_path(movies: typing.List[Movie]) -> bytes:
+    return encode_movies(movies)
+
+
+def main():
+    print(f"{'movies':>8} {'response_model us/movie':>24} {'fast path us/movie':>20}")
+    for count in (1, 100, 1000):
+        movies = [
+            Movie(
+                movie_id=f"{index:08d}-0000-0000-0000-000000000000",
+                title=f"Movie {index}",
+                description="A description long enough to look like a real one.",
+                release_year=1990 + index % 30,
+                watched=index % 2 == 0,
+            )
+            for index in range(count)
+        ]
+        assert response_model_path(movies) == fast_path(movies)
+        number = max(1, 20000 // count)
+        timings = []
+        for function in (response_model_path, fast_path):
+            seconds = min(
+                timeit.repeat(lambda: function(movies), number=number, repeat=5)
+            )
+            timings.append(seconds / number / count * 1e6)
+        print(f"{count:>8} {timings[0]:>24.2f} {timings[1]:>20.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Latency of a write through SharedMemoryMovieRepository, which appends the
+movie to the delta log, compared with a write publishing a new segment of
+the whole catalog, and the cost of a reader query once the log grew.
+
+Run with: python -m benchmarks.shared_publish
+"""
+import asyncio
+import tempfile
+import time
+
+from api.entities.movie import Movie
+from api.repository.movie.abstractions import MovieFilter
+from api.repository.movie.shared import SharedMemoryMovieRepository
+
+COUNT = 200_000
+WRITES = 1000
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as directory:
+        writer = SharedMemoryMovieRepository(directory, publish_interval=0)
+        await writer.initialize()
+        reader = SharedMemoryMovieRepository(directory)
+        await reader.initialize()
+        await writer.bulk_create(
+            [
+                Movie(
+                    movie_id=f"{index:08d}-0000-0000-0000-000000000000",
+                    title=f"Movie {index % 20_000}",
+                    description="A description long enough to look like a real one.",
+                    release_year=1990 + index % 30,
+                )
+                for index in range(COUNT)
+            ]
+        )
+
+        # Waits out the backoff after the segment written by bulk_create
+        loop = asyncio.get_running_loop()
+        await asyncio.sleep(writer._segment_due - loop.time())
+        start = time.perf_counter()
+        # Matches no movie, but the updated movies are unknown so all are written
+        await writer.update_many(MovieFilter(title="none"), {"watched": True})
+        segment_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for index in range(WRITES):
+            await writer.update(
+                f"{index * 97:08d}-0000-0000-0000-000000000000", {"watched": True}
+            )
+        delta_seconds = (time.perf_counter() - start) / WRITES
+
+        start = time.perf_counter()
+        await reader.get_by_id("00000000-0000-0000-0000-000000000000")
+        catch_up_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        movies = await reader.find(MovieFilter(watched=True), limit=100)
+        find_seconds = time.perf_counter() - start
+        assert len(movies) == 100
+
+        await reader.close()
+        await writer.close()
+
+    print(
+        f"{COUNT} movies: write with a new segment {segment_seconds * 1000:.1f} ms, "
+        f"with the delta log {delta_seconds * 1000:.2f} ms"
+    )
+    print(
+        f"reader after {WRITES} writes: first query {catch_up_seconds * 1000:.1f} ms, "
+        f"find {find_seconds * 1000:.1f} ms"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
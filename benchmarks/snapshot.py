@@ -0,0 +1,55 @@
+"""
+Startup cost of loading movies from a binary snapshot compared with
+replaying the same movies as JSON records.
+
+Run with: python -m benchmarks.snapshot
+"""
+import json
+import os
+import tempfile
+import time
+
+from api.entities.movie import Movie
+from api.repository.movie.durable import _movie_record, _record_movie
+from api.repository.movie.snapshot import (encode_snapshot, read_snapshot,
+                                           write_snapshot)
+
+COUNT = 200_000
+
+
+def main():
+    movies = [
+        Movie(
+            movie_id=f"{index:08d}-0000-0000-0000-000000000000",
+            title=f"Movie {index}",
+            description="A description long enough to look like a real one.",
+            release_year=1990 + index % 30,
+            watched=index % 2 == 0,
+        )
+        for index in range(COUNT)
+    ]
+    with tempfile.TemporaryDirectory() as directory:
+        snapshot_path = os.path.join(directory, "movies.snapshot")
+        json_path = os.path.join(directory, "movies.jsonl")
+        write_snapshot(snapshot_path, encode_snapshot(movies, lsn=COUNT))
+        with open(json_path, "w") as f:
+            f.writelines(json.dumps(_movie_record(movie)) + "\n" for movie in movies)
+
+        start = time.perf_counter()
+        _, loaded = read_snapshot(snapshot_path)
+        snapshot_seconds = time.perf_counter() - start
+        assert loaded == movies
+
+        start = time.perf_counter()
+        with open(json_path) as f:
+            loaded = [_record_movie(json.loads(line)) for line in f]
+        json_seconds = time.perf_counter() - start
+        assert loaded == movies
+
+    print(
+        f"{COUNT} movies: snapshot {snapshot_seconds:.3f} s, json {json_seconds:.3f} s"
+    )
+
+
+if __name__ == "__main__":
+    main()
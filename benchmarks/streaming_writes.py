@@ -0,0 +1,65 @@
+"""
+Latency of writes to a MemoryMovieRepository while iter_find streams are
+open. Every stream reads from a frozen view, so the first write after a new
+stream copies the parts of the containers it touches.
+
+Run with: python -m benchmarks.streaming_writes
+"""
+import asyncio
+import statistics
+import time
+import uuid
+
+from api.entities.movie import Movie
+from api.repository.movie.abstractions import MovieFilter
+from api.repository.movie.memory import MemoryMovieRepository
+
+COUNT = 300_000
+WRITES = 200
+
+
+def movies():
+    for index in range(COUNT):
+        yield Movie(
+            movie_id=str(uuid.UUID(int=index)),
+            title=f"Movie {index % 20_000}",
+            description=f"A description long enough to look like a real one {index}.",
+            release_year=1990 + index % 30,
+            watched=index % 2 == 0,
+        )
+
+
+async def measure(streams_per_write: int):
+    """
+    Write latencies in milliseconds, with streams opened before every write
+    """
+    repo = MemoryMovieRepository()
+    repo._load(movies())
+    streams, latencies = [], []
+    for index in range(WRITES):
+        for _ in range(streams_per_write):
+            stream = repo.iter_find(MovieFilter(), batch_size=100).__aiter__()
+            await stream.__anext__()
+            streams.append(stream)
+        movie_id = str(uuid.UUID(int=index * 997 % COUNT))
+        start = time.perf_counter()
+        await repo.update(movie_id, {"title": f"Updated {index}", "watched": True})
+        latencies.append((time.perf_counter() - start) * 1000)
+    for stream in streams:
+        await stream.aclose()
+    return latencies
+
+
+async def main():
+    for streams_per_write in (0, 1, 10):
+        latencies = await measure(streams_per_write)
+        print(
+            f"{COUNT} movies, {streams_per_write} new streams per write: "
+            f"mean {statistics.mean(latencies):.3f} ms, "
+            f"median {statistics.median(latencies):.3f} ms, "
+            f"p99 {statistics.quantiles(latencies, n=100)[-1]:.3f} ms"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())